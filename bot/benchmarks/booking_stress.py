@@ -0,0 +1,98 @@
+# bot/benchmarks/booking_stress.py
+"""
+Стресс-тест записи: сотни одновременных попыток занять один слот.
+
+Победитель должен быть ровно один. Тестовая запись удаляется после прогона.
+Запуск (нужен DATABASE_URL и существующий врач):
+    python -m bot.benchmarks.booking_stress --doctor-id 1 --date 2030-01-07 --time 10:00 --attempts 500
+"""
+import argparse
+import asyncio
+import sys
+import time as timer
+from datetime import date, time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.database.models import User
+from bot.database.session import DATABASE_URL
+from bot.database.utils.booking import book_slot
+from bot.database.utils.delete_slot import hard_delete_appointment
+
+# Служебный пациент для прогона (реальные telegram_id положительные)
+STRESS_TELEGRAM_ID = -1
+
+
+async def run(doctor_id: int, slot_date: date, slot_time: time, attempts: int, connections: int) -> bool:
+    engine = create_async_engine(DATABASE_URL, pool_size=connections, max_overflow=0)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_maker() as session:
+        patient_id = (await session.execute(
+            select(User.id).where(User.telegram_id == STRESS_TELEGRAM_ID)
+        )).scalar()
+        if patient_id is None:
+            patient = User(telegram_id=STRESS_TELEGRAM_ID, first_name="stress")
+            session.add(patient)
+            await session.commit()
+            patient_id = patient.id
+
+    start_gate = asyncio.Event()
+    latencies = []
+
+    async def attempt():
+        async with session_maker() as session:
+            # Соединение берём заранее, чтобы все INSERT стартовали одновременно
+            await session.connection()
+            await start_gate.wait()
+            started = timer.perf_counter()
+            appointment_id = await book_slot(session, patient_id, doctor_id, slot_date, slot_time)
+            latencies.append(timer.perf_counter() - started)
+            return appointment_id
+
+    tasks = [asyncio.create_task(attempt()) for _ in range(attempts)]
+    await asyncio.sleep(0.5)
+    started = timer.perf_counter()
+    start_gate.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = timer.perf_counter() - started
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    winners = [r for r in results if isinstance(r, int)]
+
+    latencies.sort()
+    print(f"Попыток: {attempts}, соединений: {connections}, всего: {elapsed * 1000:.0f} мс")
+    if latencies:
+        print(
+            f"Задержка INSERT: p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} мс"
+        )
+    print(f"Победителей: {len(winners)}, проигравших: {attempts - len(winners) - len(errors)}, ошибок: {len(errors)}")
+    for error in errors[:3]:
+        print(f"  {type(error).__name__}: {error}")
+
+    async with session_maker() as session:
+        for appointment_id in winners:
+            await hard_delete_appointment(session, appointment_id)
+    await engine.dispose()
+
+    return len(winners) == 1 and not errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctor-id", type=int, required=True)
+    parser.add_argument("--date", type=date.fromisoformat, required=True)
+    parser.add_argument("--time", type=time.fromisoformat, required=True)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--connections", type=int, default=90)  # < max_connections Postgres
+    args = parser.parse_args()
+
+    ok = asyncio.run(run(args.doctor_id, args.date, args.time, args.attempts, args.connections))
+    print("✅ OK" if ok else "❌ FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
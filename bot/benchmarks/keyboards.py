@@ -0,0 +1,107 @@
+# bot/benchmarks/keyboards.py
+"""
+Стоимость построения клавиатур на один колбэк: прежняя сборка против кэша.
+
+Запуск (БД не нужна):
+    python -m bot.benchmarks.keyboards --number 2000
+"""
+import argparse
+import calendar
+import timeit
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from bot.keyboards import birthdate, new_record
+from bot.keyboards.back_start import back_start_button
+
+
+# --- Прежние реализации: разметка собирается заново на каждый вызов ---
+
+def legacy_specializations_keyboard(specializations):
+    builder = InlineKeyboardBuilder()
+    for spec in specializations:
+        builder.button(text=spec.name, callback_data=f"spec:{spec.id}")
+    builder.adjust(1)
+    builder.row(back_start_button)
+    return builder.as_markup()
+
+
+def legacy_doctors_keyboard(doctors):
+    builder = InlineKeyboardBuilder()
+    for doc in doctors:
+        name_parts = [doc.last_name, doc.first_name[0] + "."]
+        if doc.middle_name:
+            name_parts.append(doc.middle_name[0] + ".")
+        builder.button(text=" ".join(name_parts), callback_data=f"doc:{doc.id}")
+    builder.adjust(1)
+    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_specializations"))
+    return builder.as_markup()
+
+
+def legacy_dates_keyboard(availability):
+    builder = InlineKeyboardBuilder()
+    for d, free in availability.items():
+        if free <= 0:
+            continue
+        label = (
+            d.strftime("%d %b")
+            .replace("Jan", "янв").replace("Feb", "фев").replace("Mar", "мар")
+            .replace("Apr", "апр").replace("May", "мая").replace("Jun", "июн")
+            .replace("Jul", "июл").replace("Aug", "авг").replace("Sep", "сен")
+            .replace("Oct", "окт").replace("Nov", "ноя").replace("Dec", "дек")
+        )
+        builder.button(text=f"{label} · {free}", callback_data=f"date:{d.isoformat()}")
+    builder.adjust(2)
+    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_doctors"))
+    return builder.as_markup()
+
+
+def legacy_year_keyboard(page):
+    return birthdate._build_year_keyboard(page)
+
+
+def legacy_month_keyboard():
+    return birthdate._build_month_keyboard()
+
+
+def legacy_day_keyboard(year, month):
+    return birthdate._build_day_keyboard(calendar.monthrange(year, month)[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    specializations = [SimpleNamespace(id=i, name=f"Специализация {i}") for i in range(12)]
+    doctors = [
+        SimpleNamespace(id=i, last_name=f"Иванов{i}", first_name="Пётр", middle_name="Сергеевич")
+        for i in range(8)
+    ]
+    tomorrow = date.today() + timedelta(days=1)
+    availability = {tomorrow + timedelta(days=i): 10 + i for i in range(16)}
+
+    cases = [
+        ("специализации", lambda: legacy_specializations_keyboard(specializations),
+         lambda: new_record.specializations_keyboard(specializations)),
+        ("врачи", lambda: legacy_doctors_keyboard(doctors),
+         lambda: new_record.doctors_keyboard(doctors)),
+        ("даты", lambda: legacy_dates_keyboard(availability),
+         lambda: new_record.dates_keyboard(availability)),
+        ("годы", lambda: legacy_year_keyboard(3), lambda: birthdate.get_year_keyboard(3)),
+        ("месяцы", legacy_month_keyboard, birthdate.get_month_keyboard),
+        ("дни", lambda: legacy_day_keyboard(1990, 2), lambda: birthdate.get_day_keyboard(1990, 2)),
+    ]
+
+    print(f"{'клавиатура':<16}{'было, мкс':>12}{'стало, мкс':>12}")
+    for name, legacy, cached in cases:
+        legacy_us = timeit.timeit(legacy, number=args.number) / args.number * 1e6
+        cached_us = timeit.timeit(cached, number=args.number) / args.number * 1e6
+        print(f"{name:<16}{legacy_us:>12.1f}{cached_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# bot/benchmarks/pool_sweep.py
+"""
+Подбор размера пула: синтетическая нагрузка записи при разных pool_size.
+
+Каждый виртуальный пользователь в цикле смотрит свободные слоты врача на
+случайную дату и с вероятностью --book-ratio записывается на первый слот
+(запись тут же удаляется, данные не меняются). Для каждого размера пула —
+пропускная способность, задержки операций и ожидание соединения из пула.
+Параметры соединений (PgBouncer, кэш выражений) — из окружения, как у бота.
+Запуск (нужен DATABASE_URL и существующий врач):
+    python -m bot.benchmarks.pool_sweep --doctor-id 1 --sizes 2,5,10,20 --users 100 --duration 10
+"""
+import argparse
+import asyncio
+import random
+import time as timer
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bot.database.models import User
+from bot.database.session import DATABASE_URL, engine_options, warm_up_pool
+from bot.database.utils.booking import book_slot
+from bot.database.utils.delete_slot import hard_delete_appointment
+from bot.database.utils.slot_engine import get_free_slots
+
+# Служебный пациент для прогона (реальные telegram_id положительные)
+SWEEP_TELEGRAM_ID = -2
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+
+async def sweep_one(
+    pool_size: int,
+    doctor_id: int,
+    users: int,
+    duration: float,
+    book_ratio: float,
+    days: int
+) -> Dict[str, float]:
+    engine = create_async_engine(DATABASE_URL, **engine_options(pool_size=pool_size, max_overflow=0))
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    await warm_up_pool(engine, pool_size)
+
+    async with session_maker() as session:
+        patient_id = (await session.execute(
+            select(User.id).where(User.telegram_id == SWEEP_TELEGRAM_ID)
+        )).scalar()
+        if patient_id is None:
+            patient = User(telegram_id=SWEEP_TELEGRAM_ID, first_name="pool sweep")
+            session.add(patient)
+            await session.commit()
+            patient_id = patient.id
+
+    reads: List[float] = []
+    bookings: List[float] = []
+    checkouts: List[float] = []
+    errors = 0
+    deadline = timer.monotonic() + duration
+
+    async def user_loop():
+        nonlocal errors
+        while timer.monotonic() < deadline:
+            target = date.today() + timedelta(days=random.randint(1, days))
+            try:
+                async with session_maker() as session:
+                    started = timer.perf_counter()
+                    await session.connection()
+                    checkouts.append(timer.perf_counter() - started)
+
+                    slots = await get_free_slots(session, [doctor_id], target, target)
+                    await session.rollback()
+                    reads.append(timer.perf_counter() - started)
+
+                    free = slots.get(doctor_id, {}).get(target, [])
+                    if free and random.random() < book_ratio:
+                        started = timer.perf_counter()
+                        appointment_id = await book_slot(session, patient_id, doctor_id, target, free[0])
+                        bookings.append(timer.perf_counter() - started)
+                        if appointment_id is not None:
+                            await hard_delete_appointment(session, appointment_id)
+            except Exception:
+                errors += 1
+
+    started = timer.perf_counter()
+    await asyncio.gather(*(user_loop() for _ in range(users)))
+    elapsed = timer.perf_counter() - started
+    await engine.dispose()
+
+    return {
+        "pool": pool_size,
+        "ops": (len(reads) + len(bookings)) / elapsed,
+        "read_p50": percentile(reads, 0.5),
+        "read_p99": percentile(reads, 0.99),
+        "book_p99": percentile(bookings, 0.99),
+        "checkout_p99": percentile(checkouts, 0.99),
+        "errors": errors,
+    }
+
+
+async def run(args) -> None:
+    print(f"{'pool':>5} {'ops/s':>8} {'read p50':>9} {'read p99':>9} {'book p99':>9} {'wait p99':>9} {'err':>5}")
+    for pool_size in args.sizes:
+        result = await sweep_one(pool_size, args.doctor_id, args.users, args.duration, args.book_ratio, args.days)
+        print(
+            f"{result['pool']:>5} {result['ops']:>8.0f} {result['read_p50']:>7.1f}мс {result['read_p99']:>7.1f}мс "
+            f"{result['book_p99']:>7.1f}мс {result['checkout_p99']:>7.1f}мс {result['errors']:>5}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctor-id", type=int, required=True)
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[2, 5, 10, 20])
+    parser.add_argument("--users", type=int, default=100, help="одновременных виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=10, help="секунд на каждый размер пула")
+    parser.add_argument("--book-ratio", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bot/benchmarks/slot_engine.py
+"""
+Сравнение старого цикла генерации слотов с slot_engine.
+
+Запуск (нужен DATABASE_URL с заполненными врачами):
+    python -m bot.benchmarks.slot_engine --days 20 --repeat 5
+"""
+import argparse
+import asyncio
+import time as timer
+from datetime import date, datetime, timedelta
+from typing import List
+
+from sqlalchemy import and_, event, select
+
+from bot.database.models import Appointment, AppointmentStatus, Doctor
+from bot.database.session import AsyncSessionLocal, engine
+from bot.database.utils.new_record import _is_workday
+from bot.database.utils.slot_engine import get_free_slots
+
+
+class QueryCounter:
+    """Считает запросы, ушедшие в БД через движок."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+async def legacy_free_slots(session, doctor_id: int, target_date: date) -> List:
+    """Прежняя реализация get_free_slots_for_doctor_on_date: врач + занятые + цикл в Python."""
+    result = await session.execute(select(Doctor).where(Doctor.id == doctor_id))
+    doctor = result.scalar_one_or_none()
+    if not doctor or not _is_workday(doctor, target_date):
+        return []
+
+    busy_result = await session.execute(
+        select(Appointment.appointment_time).where(
+            and_(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date == target_date,
+                Appointment.status != AppointmentStatus.CANCELLED
+            )
+        )
+    )
+    busy_times = {row[0] for row in busy_result.fetchall()}
+
+    start = datetime.combine(target_date, doctor.work_start_time)
+    end = datetime.combine(target_date, doctor.work_end_time)
+    duration = timedelta(minutes=doctor.appointment_duration_minutes)
+
+    free_slots = []
+    current = start
+    while current + duration <= end:
+        if current.time() not in busy_times:
+            free_slots.append(current.time())
+        current += duration
+    return free_slots
+
+
+async def run(days: int, repeat: int) -> None:
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+
+    date_from = date.today() + timedelta(days=1)
+    date_to = date_from + timedelta(days=days - 1)
+
+    async with AsyncSessionLocal() as session:
+        doctor_ids = list((await session.execute(
+            select(Doctor.id).where(Doctor.is_active.is_(True))
+        )).scalars())
+        print(f"Врачей: {len(doctor_ids)}, дней: {days}, повторов: {repeat}")
+
+        counter.count = 0
+        started = timer.perf_counter()
+        legacy_total = 0
+        for _ in range(repeat):
+            for doctor_id in doctor_ids:
+                day = date_from
+                while day <= date_to:
+                    legacy_total += len(await legacy_free_slots(session, doctor_id, day))
+                    day += timedelta(days=1)
+        legacy_time = (timer.perf_counter() - started) / repeat
+        legacy_queries = counter.count // repeat
+
+        counter.count = 0
+        started = timer.perf_counter()
+        engine_total = 0
+        for _ in range(repeat):
+            slots = await get_free_slots(session, doctor_ids, date_from, date_to)
+            engine_total += sum(len(times) for by_day in slots.values() for times in by_day.values())
+        engine_time = (timer.perf_counter() - started) / repeat
+        engine_queries = counter.count // repeat
+
+    event.remove(engine.sync_engine, "before_cursor_execute", counter)
+    await engine.dispose()
+
+    print(f"{'':<12}{'запросов':>10}{'мс':>12}{'слотов':>10}")
+    print(f"{'цикл':<12}{legacy_queries:>10}{legacy_time * 1000:>12.1f}{legacy_total // repeat:>10}")
+    print(f"{'slot_engine':<12}{engine_queries:>10}{engine_time * 1000:>12.1f}{engine_total // repeat:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.days, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
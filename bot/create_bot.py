@@ -1,17 +1,30 @@
 import os
 from aiogram.client.default import DefaultBotProperties
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.redis import RedisStorage
 from redis.asyncio import Redis
 from bot.database.session import AsyncSessionLocal
+from bot.database.replica import replica_router
+from bot.middlewares.inflight import InFlightMiddleware
+from bot.middlewares.context import UpdateContextMiddleware, HandlerNameMiddleware
 from bot.middlewares.db import DbSessionMiddleware
+from bot.middlewares.user import UserMiddleware
 from bot.middlewares.logging import ChannelLoggerMiddleware
+from bot.middlewares.errors import ErrorHandlingMiddleware, swallows_error
+from bot.middlewares.api_scheduler import ApiSchedulerMiddleware
+from bot.middlewares.edit_coalescing import EditCoalescingMiddleware
+from bot.middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, TelegramApiMetricsMiddleware
+from bot.utils.availability_cache import AvailabilityCache
+from bot.utils.reference_cache import reference_cache
+from bot.utils.slot_holds import SlotHolds
+from bot.utils.event_log import create_sink_from_env
+from bot.utils.fsm_storage import InstrumentedRedisStorage
 
 # Читаем переменные
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 REDIS_URL = os.getenv("REDIS_URL")
 ADMIN_ID = os.getenv("ADMIN_ID")
 LOG_CHANNEL_ID = os.getenv("LOG_CHANNEL_ID")
+DEVELOPER_CHAT_ID = os.getenv("DEVELOPER_CHAT_ID")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 if not all([BOT_TOKEN, REDIS_URL, ADMIN_ID]):
@@ -19,13 +32,44 @@ if not all([BOT_TOKEN, REDIS_URL, ADMIN_ID]):
 
 # Создаём компоненты
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+# Сначала отсекаем лишние правки, чтобы они не тратили лимиты планировщика;
+# метрики внутри считают каждую реальную попытку, включая повторы после 429
+bot.session.middleware(EditCoalescingMiddleware())
+bot.session.middleware(ApiSchedulerMiddleware(low_priority_chats=[LOG_CHANNEL_ID]))
+bot.session.middleware(TelegramApiMetricsMiddleware())
 redis_client = Redis.from_url(REDIS_URL)
-storage = RedisStorage(redis=redis_client)
+storage = InstrumentedRedisStorage(redis=redis_client)
 dp = Dispatcher(storage=storage)
 dp["session_maker"] = AsyncSessionLocal
+availability_cache = AvailabilityCache(redis_client)
+# Изменение врачей и расписаний делает устаревшими и карты занятости
+reference_cache.on_invalidate(availability_cache.invalidate_all)
+dp["availability_cache"] = availability_cache
+dp["slot_holds"] = SlotHolds(redis_client)
+dp["developer_chat_id"] = DEVELOPER_CHAT_ID or ADMIN_ID
 
-dp.update.middleware(DbSessionMiddleware(AsyncSessionLocal))
-dp.update.middleware(ChannelLoggerMiddleware(channel_id=LOG_CHANNEL_ID))
+# Локальный журнал событий (включается через EVENT_LOG_PATH)
+event_sink = create_sink_from_env()
+
+# Первой — чтобы при остановке дождаться апдейт целиком, со всеми миддлварями
+in_flight = InFlightMiddleware()
+dp.update.middleware(in_flight)
+dp.update.middleware(UpdateContextMiddleware())
+dp.update.middleware(UpdateMetricsMiddleware())
+dp.update.middleware(DbSessionMiddleware(AsyncSessionLocal, replica=replica_router))
+dp.update.middleware(UserMiddleware())
+channel_logger = ChannelLoggerMiddleware(channel_id=LOG_CHANNEL_ID, sink=event_sink)
+dp.update.middleware(channel_logger)
+# Один экземпляр на все типы событий — общий учёт повторов ошибок
+error_middleware = ErrorHandlingMiddleware(sink=event_sink)
+for observer in (dp.message, dp.callback_query):
+    observer.middleware(HandlerNameMiddleware())
+    observer.middleware(error_middleware)
+    # Внутри обработчика ошибок, чтобы видеть исключения до их перехвата
+    observer.middleware(HandlerMetricsMiddleware())
+# Исключение, прошедшее все миддлвари, здесь считается обработанным;
+# превышение бюджета запросов при QUERY_BUDGET_STRICT=1 выходит из feed_update
+dp.errors.register(error_middleware.on_error, swallows_error)
 
 # Экспортируем
-__all__ = ["bot", "dp", "ADMIN_ID"]
\ No newline at end of file
+__all__ = ["bot", "dp", "ADMIN_ID", "redis_client", "availability_cache", "channel_logger", "error_middleware", "event_sink", "in_flight"]
\ No newline at end of file
@@ -0,0 +1,32 @@
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .runner import MIGRATE_ON_STARTUP, Migration, current_version, upgrade
+from .versions import HEAD, MIGRATIONS
+
+
+async def ensure_schema(engine: AsyncEngine) -> None:
+    """
+    Проверка схемы при старте бота: на актуальной базе — один запрос.
+
+    Если база отстаёт, миграции применяются (MIGRATE_ON_STARTUP=1, по умолчанию)
+    или старт прерывается с просьбой запустить их отдельно.
+    """
+    version = await current_version(engine)
+    if version == HEAD:
+        return
+    if not MIGRATE_ON_STARTUP:
+        raise RuntimeError(
+            f"Схема БД на версии {version}, нужна {HEAD}: "
+            f"выполните python -m bot.database.migrations upgrade"
+        )
+    await upgrade(engine, MIGRATIONS)
+
+
+__all__ = [
+    "HEAD",
+    "MIGRATIONS",
+    "Migration",
+    "current_version",
+    "ensure_schema",
+    "upgrade"
+]
@@ -0,0 +1,52 @@
+# bot/database/migrations/__main__.py
+"""
+Миграции схемы отдельно от запуска бота:
+    python -m bot.database.migrations status   — текущая версия и недостающие шаги
+    python -m bot.database.migrations upgrade  — применить недостающие шаги
+    python -m bot.database.migrations verify   — код выхода 1, если база не на последней версии
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from bot.database.session import engine
+from .runner import applied_versions, upgrade
+from .versions import HEAD, MIGRATIONS
+
+
+async def run(command: str) -> int:
+    try:
+        if command == "upgrade":
+            done = await upgrade(engine, MIGRATIONS)
+            print(f"Применено шагов: {len(done)}; версия схемы: {HEAD}")
+            return 0
+
+        applied = await applied_versions(engine)
+        pending = [m for m in MIGRATIONS if m.version not in applied]
+        unknown = sorted(applied - {m.version for m in MIGRATIONS})
+
+        print(f"Версия схемы: {max(applied, default=0)}, последняя: {HEAD}")
+        for migration in pending:
+            print(f"  ожидает: {migration.version:04d} {migration.name}")
+        for version in unknown:
+            print(f"  неизвестная версия в базе: {version:04d}")
+
+        if command == "verify":
+            return 1 if pending or unknown else 0
+        return 0
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("status", "upgrade", "verify"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    sys.exit(asyncio.run(run(args.command)))
+
+
+if __name__ == "__main__":
+    main()
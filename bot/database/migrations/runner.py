@@ -0,0 +1,110 @@
+# bot/database/migrations/runner.py
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence, Set
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = "schema_migrations"
+# Ключ advisory lock: одновременно миграции применяет только один процесс
+MIGRATION_LOCK_KEY = 7_301_955_142
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Шаг миграции схемы.
+
+    transactional=False — для операций, которые нельзя выполнять в транзакции
+    (CREATE INDEX CONCURRENTLY): шаг выполняется в режиме autocommit и должен
+    быть идемпотентным, чтобы его можно было безопасно повторить после сбоя.
+    """
+    version: int
+    name: str
+    up: Callable[[AsyncConnection], Awaitable[None]]
+    transactional: bool = True
+
+
+async def create_index_concurrently(conn: AsyncConnection, name: str, ddl: str) -> None:
+    """
+    Создаёт индекс без блокировки записи в таблицу.
+
+    Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс —
+    такой удаляется и строится заново.
+    """
+    valid = (await conn.execute(
+        text(
+            "SELECT i.indisvalid FROM pg_class c "
+            "JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"
+        ),
+        {"name": name}
+    )).scalar()
+    if valid:
+        return
+    if valid is False:
+        logger.warning(f"Индекс {name} невалиден (прерванная сборка) — пересоздаём")
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    await conn.execute(text(ddl))
+
+
+async def current_version(engine: AsyncEngine) -> Optional[int]:
+    """Версия схемы одним запросом; None — миграции ещё ни разу не применялись."""
+    async with engine.connect() as conn:
+        try:
+            return (await conn.execute(text(f"SELECT max(version) FROM {VERSION_TABLE}"))).scalar() or 0
+        except ProgrammingError:
+            return None
+
+
+async def applied_versions(engine: AsyncEngine) -> Set[int]:
+    async with engine.connect() as conn:
+        try:
+            return set((await conn.execute(text(f"SELECT version FROM {VERSION_TABLE}"))).scalars())
+        except ProgrammingError:
+            return set()
+
+
+async def upgrade(engine: AsyncEngine, migrations: Sequence[Migration]) -> List[Migration]:
+    """Применяет недостающие миграции по порядку. Возвращает применённые."""
+    done: List[Migration] = []
+    async with engine.connect() as conn:
+        lock_conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            await lock_conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+                "version integer PRIMARY KEY, "
+                "name text NOT NULL, "
+                "applied_at timestamptz NOT NULL DEFAULT now())"
+            ))
+            # Перечитываем под блокировкой: другой процесс мог успеть всё применить
+            applied = set((await lock_conn.execute(text(f"SELECT version FROM {VERSION_TABLE}"))).scalars())
+
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if migration.version in applied:
+                    continue
+                logger.info(f"Миграция {migration.version:04d} {migration.name}...")
+                if migration.transactional:
+                    async with engine.begin() as tx_conn:
+                        await migration.up(tx_conn)
+                        await _mark_applied(tx_conn, migration)
+                else:
+                    await migration.up(lock_conn)
+                    await _mark_applied(lock_conn, migration)
+                done.append(migration)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    return done
+
+
+async def _mark_applied(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text(f"INSERT INTO {VERSION_TABLE} (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name}
+    )
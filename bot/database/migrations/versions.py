@@ -0,0 +1,146 @@
+# bot/database/migrations/versions.py
+"""
+Миграции схемы по порядку. Новые изменения схемы — только новыми шагами
+в конце списка; применённые шаги не редактируются.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .runner import Migration, create_index_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+# Исходная схема — таблицы, которые раньше создавал create_all при старте,
+# зафиксированные текстом: шаг не должен меняться вместе с моделями.
+# На уже работающей базе ничего не делает.
+_BASELINE = (
+    "DO $$ BEGIN "
+    "CREATE TYPE appointment_status AS ENUM ('SCHEDULED', 'COMPLETED', 'CANCELLED', 'NO_SHOW'); "
+    "EXCEPTION WHEN duplicate_object THEN NULL; "
+    "END $$",
+
+    "CREATE TABLE IF NOT EXISTS users ("
+    "id SERIAL PRIMARY KEY, "
+    "telegram_id BIGINT NOT NULL UNIQUE, "
+    "first_name VARCHAR(100), "
+    "last_name VARCHAR(100), "
+    "patronymic VARCHAR(100), "
+    "birth_date DATE, "
+    "phone VARCHAR(20), "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL)",
+
+    "CREATE TABLE IF NOT EXISTS specializations ("
+    "id SERIAL PRIMARY KEY, "
+    "name VARCHAR(200) NOT NULL UNIQUE, "
+    "is_active BOOLEAN NOT NULL, "
+    "sort_order INTEGER NOT NULL)",
+
+    "CREATE TABLE IF NOT EXISTS doctors ("
+    "id SERIAL PRIMARY KEY, "
+    "last_name VARCHAR(100) NOT NULL, "
+    "first_name VARCHAR(100) NOT NULL, "
+    "middle_name VARCHAR(100), "
+    "cabinet VARCHAR(50) NOT NULL, "
+    "work_start_time TIME WITHOUT TIME ZONE NOT NULL, "
+    "work_end_time TIME WITHOUT TIME ZONE NOT NULL, "
+    "appointment_duration_minutes INTEGER NOT NULL, "
+    "mon BOOLEAN NOT NULL, "
+    "tue BOOLEAN NOT NULL, "
+    "wed BOOLEAN NOT NULL, "
+    "thu BOOLEAN NOT NULL, "
+    "fri BOOLEAN NOT NULL, "
+    "sat BOOLEAN NOT NULL, "
+    "is_active BOOLEAN NOT NULL, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "specialization_id INTEGER NOT NULL REFERENCES specializations (id))",
+
+    "CREATE TABLE IF NOT EXISTS appointments ("
+    "id SERIAL PRIMARY KEY, "
+    "patient_id BIGINT NOT NULL REFERENCES users (id), "
+    "doctor_id INTEGER NOT NULL REFERENCES doctors (id), "
+    "appointment_date DATE NOT NULL, "
+    "appointment_time TIME WITHOUT TIME ZONE NOT NULL, "
+    "appointment_datetime TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "status appointment_status NOT NULL, "
+    "notes TEXT, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+    "updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL)",
+)
+
+
+async def _baseline(conn: AsyncConnection) -> None:
+    for statement in _BASELINE:
+        await conn.execute(text(statement))
+
+
+async def cancel_duplicate_bookings(conn: AsyncConnection) -> int:
+    """
+    Оставляет на каждом слоте врача самую раннюю действующую запись,
+    остальные отменяет и ставит в очередь уведомлений пациентам
+    (duplicate_booking_notices, см. bot/database/utils/duplicate_bookings.py).
+
+    Один запрос — атомарен и в режиме autocommit. Возвращает число отменённых записей.
+    """
+    result = await conn.execute(text(
+        "WITH ranked AS ("
+        "  SELECT id, row_number() OVER ("
+        "    PARTITION BY doctor_id, appointment_datetime ORDER BY created_at, id"
+        "  ) AS position"
+        "  FROM appointments WHERE status <> 'CANCELLED'"
+        "), cancelled AS ("
+        "  UPDATE appointments a SET status = 'CANCELLED', updated_at = now() AT TIME ZONE 'UTC'"
+        "  FROM ranked r WHERE a.id = r.id AND r.position > 1"
+        "  RETURNING a.id"
+        ") "
+        "INSERT INTO duplicate_booking_notices (appointment_id) "
+        "SELECT id FROM cancelled ON CONFLICT DO NOTHING "
+        "RETURNING appointment_id"
+    ))
+    cancelled = len(result.all())
+    if cancelled:
+        logger.warning(f"Отменено дублей записей на занятые слоты: {cancelled}")
+    return cancelled
+
+
+async def _cancel_duplicate_bookings(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS duplicate_booking_notices ("
+        "appointment_id integer PRIMARY KEY REFERENCES appointments (id), "
+        "notified_at timestamp)"
+    ))
+    await cancel_duplicate_bookings(conn)
+
+
+async def _appointments_slot_unique(conn: AsyncConnection) -> None:
+    # Старые экземпляры бота могли записать дубль после шага 2 — чистим ещё раз
+    # непосредственно перед сборкой, иначе уникальный индекс не построится
+    await cancel_duplicate_bookings(conn)
+    await create_index_concurrently(
+        conn,
+        "uq_appointments_doctor_slot",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_appointments_doctor_slot "
+        "ON appointments (doctor_id, appointment_datetime) "
+        "WHERE status <> 'CANCELLED'"
+    )
+
+
+async def _appointments_patient_index(conn: AsyncConnection) -> None:
+    await create_index_concurrently(
+        conn,
+        "ix_appointments_patient_id",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_patient_id "
+        "ON appointments (patient_id)"
+    )
+
+
+MIGRATIONS = (
+    Migration(1, "baseline", _baseline),
+    Migration(2, "cancel_duplicate_bookings", _cancel_duplicate_bookings),
+    Migration(3, "appointments_slot_unique", _appointments_slot_unique, transactional=False),
+    Migration(4, "appointments_patient_index", _appointments_patient_index, transactional=False),
+)
+
+HEAD = max(migration.version for migration in MIGRATIONS)
@@ -1,5 +1,5 @@
 from datetime import time, date
-from sqlalchemy import Integer, String, Boolean, Time, Date, ForeignKey, DateTime, BigInteger, Enum, Text
+from sqlalchemy import Integer, String, Boolean, Time, Date, ForeignKey, DateTime, BigInteger, Enum, Text, Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 from datetime import datetime, date, time
@@ -72,6 +72,18 @@ class Doctor(Base):
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Один действующий приём на слот врача: гарантия от двойной записи на уровне БД
+        Index(
+            "uq_appointments_doctor_slot",
+            "doctor_id",
+            "appointment_datetime",
+            unique=True,
+            postgresql_where=text("status <> 'CANCELLED'")
+        ),
+        # «Мои записи»: выборка по пациенту
+        Index("ix_appointments_patient_id", "patient_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     patient_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=False)
@@ -97,6 +109,14 @@ class Appointment(Base):
             kwargs['appointment_datetime'] = datetime.combine(date_part, time_part)
         super().__init__(**kwargs)
 
+class DuplicateBookingNotice(Base):
+    """Запись, отменённая миграцией как дубль занятого слота; пациента нужно уведомить."""
+    __tablename__ = "duplicate_booking_notices"
+
+    appointment_id: Mapped[int] = mapped_column(ForeignKey("appointments.id"), primary_key=True)
+    notified_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 class Specialization(Base):
     __tablename__ = "specializations"
 
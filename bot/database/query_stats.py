@@ -0,0 +1,184 @@
+# bot/database/query_stats.py
+"""
+Учёт SQL-запросов на апдейт: число запросов, строк и время в БД.
+
+Хуки движка пишут в QueryStats текущего апдейта (через contextvar —
+SQLAlchemy переносит контекст в свои greenlet'ы). Медленные запросы
+логируются с параметрами и планом EXPLAIN. Декоратор query_budget
+задаёт хендлеру допустимое число запросов.
+"""
+import functools
+import inspect
+import logging
+import os
+import time as timer
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+# В тестах и CI превышение бюджета — исключение, в проде — предупреждение
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Хендлер выполнил больше запросов, чем заявлено в query_budget."""
+
+
+@dataclass
+class QueryStats:
+    queries: int = 0
+    rows: int = 0
+    db_ms: float = 0.0
+    # Запросы, не входящие в бюджет хендлера (например, прогрев кэша справочников)
+    exempt: int = 0
+
+    @property
+    def budgeted(self) -> int:
+        return self.queries - self.exempt
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+_exempt: ContextVar[bool] = ContextVar("query_budget_exempt", default=False)
+
+
+@contextmanager
+def budget_exempt():
+    """Запросы внутри блока считаются, но не идут в бюджет хендлера."""
+    token = _exempt.set(True)
+    try:
+        yield
+    finally:
+        _exempt.reset(token)
+
+
+@contextmanager
+def track_queries(stats: Optional[QueryStats] = None):
+    """Собирает статистику запросов текущей задачи в stats (или в новый объект)."""
+    stats = stats if stats is not None else QueryStats()
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+def query_budget(limit: int):
+    """
+    Объявляет, сколько запросов к БД может сделать хендлер.
+
+    Считаются только запросы самого хендлера (без миддлварей) и без
+    запросов внутри budget_exempt(). При превышении — предупреждение в лог,
+    а при QUERY_BUDGET_STRICT=1 — QueryBudgetExceeded.
+    """
+    def decorator(func):
+        # aiogram может передать обёртке все данные апдейта — оставляем только нужные функции
+        parameters = inspect.signature(func).parameters
+        accepts_any = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not accepts_any:
+                kwargs = {name: value for name, value in kwargs.items() if name in parameters}
+            stats = current_stats.get()
+            if stats is None:
+                with track_queries() as stats:
+                    return await _call_within_budget(func, limit, stats, args, kwargs)
+            return await _call_within_budget(func, limit, stats, args, kwargs)
+
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+async def _call_within_budget(func, limit: int, stats: QueryStats, args, kwargs):
+    before = stats.budgeted
+    result = await func(*args, **kwargs)
+    used = stats.budgeted - before
+    if used > limit:
+        message = f"{func.__qualname__}: {used} запросов к БД при бюджете {limit}"
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return result
+
+
+def instrument_engine(engine: Engine, slow_query_ms: float = SLOW_QUERY_MS) -> None:
+    """Вешает хуки учёта запросов на (синхронный) движок SQLAlchemy."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(timer.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (timer.perf_counter() - conn.info["query_started"].pop()) * 1000
+
+        stats = current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_ms += elapsed_ms
+            if cursor.rowcount > 0:
+                stats.rows += cursor.rowcount
+            if _exempt.get():
+                stats.exempt += 1
+
+        if elapsed_ms >= slow_query_ms:
+            _log_slow_query(conn, statement, parameters, executemany, elapsed_ms)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # after_cursor_execute для упавшего запроса не вызывается — иначе
+        # время старта останется в стеке и следующий запрос снимет чужое.
+        # Запросы на соединении идут по одному: непустой стек — это упавший запрос
+        # (context.cursor в ExceptionContext не заполняется — не читаем)
+        conn = context.connection
+        if conn is not None:
+            started = conn.info.get("query_started")
+            if started:
+                started.pop()
+
+
+def _log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed_ms: float) -> None:
+    plan = None
+    if SLOW_QUERY_EXPLAIN and not executemany and statement.lstrip()[:6].lower().startswith(_EXPLAINABLE):
+        plan = _explain(conn, statement, parameters)
+
+    logger.warning(
+        f"Медленный запрос: {elapsed_ms:.0f} мс\n{statement}\nПараметры: {parameters!r}"
+        + (f"\nПлан:\n{plan}" if plan else "")
+    )
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    # Отдельный курсор DBAPI в обход событий движка; EXPLAIN без ANALYZE запрос не выполняет.
+    # Точка сохранения не даёт неудачному EXPLAIN сломать транзакцию хендлера.
+    try:
+        cursor = conn.connection.cursor()
+    except Exception as e:
+        logger.debug(f"EXPLAIN не удался: {e}")
+        return None
+    try:
+        cursor.execute("SAVEPOINT query_stats_explain")
+        try:
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+            raise
+        cursor.execute("RELEASE SAVEPOINT query_stats_explain")
+        return plan
+    except Exception as e:
+        logger.debug(f"EXPLAIN не удался: {e}")
+        return None
+    finally:
+        cursor.close()
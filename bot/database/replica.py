@@ -0,0 +1,161 @@
+# bot/database/replica.py
+"""
+Маршрутизация чтения на реплику Postgres.
+
+Реплика используется, только если она отвечает и отстаёт не больше
+REPLICA_MAX_LAG секунд (проверяется фоновой задачей), а пользователь не
+писал в БД последние READ_YOUR_WRITES_WINDOW секунд — сразу после записи
+или отмены он должен видеть свои изменения, поэтому читает с основной БД.
+Иначе — основная БД.
+"""
+import asyncio
+import logging
+import os
+import time as timer
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from bot.utils.metrics import registry, Counter, Gauge
+from .session import replica_engine
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 5))
+REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", 2))
+# Должно быть больше REPLICA_MAX_LAG: к концу окна реплика гарантированно догнала запись
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 15))
+RECENT_WRITERS_LIMIT = 50_000
+
+# Отставание в секундах; 0, если реплика проиграла всё полученное (или это не реплика)
+_LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+replica_lag_seconds = registry.register(Gauge(
+    "bot_db_replica_lag_seconds", "Отставание реплики при последней проверке"
+))
+replica_up = registry.register(Gauge(
+    "bot_db_replica_up", "1 — реплика доступна и отстаёт не больше REPLICA_MAX_LAG"
+))
+db_reads_total = registry.register(Counter(
+    "bot_db_read_route_total", "Апдейты по источнику чтения", ("target", "reason")
+))
+
+
+class ReplicaRouter:
+    """Решает, читать ли апдейту с реплики; следит за её состоянием."""
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine],
+        max_lag: float = REPLICA_MAX_LAG,
+        window: float = READ_YOUR_WRITES_WINDOW
+    ):
+        self.engine = engine
+        self.session_pool = async_sessionmaker(bind=engine, expire_on_commit=False) if engine is not None else None
+        self.max_lag = max_lag
+        self.window = window
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self._recent_writers: Dict[int, float] = {}
+        self._checker: Optional[asyncio.Task] = None
+        self._routes = {
+            (target, reason): db_reads_total.labels(target, reason)
+            for target, reason in (
+                ("replica", "ok"),
+                ("primary", "recent_write"),
+                ("primary", "replica_unavailable"),
+            )
+        }
+        replica_lag_seconds.set_function(lambda: self.lag if self.lag is not None else -1)
+        replica_up.set_function(lambda: int(self.healthy))
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    def use_replica(self, user_id: Optional[int]) -> bool:
+        if not self.enabled:
+            return False
+        if user_id is not None and self._wrote_recently(user_id):
+            self._routes["primary", "recent_write"].inc()
+            return False
+        if not self.healthy:
+            self._routes["primary", "replica_unavailable"].inc()
+            return False
+        self._routes["replica", "ok"].inc()
+        return True
+
+    def mark_write(self, user_id: int) -> None:
+        """Пользователь что-то записал: ближайшее время его чтения идут в основную БД."""
+        if len(self._recent_writers) >= RECENT_WRITERS_LIMIT:
+            now = timer.monotonic()
+            self._recent_writers = {
+                uid: until for uid, until in self._recent_writers.items() if until > now
+            }
+        self._recent_writers[user_id] = timer.monotonic() + self.window
+
+    def mark_down(self, error: BaseException) -> None:
+        """Реплика не ответила на запросе — не используем до следующей успешной проверки."""
+        if self.healthy:
+            logger.warning(f"Реплика недоступна, чтение переключено на основную БД: {error}")
+        self.healthy = False
+
+    def _wrote_recently(self, user_id: int) -> bool:
+        until = self._recent_writers.get(user_id)
+        if until is None:
+            return False
+        if until <= timer.monotonic():
+            del self._recent_writers[user_id]
+            return False
+        return True
+
+    # --- Проверка состояния ---
+
+    async def check(self) -> bool:
+        try:
+            async with self.engine.connect() as conn:
+                lag = (await asyncio.wait_for(conn.execute(_LAG_QUERY), REPLICA_CHECK_TIMEOUT)).scalar()
+        except Exception as e:
+            self.lag = None
+            self.mark_down(e)
+            return False
+
+        self.lag = float(lag or 0)
+        healthy = self.lag <= self.max_lag
+        if healthy != self.healthy:
+            if healthy:
+                logger.info(f"Реплика доступна (отставание {self.lag:.1f} с), чтение идёт с неё")
+            else:
+                logger.warning(f"Реплика отстаёт на {self.lag:.1f} с, чтение переключено на основную БД")
+        self.healthy = healthy
+        return healthy
+
+    async def start(self) -> None:
+        if self.enabled and self._checker is None:
+            await self.check()
+            self._checker = asyncio.create_task(self._run_checks())
+
+    async def stop(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            try:
+                await self._checker
+            except asyncio.CancelledError:
+                pass
+            self._checker = None
+
+    async def _run_checks(self) -> None:
+        while True:
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+            await self.check()
+
+
+# Один маршрутизатор на процесс; без DATABASE_REPLICA_URL всё читается с основной БД
+replica_router = ReplicaRouter(replica_engine)
@@ -1,21 +1,87 @@
 # bot/database/session.py
+import asyncio
+import logging
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import time as timer
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from .models import Base
+from .query_stats import instrument_engine
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL must be set in environment")
+# Реплика для чтения (необязательно), см. bot/database/replica.py
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Пул соединений
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Таймаут установки соединения: недоступная реплика не должна задерживать апдейт на минуту
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 10))
+# Пересоздавать соединения старше N секунд (-1 — никогда); меньше таймаутов балансировщика/PgBouncer
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Проверка соединения перед выдачей: +1 round-trip на checkout, включать при нестабильной сети
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+# Сколько соединений открыть при старте (по умолчанию — весь постоянный пул)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", DB_POOL_SIZE))
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", DB_POOL_SIZE))
+DB_REPLICA_MAX_OVERFLOW = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", DB_MAX_OVERFLOW))
+
+# Кэш подготовленных выражений на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# PgBouncer в режиме transaction/statement: соединение с сервером меняется между
+# транзакциями, поэтому кэш подготовленных выражений отключается, а имена
+# выражений делаются уникальными, чтобы не конфликтовать на общем серверном соединении
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+
+def engine_options(pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> Dict[str, Any]:
+    """Параметры create_async_engine из окружения (общие для основного движка и бенчмарков)."""
+    if DB_PGBOUNCER:
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    else:
+        connect_args = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    connect_args["timeout"] = DB_CONNECT_TIMEOUT
+
+    return dict(
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
 
 # Асинхронный движок
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,               # включи True для отладки SQL
-    pool_size=5,
-    max_overflow=10,
+    **engine_options()
 )
+# Учёт запросов на апдейт и журнал медленных запросов
+instrument_engine(engine.sync_engine)
+
+replica_engine: Optional[AsyncEngine] = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        DATABASE_REPLICA_URL,
+        **engine_options(pool_size=DB_REPLICA_POOL_SIZE, max_overflow=DB_REPLICA_MAX_OVERFLOW)
+    )
+    instrument_engine(replica_engine.sync_engine)
 
 # Фабрика сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -23,7 +89,34 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
-async def init_db():
-    """Создаёт таблицы, если их нет."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+
+async def warm_up_pool(engine: AsyncEngine, connections: int = DB_POOL_WARMUP) -> int:
+    """
+    Открывает соединения пула заранее, чтобы первые апдейты после деплоя
+    не ждали установки соединения (TCP, TLS, аутентификация).
+
+    Соединения берутся одновременно — иначе пул выдавал бы одно и то же.
+    Возвращает число открытых соединений.
+    """
+    connections = min(connections, engine.pool.size())
+    if connections <= 0:
+        return 0
+
+    started = timer.perf_counter()
+    opened = []
+    try:
+        results = await asyncio.gather(
+            *(engine.connect().start() for _ in range(connections)),
+            return_exceptions=True
+        )
+        opened = [conn for conn in results if not isinstance(conn, BaseException)]
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in opened))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in opened), return_exceptions=True)
+
+    failed = connections - len(opened)
+    logger.info(
+        f"Пул БД прогрет: {len(opened)} соединений за {(timer.perf_counter() - started) * 1000:.0f} мс"
+        + (f", не удалось открыть {failed}" if failed else "")
+    )
+    return len(opened)
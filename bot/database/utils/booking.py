@@ -0,0 +1,43 @@
+from datetime import date, datetime, time
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import Appointment, AppointmentStatus
+
+
+async def book_slot(
+    session: AsyncSession,
+    patient_id: int,
+    doctor_id: int,
+    appointment_date: date,
+    appointment_time: time
+) -> Optional[int]:
+    """
+    Записывает пациента на слот одним INSERT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Единственность победителя обеспечивает частичный уникальный индекс
+    uq_appointments_doctor_slot: из параллельных попыток на один слот
+    строку вставит ровно одна, остальные получат конфликт без блокировок
+    и повторов транзакции.
+
+    :return: id созданной записи или None, если слот уже занят
+    """
+    stmt = (
+        insert(Appointment)
+        .values(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            appointment_datetime=datetime.combine(appointment_date, appointment_time),
+            status=AppointmentStatus.SCHEDULED
+        )
+        .on_conflict_do_nothing()
+        .returning(Appointment.id)
+    )
+    result = await session.execute(stmt)
+    appointment_id = result.scalar_one_or_none()
+    await session.commit()
+    return appointment_id
@@ -1,9 +1,12 @@
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import NoResultFound
-from bot.database.models import Appointment, AppointmentStatus
-from datetime import date, time
-from typing import Optional
+from bot.database.models import Appointment, AppointmentStatus, User
+from datetime import date, datetime, time
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bot.utils.availability_cache import AvailabilityCache
 
 
 async def cancel_appointment(
@@ -13,7 +16,8 @@ async def cancel_appointment(
     patient_telegram_id: Optional[int] = None,
     doctor_id: Optional[int] = None,
     appointment_date: Optional[date] = None,
-    appointment_time: Optional[time] = None
+    appointment_time: Optional[time] = None,
+    availability_cache: Optional["AvailabilityCache"] = None
 ) -> bool:
     """
     Отменяет запись на приём (рекомендуется вместо физического удаления).
@@ -22,35 +26,46 @@ async def cancel_appointment(
        • appointment_id — ID записи (предпочтительно)
        • ИЛИ комбинация: patient_telegram_id + doctor_id + appointment_date + appointment_time
     
-    ✅ Возвращает: True если запись отменена, иначе False
+    ✅ Возвращает: True если запись отменена этим вызовом, иначе False
+       (в том числе если она уже была отменена — например, при двойном нажатии)
     💡 Совет: Меняем статус на CANCELLED вместо удаления — сохраняем историю для аналитики.
+    🔄 Если передан availability_cache — освободившийся слот сразу помечается свободным.
     """
-    # 1. Находим запись
+    # 1. Условие: только действующая запись — повторная отмена ничего не меняет
+    stmt = update(Appointment).where(Appointment.status != AppointmentStatus.CANCELLED)
     if appointment_id:
-        stmt = select(Appointment).where(Appointment.id == appointment_id)
+        stmt = stmt.where(Appointment.id == appointment_id)
     elif all([patient_telegram_id, doctor_id, appointment_date, appointment_time]):
-        stmt = (
-            select(Appointment)
-            .join(Appointment.patient)
-            .where(
-                Appointment.doctor_id == doctor_id,
-                Appointment.appointment_date == appointment_date,
-                Appointment.appointment_time == appointment_time,
-                Appointment.patient.has(telegram_id=patient_telegram_id)
-            )
+        stmt = stmt.where(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == appointment_date,
+            Appointment.appointment_time == appointment_time,
+            Appointment.patient_id.in_(select(User.id).where(User.telegram_id == patient_telegram_id))
         )
     else:
         raise ValueError("Укажите appointment_id ИЛИ полную комбинацию параметров пациента/врача/времени")
 
-    result = await session.execute(stmt)
-    appointment = result.scalar_one_or_none()
-    
-    if not appointment:
-        return False
-    
-    # 2. Отменяем (не удаляем!) — сохраняем аудит
-    appointment.status = AppointmentStatus.CANCELLED
+    # 2. Отменяем (не удаляем!) — сохраняем аудит; одним UPDATE ... RETURNING
+    result = await session.execute(
+        stmt
+        .values(status=AppointmentStatus.CANCELLED, updated_at=datetime.utcnow())
+        .returning(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time)
+        .execution_options(synchronize_session=False)
+    )
+    cancelled = result.first()
     await session.commit()
+
+    if cancelled is None:
+        return False
+
+    # Слот освобождаем, только если отменили именно сейчас: после повторной
+    # отмены его мог уже занять другой пациент
+    if availability_cache is not None:
+        await availability_cache.mark_free(
+            cancelled.doctor_id,
+            cancelled.appointment_date,
+            cancelled.appointment_time
+        )
     return True
 
 
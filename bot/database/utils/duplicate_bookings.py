@@ -0,0 +1,74 @@
+import logging
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.models import Appointment, Doctor, DuplicateBookingNotice, User
+
+logger = logging.getLogger(__name__)
+
+NOTICE_TEXT = (
+    "⚠️ <b>Ваша запись отменена</b>\n\n"
+    "На {when} к врачу {doctor} оказалось записано несколько пациентов. "
+    "Место осталось за тем, кто записался первым, поэтому ваша запись отменена.\n\n"
+    "Приносим извинения — пожалуйста, выберите другое время."
+)
+
+
+async def notify_cancelled_duplicates(bot: Bot, session_maker: async_sessionmaker) -> int:
+    """
+    Сообщает пациентам, что их записи отменены как дубли занятого слота
+    (миграция cancel_duplicate_bookings).
+
+    Уведомление помечается отправленным после доставки, а также если
+    доставить его невозможно (бот заблокирован, чат не найден). При прочих
+    ошибках остаётся в очереди до следующего запуска.
+    Возвращает число отправленных уведомлений.
+    """
+    async with session_maker() as session:
+        pending = (await session.execute(
+            select(
+                DuplicateBookingNotice.appointment_id,
+                User.telegram_id,
+                Appointment.appointment_datetime,
+                Doctor.last_name,
+                Doctor.first_name,
+                Doctor.middle_name,
+            )
+            .join(Appointment, Appointment.id == DuplicateBookingNotice.appointment_id)
+            .join(User, User.id == Appointment.patient_id)
+            .join(Doctor, Doctor.id == Appointment.doctor_id)
+            .where(DuplicateBookingNotice.notified_at.is_(None))
+        )).all()
+
+        sent = 0
+        for appointment_id, telegram_id, appointment_datetime, last_name, first_name, middle_name in pending:
+            doctor = " ".join(part for part in (last_name, first_name, middle_name) if part)
+            try:
+                await bot.send_message(
+                    chat_id=telegram_id,
+                    text=NOTICE_TEXT.format(
+                        when=appointment_datetime.strftime("%d.%m.%Y в %H:%M"),
+                        doctor=doctor
+                    )
+                )
+                sent += 1
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logger.warning(f"Не удалось уведомить пациента {telegram_id} об отмене дубля: {e}")
+            except TelegramAPIError as e:
+                logger.warning(f"Уведомление об отмене дубля {appointment_id} отложено: {e}")
+                continue
+
+            await session.execute(
+                update(DuplicateBookingNotice)
+                .where(DuplicateBookingNotice.appointment_id == appointment_id)
+                .values(notified_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    if pending:
+        logger.info(f"Уведомлений об отменённых дублях отправлено: {sent} из {len(pending)}")
+    return sent
@@ -21,7 +21,23 @@ async def get_appointments_by_user_id(session: AsyncSession, user_id: int):
 
 async def get_appointments_summary_by_telegram_id(session: AsyncSession, telegram_id: int):
     """
-    Возвращает список записей пользователя по его telegram_id в виде:
+    То же, что get_appointments_summary, но по telegram_id пользователя.
+    """
+    # Сначала получаем user.id по telegram_id
+    user_result = await session.execute(
+        select(User.id).where(User.telegram_id == telegram_id)
+    )
+    user_id = user_result.scalar()
+
+    if user_id is None:
+        return []  # Пользователь не найден
+
+    return await get_appointments_summary(session, user_id)
+
+
+async def get_appointments_summary(session: AsyncSession, user_id: int):
+    """
+    Возвращает список записей пользователя по его user.id в виде:
     [
         {
             "id": int,
@@ -34,15 +50,6 @@ async def get_appointments_summary_by_telegram_id(session: AsyncSession, telegra
     ]
     От самых ранних к самым поздним.
     """
-    # Сначала получаем user.id по telegram_id
-    user_result = await session.execute(
-        select(User.id).where(User.telegram_id == telegram_id)
-    )
-    user_id = user_result.scalar()
-
-    if user_id is None:
-        return []  # Пользователь не найден
-
     # Запрос записей с данными врача и специализации
     stmt = (
         select(
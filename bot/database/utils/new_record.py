@@ -1,33 +1,22 @@
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from bot.database.models import Specialization, Doctor, Appointment, AppointmentStatus
-from typing import List
+from bot.database.models import Doctor, Appointment, AppointmentStatus
+from bot.database.utils.slot_engine import get_free_slots
+from bot.utils.reference_cache import reference_cache
+from typing import Dict, List
 from datetime import date, datetime, timedelta
-from sqlalchemy import and_, func
+from sqlalchemy import Time, func, literal
 from datetime import time
 
 
 async def get_all_specializations(session: AsyncSession):
-    stmt = (
-        select(Specialization)
-        .where(Specialization.is_active.is_(True))
-        .order_by(Specialization.sort_order)
-    )
-    result = await session.execute(stmt)
-    return result.scalars().all()
+    """Активные специализации (из кэша справочников)."""
+    return await reference_cache.specializations(session)
 
 
 async def get_doctors_by_specialization(session: AsyncSession, specialization_id: int):
-    stmt = (
-        select(Doctor)
-        .where(
-            Doctor.specialization_id == specialization_id,
-            Doctor.is_active.is_(True)
-        )
-        .order_by(Doctor.last_name, Doctor.first_name)
-    )
-    result = await session.execute(stmt)
-    return result.scalars().all()
+    """Активные врачи специализации (из кэша справочников)."""
+    return await reference_cache.doctors_by_specialization(session, specialization_id)
 
 
 def _is_workday(doctor: Doctor, check_date: date) -> bool:
@@ -43,74 +32,100 @@ def _is_workday(doctor: Doctor, check_date: date) -> bool:
     }
     return day_map.get(weekday, False)
 
-async def get_available_dates_for_doctor(
+def _slots_per_day(doctor: Doctor) -> int:
+    """Сколько приёмов помещается в рабочий день врача (та же сетка, что и у слотов)."""
+    start = datetime.combine(date.min, doctor.work_start_time)
+    end = datetime.combine(date.min, doctor.work_end_time)
+    duration = timedelta(minutes=doctor.appointment_duration_minutes)
+    if duration <= timedelta(0) or end <= start:
+        return 0
+    return (end - start) // duration
+
+
+async def get_availability_matrix(
     session: AsyncSession,
     doctor_id: int,
     from_date: date = None,
     days_ahead: int = 20
-) -> List[date]:
+) -> Dict[date, int]:
+    """
+    Количество свободных слотов врача по каждому рабочему дню горизонта.
+
+    Расписание врача берётся из кэша справочников, из БД читаются только
+    сгруппированные по дням занятые слоты — один запрос; ёмкость дня
+    считается по сетке приёма, без генерации самих слотов. Занятыми
+    считаются только записи, попадающие в сетку (как в slot_engine),
+    иначе число на кнопке даты разойдётся со списком времени.
+
+    :return: {дата: число свободных слотов} в порядке возрастания дат
+    """
     if from_date is None:
         from_date = date.today()
 
-    # Загружаем врача
-    stmt = select(Doctor).where(Doctor.id == doctor_id, Doctor.is_active.is_(True))
-    result = await session.execute(stmt)
-    doctor = result.scalar_one_or_none()
-    if not doctor:
-        return []
+    doctor = await reference_cache.doctor(session, doctor_id)
+    if doctor is None or not doctor.is_active:
+        return {}
 
-    work_dates = []
-    current = from_date + timedelta(days=1)  # начиная с завтрашнего дня
+    first_date = from_date + timedelta(days=1)  # начиная с завтрашнего дня
     end_date = from_date + timedelta(days=days_ahead)
+    capacity = _slots_per_day(doctor)
+
+    busy_by_day = {}
+    if capacity > 0:
+        step = doctor.appointment_duration_minutes
+        last_start = (
+            datetime.combine(date.min, doctor.work_start_time) + timedelta(minutes=step * (capacity - 1))
+        ).time()
+        # Смещение от начала приёма в секундах: слот сетки — кратное шагу
+        offset = func.extract("epoch", Appointment.appointment_time - literal(doctor.work_start_time, Time))
+
+        stmt = (
+            select(
+                Appointment.appointment_date.label("day"),
+                func.count(func.distinct(Appointment.appointment_time)).label("busy")
+            )
+            .where(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date.between(first_date, end_date),
+                Appointment.appointment_time.between(doctor.work_start_time, last_start),
+                offset % (step * 60) == 0,
+                Appointment.status != AppointmentStatus.CANCELLED  # отменённые — свободны
+            )
+            .group_by(Appointment.appointment_date)
+        )
+        result = await session.execute(stmt)
+        busy_by_day = {row.day: row.busy for row in result}
 
+    matrix = {}
+    current = first_date
     while current <= end_date:
         if _is_workday(doctor, current):
-            work_dates.append(current)
+            matrix[current] = max(capacity - busy_by_day.get(current, 0), 0)
         current += timedelta(days=1)
 
-    return work_dates
+    return matrix
+
+
+async def get_available_dates_for_doctor(
+    session: AsyncSession,
+    doctor_id: int,
+    from_date: date = None,
+    days_ahead: int = 20
+) -> List[date]:
+    """Рабочие дни врача, на которые ещё остались свободные слоты."""
+    matrix = await get_availability_matrix(session, doctor_id, from_date, days_ahead)
+    return [day for day, free in matrix.items() if free > 0]
 
 async def get_free_slots_for_doctor_on_date(
     session: AsyncSession,
     doctor_id: int,
     target_date: date
 ) -> List[time]:
-    # Получаем врача
-    stmt = select(Doctor).where(Doctor.id == doctor_id)
-    result = await session.execute(stmt)
-    doctor = result.scalar_one_or_none()
-    if not doctor:
-        return []
-
-    # Проверяем, работает ли врач в этот день
-    if not _is_workday(doctor, target_date):
+    """Свободные слоты врача на дату (см. slot_engine.get_free_slots)."""
+    # Выходной или неактивный врач — по кэшу справочников, без запроса
+    doctor = await reference_cache.doctor(session, doctor_id)
+    if doctor is None or not doctor.is_active or not _is_workday(doctor, target_date):
         return []
 
-    # Получаем уже занятые времена
-    busy_stmt = (
-        select(Appointment.appointment_time)
-        .where(
-            and_(
-                Appointment.doctor_id == doctor_id,
-                Appointment.appointment_date == target_date,
-                Appointment.status != AppointmentStatus.CANCELLED  # отменённые — свободны
-            )
-        )
-    )
-    busy_result = await session.execute(busy_stmt)
-    busy_times = {row[0] for row in busy_result.fetchall()}
-
-    # Генерируем все возможные слоты
-    start = datetime.combine(target_date, doctor.work_start_time)
-    end = datetime.combine(target_date, doctor.work_end_time)
-    duration = timedelta(minutes=doctor.appointment_duration_minutes)
-
-    free_slots = []
-    current = start
-    while current + duration <= end:
-        slot_time = current.time()
-        if slot_time not in busy_times:
-            free_slots.append(slot_time)
-        current += duration
-
-    return free_slots
\ No newline at end of file
+    slots = await get_free_slots(session, [doctor_id], target_date, target_date)
+    return slots.get(doctor_id, {}).get(target_date, [])
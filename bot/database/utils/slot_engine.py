@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import date, time, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy import Date, DateTime, Interval, Time, case, cast, false, func, literal, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from bot.database.models import Appointment, AppointmentStatus, Doctor
+
+
+ONE_DAY = timedelta(days=1)
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def _is_workday_expr(day):
+    """SQL-аналог _is_workday: флаг рабочего дня врача по ISO-номеру дня недели."""
+    weekday = func.extract("isodow", day)
+    return case(
+        (weekday == 1, Doctor.mon),
+        (weekday == 2, Doctor.tue),
+        (weekday == 3, Doctor.wed),
+        (weekday == 4, Doctor.thu),
+        (weekday == 5, Doctor.fri),
+        (weekday == 6, Doctor.sat),
+        else_=false()  # Воскресенье — всегда выходной
+    )
+
+
+def free_slots_query(date_from: date, date_to: date, *criteria) -> Select:
+    """
+    Запрос свободных слотов, целиком собранный на стороне Postgres.
+
+    Дни горизонта и сетка приёма каждого врача строятся через generate_series,
+    занятые слоты отсекаются анти-соединением (NOT EXISTS) с appointments.
+    Дополнительные условия на Doctor передаются через criteria.
+
+    Колонки: doctor_id, day, slot_time, slot_start.
+    """
+    days = (
+        func.generate_series(
+            cast(literal(date_from, Date), DateTime),
+            cast(literal(date_to, Date), DateTime),
+            literal(ONE_DAY, Interval)
+        )
+        .table_valued("day")
+        .render_derived(name="days")
+    )
+    day = cast(days.c.day, Date)
+
+    step = Doctor.appointment_duration_minutes * literal(ONE_MINUTE, Interval)
+    slots = (
+        func.generate_series(
+            day + Doctor.work_start_time,
+            day + Doctor.work_end_time - step,
+            step
+        )
+        .table_valued("slot_start")
+        .render_derived(name="slots")  # функция во FROM в Postgres и так LATERAL
+    )
+
+    busy = (
+        select(Appointment.id)
+        .where(
+            Appointment.doctor_id == Doctor.id,
+            Appointment.appointment_datetime == slots.c.slot_start,
+            Appointment.status != AppointmentStatus.CANCELLED  # отменённые — свободны
+        )
+        .exists()
+    )
+
+    return (
+        select(
+            Doctor.id.label("doctor_id"),
+            day.label("day"),
+            cast(slots.c.slot_start, Time).label("slot_time"),
+            slots.c.slot_start.label("slot_start")
+        )
+        .select_from(Doctor)
+        .join(days, true())
+        .join(slots, true())
+        .where(
+            Doctor.is_active.is_(True),
+            Doctor.appointment_duration_minutes > 0,
+            _is_workday_expr(day),
+            ~busy,
+            *criteria
+        )
+    )
+
+
+async def get_free_slots(
+    session: AsyncSession,
+    doctor_ids: Iterable[int],
+    date_from: date,
+    date_to: date
+) -> Dict[int, Dict[date, List[time]]]:
+    """
+    Свободные слоты набора врачей на диапазон дат — один запрос к БД.
+
+    :return: {doctor_id: {дата: [время, ...]}}, время по возрастанию;
+             врачи и дни без свободных слотов в результат не попадают
+    """
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids or date_to < date_from:
+        return {}
+
+    stmt = (
+        free_slots_query(date_from, date_to, Doctor.id.in_(doctor_ids))
+        .order_by(Doctor.id, "slot_start")
+    )
+    result = await session.execute(stmt)
+
+    slots: Dict[int, Dict[date, List[time]]] = defaultdict(lambda: defaultdict(list))
+    for row in result:
+        slots[row.doctor_id][row.day].append(row.slot_time)
+
+    return {doctor_id: dict(days) for doctor_id, days in slots.items()}
+
+
+async def get_earliest_free_slots(
+    session: AsyncSession,
+    specialization_id: int,
+    limit: int = 6,
+    from_date: date = None,
+    days_ahead: int = 20
+) -> List[Dict]:
+    """
+    Ближайшие свободные слоты среди всех активных врачей специализации — один запрос.
+
+    Горизонт тот же, что и у выбора даты: с завтрашнего дня на days_ahead дней.
+
+    :return: [{"doctor_id", "doctor_name", "date", "time"}, ...] от ранних к поздним
+    """
+    if from_date is None:
+        from_date = date.today()
+
+    stmt = (
+        free_slots_query(
+            from_date + ONE_DAY,
+            from_date + timedelta(days=days_ahead),
+            Doctor.specialization_id == specialization_id
+        )
+        .add_columns(Doctor.last_name, Doctor.first_name, Doctor.middle_name)
+        .order_by("slot_start", Doctor.id)
+        .limit(limit)
+    )
+    result = await session.execute(stmt)
+
+    earliest = []
+    for row in result:
+        name_parts = [row.last_name, f"{row.first_name[0]}."]
+        if row.middle_name:
+            name_parts.append(f"{row.middle_name[0]}.")
+        earliest.append({
+            "doctor_id": row.doctor_id,
+            "doctor_name": " ".join(name_parts),
+            "date": row.day,
+            "time": row.slot_time
+        })
+    return earliest
@@ -0,0 +1,57 @@
+import os
+import time as timer
+from typing import Dict, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import User
+
+KNOWN_USER_TTL = int(os.getenv("KNOWN_USER_TTL", 600))
+KNOWN_USERS_LIMIT = 50_000
+
+# telegram_id -> (users.id, момент истечения): повторные /start не ходят в БД
+_known_users: Dict[int, Tuple[int, float]] = {}
+
+
+def forget_user(telegram_id: int) -> None:
+    _known_users.pop(telegram_id, None)
+
+
+async def ensure_user(session: AsyncSession, telegram_id: int) -> int:
+    """
+    Возвращает users.id пациента, при необходимости создавая его.
+
+    Один запрос: INSERT ... ON CONFLICT (telegram_id) DO NOTHING RETURNING
+    в CTE плюс выборка существующей строки. Недавно виденные пользователи
+    отдаются из памяти процесса без обращения к БД.
+    """
+    known = _known_users.get(telegram_id)
+    if known is not None and known[1] > timer.monotonic():
+        return known[0]
+
+    inserted = (
+        insert(User)
+        .values(telegram_id=telegram_id)
+        .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        .returning(User.id)
+        .cte("inserted")
+    )
+    stmt = (
+        select(inserted.c.id)
+        .union_all(select(User.id).where(User.telegram_id == telegram_id))
+        .limit(1)
+    )
+    user_id = (await session.execute(stmt)).scalar_one_or_none()
+    if user_id is None:
+        # Строку вставила параллельная транзакция уже после снимка нашего запроса
+        user_id = (await session.execute(
+            select(User.id).where(User.telegram_id == telegram_id)
+        )).scalar_one()
+    await session.commit()
+
+    if len(_known_users) >= KNOWN_USERS_LIMIT:
+        _known_users.clear()
+    _known_users[telegram_id] = (user_id, timer.monotonic() + KNOWN_USER_TTL)
+    return user_id
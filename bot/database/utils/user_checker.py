@@ -9,17 +9,17 @@ def check_user_profile_completion(user: User) -> Dict[str, bool]:
     Проверяет, заполнены ли обязательные поля профиля пользователя.
     
     Args:
-        user: Объект пользователя
+        user: Объект пользователя (None — пользователя ещё нет, профиль пуст)
         
     Returns:
         Dict с результатами проверки каждого поля и общим статусом
     """
     # Определяем, какие поля считаем важными для профиля
     important_fields = [
-        ('first_name', 'Имя', bool(user.first_name)),
-        ('last_name', 'Фамилия', bool(user.last_name)),
-        ('birth_date', 'Дата Рождения', bool(user.birth_date)),
-        ('phone', 'Телефон', bool(user.phone)),
+        ('first_name', 'Имя', bool(getattr(user, 'first_name', None))),
+        ('last_name', 'Фамилия', bool(getattr(user, 'last_name', None))),
+        ('birth_date', 'Дата Рождения', bool(getattr(user, 'birth_date', None))),
+        ('phone', 'Телефон', bool(getattr(user, 'phone', None))),
     ]
     
     # Собираем результат
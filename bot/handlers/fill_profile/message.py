@@ -14,6 +14,7 @@ from aiogram.types import ReplyKeyboardRemove
 from bot.database.models import User
 from sqlalchemy.ext.asyncio import AsyncSession
 from bot.utils.validate import validate_name, validate_phone
+from bot.middlewares.user import user_cache
 import re
 
 
@@ -133,6 +134,8 @@ async def process_phone(message: Message, state: FSMContext, session: AsyncSessi
             )
         )
     await session.commit()
+    # Профиль изменился — следующий апдейт перечитает пользователя
+    user_cache.invalidate(telegram_id)
 
     await message.answer(
         "✅ <b>Регистрация успешно завершена!</b>",
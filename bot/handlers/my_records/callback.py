@@ -1,37 +1,40 @@
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.orm import selectinload
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from bot.database.query_stats import query_budget
 from bot.database.models import Appointment, Doctor, User
-from bot.database.utils.my_slots import get_appointments_summary_by_telegram_id
-from bot.database.utils.user_checker import check_user_profile_completion
+from bot.database.utils.my_slots import get_appointments_summary
 from bot.database.utils.status2emoji import status2emoji
 from bot.keyboards.edit_data import edit_data_keyboard
 from bot.database.utils.delete_slot import cancel_appointment
 from bot.keyboards.my_records import cancel_slot_keyboard, slots_keyboard, SLOT_CALLBACK, CANCEL_SLOT_CALLBACK
 from bot.keyboards.back_start import back_start_keyboard
+from bot.utils.availability_cache import AvailabilityCache
 
 
 router = Router(name="my_slots")
 
 
 @router.callback_query(F.data == "my_slots")
-async def cmd_my_slots(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+@query_budget(1)
+async def cmd_my_slots(
+    callback: CallbackQuery,
+    state: FSMContext,
+    read_session: AsyncSession,
+    user: Optional[User],
+    profile: dict
+):
     """Просмотр моих записей 🗓"""
 
     await callback.answer("🗓 Мои записи")
-    result = await session.execute(
-        select(User).where(User.telegram_id == callback.from_user.id)
-    )
-    user = result.scalar_one_or_none()
-
-    check_result = check_user_profile_completion(user)
 
-    if check_result['is_complete']:
-        user_id = callback.from_user.id
-        appointments = await get_appointments_summary_by_telegram_id(session, user_id)
+    if profile['is_complete']:
+        appointments = await get_appointments_summary(read_session, user.id)
 
         if not appointments:
             await callback.message.edit_text(
@@ -47,17 +50,18 @@ async def cmd_my_slots(callback: CallbackQuery, state: FSMContext, session: Asyn
     else:
         await callback.message.edit_text(
             "<b><i>Вы ещё не заполнили свои данные</i></b>",
-            reply_markup=edit_data_keyboard(check_result)
+            reply_markup=edit_data_keyboard(profile)
         )
 
 @router.callback_query(F.data.startswith(f"{SLOT_CALLBACK}:"))
-async def slot_details(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+@query_budget(4)
+async def slot_details(callback: CallbackQuery, state: FSMContext, read_session: AsyncSession):
     """Просмотр деталей записи по её ID."""
     await callback.answer()
 
     slot_id = int(callback.data.removeprefix(f"{SLOT_CALLBACK}:"))
 
-    result = await session.execute(
+    result = await read_session.execute(
         select(Appointment)
         .options(
             selectinload(Appointment.doctor).selectinload(Doctor.specialization_rel),
@@ -90,13 +94,19 @@ async def slot_details(callback: CallbackQuery, state: FSMContext, session: Asyn
 
 
 @router.callback_query(F.data.startswith(f"{CANCEL_SLOT_CALLBACK}:"))
-async def cancel_slot_details(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+@query_budget(1)
+async def cancel_slot_details(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    availability_cache: AvailabilityCache
+):
     """Отмена записи по её ID."""
     await callback.answer()
 
     slot_id = int(callback.data.removeprefix(f"{CANCEL_SLOT_CALLBACK}:"))
 
-    success = await cancel_appointment(session, slot_id)
+    success = await cancel_appointment(session, slot_id, availability_cache=availability_cache)
     
     if success:
         await callback.message.edit_text(
@@ -1,12 +1,12 @@
 from datetime import date, time, datetime
+from typing import Optional
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.orm import selectinload
-from sqlalchemy import select
+from aiogram.filters import StateFilter
 from sqlalchemy.ext.asyncio import AsyncSession
-from bot.database.utils.user_checker import check_user_profile_completion
+from bot.database.query_stats import query_budget
 from bot.keyboards.edit_data import edit_data_keyboard
 from bot.keyboards.start import start_menu
 
@@ -16,37 +16,41 @@ from bot.keyboards.new_record import (
     doctors_keyboard,
     dates_keyboard,
     times_keyboard,
+    nearest_slots_keyboard,
+    confirm_keyboard,
     SPEC_CALLBACK,
     DOCTOR_CALLBACK,
     DATE_CALLBACK,
-    TIME_CALLBACK
+    TIME_CALLBACK,
+    NEAREST_CALLBACK
 )
 from bot.database.utils.new_record import (
     get_all_specializations,
     get_doctors_by_specialization,
-    get_available_dates_for_doctor,
-    get_free_slots_for_doctor_on_date
+    get_availability_matrix
 )
-from bot.database.models import Appointment, AppointmentStatus, Doctor, User
+from bot.database.utils.booking import book_slot
+from bot.database.utils.user_bootstrap import ensure_user
+from bot.database.utils.slot_engine import get_earliest_free_slots
+from bot.database.models import User
+from bot.utils.availability_cache import AvailabilityCache
+from bot.utils.reference_cache import reference_cache
+from bot.utils.slot_holds import SlotHolds
 
 
 router = Router(name="new_record")
 
+NEAREST_SLOTS = 6
+
 
 # === СТАРТ ЗАПИСИ ===
 @router.callback_query(F.data == "new_record")
-async def cmd_new_record(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+@query_budget(0)
+async def cmd_new_record(callback: CallbackQuery, state: FSMContext, session: AsyncSession, profile: dict):
     """Начало процесса записи к врачу 📅"""
     await callback.answer()
 
-    result = await session.execute(
-        select(User).where(User.telegram_id == callback.from_user.id)
-    )
-    user = result.scalar_one_or_none()
-
-    check_result = check_user_profile_completion(user)
-
-    if check_result['is_complete']:
+    if profile['is_complete']:
         specializations = await get_all_specializations(session)
         if not specializations:
             await callback.message.edit_text(
@@ -63,12 +67,13 @@ async def cmd_new_record(callback: CallbackQuery, state: FSMContext, session: As
     else:
         await callback.message.edit_text(
             "🛑 <b>Для записи к врачу необходимо заполнить профиль</b>",
-            reply_markup=edit_data_keyboard(check_result)
+            reply_markup=edit_data_keyboard(profile)
         )
 
 
 # === ВЫБОР СПЕЦИАЛИЗАЦИИ ===
 @router.callback_query(F.data.startswith(f"{SPEC_CALLBACK}:"), NewRecord.specializations)
+@query_budget(0)
 async def select_specialization(
     callback: CallbackQuery,
     state: FSMContext,
@@ -99,19 +104,21 @@ async def select_specialization(
 
 # === ВЫБОР ВРАЧА ===
 @router.callback_query(F.data.startswith(f"{DOCTOR_CALLBACK}:"), NewRecord.doctors)
+@query_budget(1)
 async def select_doctor(
     callback: CallbackQuery,
     state: FSMContext,
-    session: AsyncSession
+    session: AsyncSession,
+    read_session: AsyncSession
 ):
     await callback.answer()
 
     doctor_id = int(callback.data.split(":")[1])
     await state.update_data(doctor_id=doctor_id)
 
-    dates = await get_available_dates_for_doctor(session, doctor_id)
+    availability = await get_availability_matrix(read_session, doctor_id)
 
-    if not dates:
+    if not any(availability.values()):
         data = await state.get_data()
         spec_id = data["specialization_id"]
         doctors = await get_doctors_by_specialization(session, spec_id)
@@ -125,16 +132,20 @@ async def select_doctor(
     await state.set_state(NewRecord.dates)
     await callback.message.edit_text(
         "<b>Выберите дату приёма:</b>",
-        reply_markup=dates_keyboard(dates)
+        reply_markup=dates_keyboard(availability)
     )
 
 
 # === ВЫБОР ДАТЫ ===
 @router.callback_query(F.data.startswith(f"{DATE_CALLBACK}:"), NewRecord.dates)
+@query_budget(2)
 async def select_date(
     callback: CallbackQuery,
     state: FSMContext,
-    session: AsyncSession
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds
 ):
     await callback.answer()
 
@@ -144,14 +155,15 @@ async def select_date(
     data = await state.get_data()
     doctor_id = data["doctor_id"]
 
-    slots = await get_free_slots_for_doctor_on_date(session, doctor_id, target_date)
+    slots = await availability_cache.get_free_slots(session, doctor_id, target_date, read_session)
+    slots = await slot_holds.visible_slots(doctor_id, target_date, slots, callback.from_user.id)
 
     if not slots:
-        dates = await get_available_dates_for_doctor(session, doctor_id)
+        availability = await get_availability_matrix(read_session, doctor_id)
         await callback.message.edit_text(
             f"😔 <b>На {target_date.strftime('%d.%m.%Y')} нет свободных слотов</b>\n\n"
             "<i>Выберите другую дату</i>",
-            reply_markup=dates_keyboard(dates)
+            reply_markup=dates_keyboard(availability)
         )
         return
     await state.set_state(NewRecord.slots)
@@ -161,14 +173,17 @@ async def select_date(
     )
 
 
-# === ВЫБОР ВРЕМЕНИ И ПОДТВЕРЖДЕНИЕ ===
+# === ВЫБОР ВРЕМЕНИ ===
 @router.callback_query(F.data.startswith(f"{TIME_CALLBACK}:"), NewRecord.slots)
+@query_budget(2)
 async def select_time(
     callback: CallbackQuery,
     state: FSMContext,
-    session: AsyncSession
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds
 ):
-    await callback.answer()
     # Парсим время
     time_str = callback.data.removeprefix("time:")
     appointment_time = time.fromisoformat(time_str)
@@ -178,38 +193,160 @@ async def select_time(
     doctor_id = data["doctor_id"]
     appointment_date = date.fromisoformat(data["appointment_date"])
 
-    # Находим или создаём пользователя по telegram_id
-    telegram_id = callback.from_user.id
-    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        user = User(telegram_id=telegram_id)
-        session.add(user)
-        await session.flush()  # Получаем user.id без коммита
-
-    # Создаём запись на приём
-    new_appointment = Appointment(
-        patient_id=user.id,  # ← внутренний ID из таблицы users
-        doctor_id=doctor_id,
-        appointment_date=appointment_date,
-        appointment_time=appointment_time,
-        status=AppointmentStatus.SCHEDULED
+    await _hold_and_confirm(
+        callback, state, session, read_session, availability_cache, slot_holds,
+        doctor_id, appointment_date, appointment_time
+    )
+
+
+async def _hold_and_confirm(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds,
+    doctor_id: int,
+    appointment_date: date,
+    appointment_time: time
+):
+    """Удерживает слот за пациентом и просит подтвердить запись."""
+    if not await slot_holds.acquire(doctor_id, appointment_date, appointment_time, callback.from_user.id):
+        await callback.answer("⏳ Это время уже выбирает другой пациент", show_alert=True)
+        await _show_times(
+            callback, state, session, read_session, availability_cache, slot_holds,
+            doctor_id, appointment_date, "😔 <b>Это время уже выбирает другой пациент</b>"
+        )
+        return
+
+    await callback.answer()
+    await state.update_data(appointment_time=appointment_time.strftime("%H:%M"))
+    await state.set_state(NewRecord.confirm)
+    await callback.message.edit_text(
+        "<b>Подтвердите запись:</b>\n\n"
+        f"📅 <b>Дата:</b> {appointment_date.strftime('%d.%m.%Y')}\n"
+        f"⏰ <b>Время:</b> {appointment_time.strftime('%H:%M')}\n\n"
+        f"<i>Время закреплено за вами на {slot_holds.ttl // 60} мин.</i>",
+        reply_markup=confirm_keyboard
+    )
+
+
+async def _show_times(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds,
+    doctor_id: int,
+    target_date: date,
+    title: str
+):
+    """
+    Показывает актуальные слоты дня или, если их нет, выбор даты.
+
+    read_session — откуда читать в обход кэша; для перепроверки после
+    неудачной записи передаётся основная сессия.
+    """
+    slots = await availability_cache.get_free_slots(session, doctor_id, target_date, read_session)
+    slots = await slot_holds.visible_slots(doctor_id, target_date, slots, callback.from_user.id)
+
+    if not slots:
+        availability = await get_availability_matrix(read_session, doctor_id)
+        await state.set_state(NewRecord.dates)
+        await callback.message.edit_text(
+            f"{title}\n\n"
+            f"<i>На {target_date.strftime('%d.%m.%Y')} больше нет свободных слотов, выберите другую дату</i>",
+            reply_markup=dates_keyboard(availability)
+        )
+        return
+
+    await state.set_state(NewRecord.slots)
+    await callback.message.edit_text(
+        f"{title}\n\n"
+        f"<i>Выберите время на {target_date.strftime('%d.%m.%Y')}</i>",
+        reply_markup=times_keyboard(slots)
     )
-    session.add(new_appointment)
-    await session.commit()
 
-    # Получаем данные врача через ORM (без сырого SQL!)
-    stmt = select(Doctor).options(selectinload(Doctor.specialization_rel)).where(Doctor.id == doctor_id)
-    result = await session.execute(stmt)
-    doctor_obj = result.scalar_one_or_none()
+
+# === ПОДТВЕРЖДЕНИЕ ===
+@router.callback_query(F.data == "confirm_booking", NewRecord.confirm)
+@query_budget(4)
+async def confirm_booking(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds,
+    user: Optional[User]
+):
+    await callback.answer()
+
+    data = await state.get_data()
+    doctor_id = data["doctor_id"]
+    appointment_date = date.fromisoformat(data["appointment_date"])
+    appointment_time = time.fromisoformat(data["appointment_time"])
+
+    # Пока пациент думал, удержание могло истечь и достаться другому
+    if not await slot_holds.confirm(doctor_id, appointment_date, appointment_time, callback.from_user.id):
+        await _show_times(
+            callback, state, session, session, availability_cache, slot_holds,
+            doctor_id, appointment_date, "😔 <b>Время удержания истекло, это время уже выбирает другой пациент</b>"
+        )
+        return
+
+    try:
+        await _book_appointment(
+            callback, state, session, availability_cache, slot_holds, user,
+            doctor_id, appointment_date, appointment_time
+        )
+    finally:
+        # Удержание точно наше (проверено выше), release снимает только своё
+        await slot_holds.release(doctor_id, appointment_date, appointment_time, callback.from_user.id)
+
+
+async def _book_appointment(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds,
+    user: Optional[User],
+    doctor_id: int,
+    appointment_date: date,
+    appointment_time: time
+):
+    """Создаёт запись на приём и показывает подтверждение."""
+    # Пациент уже загружен UserMiddleware; создаём, только если его нет
+    patient_id = user.id if user is not None else await ensure_user(session, callback.from_user.id)
+
+    # Записываем: из одновременных попыток на слот выигрывает ровно одна
+    appointment_id = await book_slot(session, patient_id, doctor_id, appointment_date, appointment_time)
+
+    if appointment_id is None:
+        # Слот заняли раньше — перечитываем слоты дня из основной БД, не с реплики
+        await availability_cache.invalidate(doctor_id, appointment_date)
+        await _show_times(
+            callback, state, session, session, availability_cache, slot_holds,
+            doctor_id, appointment_date, "😔 <b>Это время только что заняли</b>"
+        )
+        return
+
+    await availability_cache.mark_busy(doctor_id, appointment_date, appointment_time)
+
+    # Данные врача и специализации — из кэша справочников
+    doctor_obj = await reference_cache.doctor(session, doctor_id)
+    specialization = (
+        await reference_cache.specialization(session, doctor_obj.specialization_id)
+        if doctor_obj else None
+    )
 
     if doctor_obj:
         name_parts = [doctor_obj.last_name, f"{doctor_obj.first_name[0]}."]
         if doctor_obj.middle_name:
             name_parts.append(f"{doctor_obj.middle_name[0]}.")
         doctor_name = " ".join(name_parts)
-        spec_name = doctor_obj.specialization_rel.name
+        spec_name = specialization.name if specialization else "—"
     else:
         doctor_name = "Неизвестный врач"
         spec_name = "—"
@@ -227,8 +364,58 @@ async def select_time(
     await state.clear()
 
 
+# === БЛИЖАЙШЕЕ СВОБОДНОЕ ВРЕМЯ ===
+@router.callback_query(F.data == "nearest", NewRecord.doctors)
+@query_budget(1)
+async def show_nearest_slots(
+    callback: CallbackQuery,
+    state: FSMContext,
+    read_session: AsyncSession,
+    slot_holds: SlotHolds
+):
+    """Ближайшие свободные слоты по всем врачам выбранной специализации ⚡"""
+    data = await state.get_data()
+    # С запасом: часть слотов может быть удержана другими пациентами
+    slots = await get_earliest_free_slots(read_session, data["specialization_id"], limit=NEAREST_SLOTS * 2)
+    slots = (await slot_holds.visible_nearest(slots, callback.from_user.id))[:NEAREST_SLOTS]
+
+    if not slots:
+        await callback.answer("😔 Нет свободного времени на ближайшие дни", show_alert=True)
+        return
+
+    await callback.answer()
+    await state.set_state(NewRecord.nearest)
+    await callback.message.edit_text(
+        "<b>⚡ Ближайшее свободное время:</b>",
+        reply_markup=nearest_slots_keyboard(slots)
+    )
+
+
+@router.callback_query(F.data.startswith(f"{NEAREST_CALLBACK}:"), NewRecord.nearest)
+@query_budget(2)
+async def select_nearest_slot(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds
+):
+    _, doctor_id, date_str, time_str = callback.data.split(":", 3)
+    doctor_id = int(doctor_id)
+    appointment_date = date.fromisoformat(date_str)
+    appointment_time = time.fromisoformat(time_str)
+    await state.update_data(doctor_id=doctor_id, appointment_date=appointment_date.isoformat())
+
+    await _hold_and_confirm(
+        callback, state, session, read_session, availability_cache, slot_holds,
+        doctor_id, appointment_date, appointment_time
+    )
+
+
 # === КНОПКИ "НАЗАД" ===
 @router.callback_query(F.data == "back_to_specializations", NewRecord.doctors)
+@query_budget(0)
 async def back_to_specializations(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     await callback.answer()
     specializations = await get_all_specializations(session)
@@ -239,15 +426,17 @@ async def back_to_specializations(callback: CallbackQuery, state: FSMContext, se
     )
 
 
-@router.callback_query(F.data == "back_to_doctors", NewRecord.dates)
-async def back_to_doctors(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
-    await callback.answer()
+@router.callback_query(F.data == "back_to_doctors", StateFilter(NewRecord.dates, NewRecord.nearest))
+@query_budget(0)
+async def back_to_doctors(callback: CallbackQuery, state: FSMContext, session: AsyncSession, profile: dict):
     data = await state.get_data()
     spec_id = data.get("specialization_id")
     if spec_id is None:
+        # Данные выбора потеряны — начинаем запись заново (callback отвечает cmd_new_record)
         await state.clear()
-        await cmd_new_record(callback.message, state, session)
+        await cmd_new_record(callback, state, session, profile)
         return
+    await callback.answer()
     doctors = await get_doctors_by_specialization(session, spec_id)
     await state.set_state(NewRecord.doctors)
     await callback.message.edit_text(
@@ -257,17 +446,46 @@ async def back_to_doctors(callback: CallbackQuery, state: FSMContext, session: A
 
 
 @router.callback_query(F.data == "back_to_dates", NewRecord.slots)
-async def back_to_dates(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
-    await callback.answer()
+@query_budget(1)
+async def back_to_dates(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    read_session: AsyncSession,
+    profile: dict
+):
     data = await state.get_data()
     doctor_id = data.get("doctor_id")
     if doctor_id is None:
         await state.clear()
-        await cmd_new_record(callback.message, state, session)
+        await cmd_new_record(callback, state, session, profile)
         return
-    dates = await get_available_dates_for_doctor(session, doctor_id)
+    await callback.answer()
+    availability = await get_availability_matrix(read_session, doctor_id)
     await state.set_state(NewRecord.dates)
     await callback.message.edit_text(
         "<b>Выберите дату приёма:</b>",
-        reply_markup=dates_keyboard(dates)
-    )
\ No newline at end of file
+        reply_markup=dates_keyboard(availability)
+    )
+
+@router.callback_query(F.data == "back_to_times", NewRecord.confirm)
+@query_budget(2)
+async def back_to_times(
+    callback: CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    read_session: AsyncSession,
+    availability_cache: AvailabilityCache,
+    slot_holds: SlotHolds
+):
+    await callback.answer()
+    data = await state.get_data()
+    doctor_id = data["doctor_id"]
+    appointment_date = date.fromisoformat(data["appointment_date"])
+    appointment_time = time.fromisoformat(data["appointment_time"])
+
+    await slot_holds.release(doctor_id, appointment_date, appointment_time, callback.from_user.id)
+    await _show_times(
+        callback, state, session, read_session, availability_cache, slot_holds,
+        doctor_id, appointment_date, "<b>Выбор времени</b>"
+    )
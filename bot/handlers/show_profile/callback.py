@@ -3,37 +3,29 @@ from datetime import date
 import traceback
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from typing import Optional
 
 from bot.database.models import User
 from bot.keyboards.edit_data import edit_data_keyboard
-from bot.database.utils.user_checker import get_profile_completion_message, check_user_profile_completion
+from bot.database.utils.user_checker import get_profile_completion_message
 
 
 router = Router()
 
 
 @router.callback_query(F.data == "my_profile")
-async def handle_my_profile(callback: CallbackQuery, session: AsyncSession):
+async def handle_my_profile(callback: CallbackQuery, user: Optional[User], profile: dict):
     """
     Обработчик для кнопки "Мой профиль".
     """
     await callback.answer()
-    # Получаем пользователя
-    result = await session.execute(
-        select(User).where(User.telegram_id == callback.from_user.id)
-    )
-    user = result.scalar_one_or_none()
+    # Пользователь и проверка профиля приходят из UserMiddleware
     
     if not user:
         await callback.answer("Пользователь не найден!", show_alert=True)
         return
     
-    # Проверяем заполнение профиля
-    check_result = check_user_profile_completion(user)
-
-    if check_result['is_complete']:
+    if profile['is_complete']:
         today = date.today()
         age = today.year - user.birth_date.year - ((today.month, today.day) < (user.birth_date.month, user.birth_date.day))
 
@@ -46,7 +38,7 @@ async def handle_my_profile(callback: CallbackQuery, session: AsyncSession):
     else:
         message_text = "<b><i>Вы ещё не заполнили свои данные</i></b>"
 
-    reply_markup = edit_data_keyboard(check_result)
+    reply_markup = edit_data_keyboard(profile)
 
     # Отправляем или обновляем сообщение
     if callback.message:
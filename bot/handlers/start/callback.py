@@ -1,5 +1,8 @@
 from aiogram import F, Router, types
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
+from bot.database.models import User
 from .utils import handle_start
 
 
@@ -7,5 +10,5 @@ router = Router()
 
 
 @router.callback_query(F.data == "start")
-async def call_start(callback: types.CallbackQuery, session: AsyncSession):
-    await handle_start(callback, session)
\ No newline at end of file
+async def call_start(callback: types.CallbackQuery, session: AsyncSession, user: Optional[User]):
+    await handle_start(callback, session, user)
\ No newline at end of file
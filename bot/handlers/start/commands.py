@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aiogram import Router, types
 from aiogram.filters import Command
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,5 +13,5 @@ router = Router()
 
 
 @router.message(Command("start"))
-async def cmd_start(message: types.Message, session: AsyncSession):
-    await handle_start(message, session)
\ No newline at end of file
+async def cmd_start(message: types.Message, session: AsyncSession, user: Optional[User]):
+    await handle_start(message, session, user)
\ No newline at end of file
@@ -1,16 +1,21 @@
-from aiogram import F, Router, types
+from typing import Optional
+
+from aiogram import types
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from bot.database.models import User
+from bot.database.utils.user_bootstrap import ensure_user
 from bot.keyboards.start import start_menu
 
 
-async def handle_start(message, session: AsyncSession):
+async def handle_start(message, session: AsyncSession, user: Optional[User] = None):
     answer_text = (
         "👋 <b>Здравствуйте!</b>\n\n"
         "<i>Запишитесь к врачу в удобное для вас время!</i>"
         )
-    
+
+    # Берём автора события до подмены: у сообщения бота from_user — сам бот
+    telegram_id = message.from_user.id
+
     if isinstance(message, types.CallbackQuery):
         await message.answer()
         message = message.message
@@ -23,15 +28,7 @@ async def handle_start(message, session: AsyncSession):
             answer_text,
             reply_markup=start_menu
         )
-        
-    telegram_id = message.from_user.id
-
-    # Проверяем, существует ли пользователь
-    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-    user = result.scalar_one_or_none()
 
+    # Создаём пользователя, если UserMiddleware его не нашёл
     if user is None:
-        # Создаём нового пользователя
-        new_user = User(telegram_id=telegram_id)
-        session.add(new_user)
-        await session.commit()
\ No newline at end of file
+        await ensure_user(session, telegram_id)
@@ -6,11 +6,13 @@ from bot.keyboards.cancel_registration import cancel_registration_button
 CURRENT_YEAR = datetime.now().year
 MIN_YEAR = 1950
 MAX_YEAR = CURRENT_YEAR - 14
+YEARS = list(range(MAX_YEAR, MIN_YEAR - 1, -1))
+YEAR_PAGE_SIZE = 6
 
 
-def get_year_keyboard(page: int = 0) -> InlineKeyboardMarkup:
-    years = list(range(MAX_YEAR, MIN_YEAR - 1, -1))
-    page_size = 6
+def _build_year_keyboard(page: int) -> InlineKeyboardMarkup:
+    years = YEARS
+    page_size = YEAR_PAGE_SIZE
 
     start = page * page_size
     end = start + page_size
@@ -41,7 +43,7 @@ def get_year_keyboard(page: int = 0) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_month_keyboard() -> InlineKeyboardMarkup:
+def _build_month_keyboard() -> InlineKeyboardMarkup:
     months = [
         "Янв", "Фев", "Мар", "Апр", "Май", "Июн",
         "Июл", "Авг", "Сен", "Окт", "Ноя", "Дек"
@@ -62,8 +64,7 @@ def get_month_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_day_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
-    days_in_month = calendar.monthrange(year, month)[1]
+def _build_day_keyboard(days_in_month: int) -> InlineKeyboardMarkup:
     buttons = []
     row = []
     for day in range(1, days_in_month + 1):
@@ -76,4 +77,27 @@ def get_day_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
     
     buttons.append(cancel_registration_button.inline_keyboard[0])
 
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# Разметки не зависят от данных — строим все страницы один раз при импорте
+_YEAR_PAGES = tuple(
+    _build_year_keyboard(page)
+    for page in range((len(YEARS) + YEAR_PAGE_SIZE - 1) // YEAR_PAGE_SIZE)
+)
+_MONTH_KEYBOARD = _build_month_keyboard()
+_DAY_KEYBOARDS = {days: _build_day_keyboard(days) for days in (28, 29, 30, 31)}
+
+
+def get_year_keyboard(page: int = 0) -> InlineKeyboardMarkup:
+    if 0 <= page < len(_YEAR_PAGES):
+        return _YEAR_PAGES[page]
+    return _build_year_keyboard(page)
+
+
+def get_month_keyboard() -> InlineKeyboardMarkup:
+    return _MONTH_KEYBOARD
+
+
+def get_day_keyboard(year: int, month: int) -> InlineKeyboardMarkup:
+    return _DAY_KEYBOARDS[calendar.monthrange(year, month)[1]]
@@ -1,88 +1,114 @@
 from datetime import date, time
-from typing import List
+from typing import Dict, List
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from .back_start import back_start_button
+from .render import date_label, memoized_markup
 from bot.database.models import Specialization, Doctor
 
 SPEC_CALLBACK = "spec"
 DOCTOR_CALLBACK = "doc"
 DATE_CALLBACK = "date"
 TIME_CALLBACK = "time"
+NEAREST_CALLBACK = "near"
+
+
+confirm_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Подтвердить запись", callback_data="confirm_booking")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_times")]
+    ]
+)
 
 
 def specializations_keyboard(specializations: List[Specialization]) -> InlineKeyboardMarkup:
-    """Клавиатура выбора специализации."""
-    builder = InlineKeyboardBuilder()
-    for spec in specializations:
-        builder.button(
-            text=spec.name,
-            callback_data=f"{SPEC_CALLBACK}:{spec.id}"
-        )
-    builder.adjust(1)
-    builder.row(back_start_button)
-    return builder.as_markup()
+    """Клавиатура выбора специализации (кэшируется по версии справочников)."""
+    def build() -> InlineKeyboardMarkup:
+        builder = InlineKeyboardBuilder()
+        for spec in specializations:
+            builder.button(
+                text=spec.name,
+                callback_data=f"{SPEC_CALLBACK}:{spec.id}"
+            )
+        builder.adjust(1)
+        builder.row(back_start_button)
+        return builder.as_markup()
+
+    return memoized_markup(("specs", tuple(spec.id for spec in specializations)), build)
 
 
 def doctors_keyboard(doctors: List[Doctor]) -> InlineKeyboardMarkup:
-    """Клавиатура выбора врача."""
-    builder = InlineKeyboardBuilder()
-    for doc in doctors:
-        name_parts = [doc.last_name, doc.first_name[0] + "."]
-        if doc.middle_name:
-            name_parts.append(doc.middle_name[0] + ".")
-        name = " ".join(name_parts)
-        builder.button(
-            text=name,
-            callback_data=f"{DOCTOR_CALLBACK}:{doc.id}"
-        )
-    builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_specializations"))
+    """Клавиатура выбора врача (кэшируется по версии справочников)."""
+    def build() -> InlineKeyboardMarkup:
+        builder = InlineKeyboardBuilder()
+        for doc in doctors:
+            name_parts = [doc.last_name, doc.first_name[0] + "."]
+            if doc.middle_name:
+                name_parts.append(doc.middle_name[0] + ".")
+            name = " ".join(name_parts)
+            builder.button(
+                text=name,
+                callback_data=f"{DOCTOR_CALLBACK}:{doc.id}"
+            )
+        builder.adjust(1)
+        builder.row(InlineKeyboardButton(text="⚡ Ближайшее свободное время", callback_data="nearest"))
+        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_specializations"))
+        return builder.as_markup()
 
-    return builder.as_markup()
+    return memoized_markup(("doctors", tuple(doc.id for doc in doctors)), build)
 
 
-def dates_keyboard(dates: List[date]) -> InlineKeyboardMarkup:
-    """Клавиатура выбора даты (следующие рабочие дни)."""
-    builder = InlineKeyboardBuilder()
-    for d in dates:
-        # Локализованный короткий формат: "5 фев", "12 мар"
-        label = (
-            d.strftime("%d %b")
-            .replace("Jan", "янв")
-            .replace("Feb", "фев")
-            .replace("Mar", "мар")
-            .replace("Apr", "апр")
-            .replace("May", "мая")
-            .replace("Jun", "июн")
-            .replace("Jul", "июл")
-            .replace("Aug", "авг")
-            .replace("Sep", "сен")
-            .replace("Oct", "окт")
-            .replace("Nov", "ноя")
-            .replace("Dec", "дек")
-        )
-        builder.button(
-            text=label,
-            callback_data=f"{DATE_CALLBACK}:{d.isoformat()}"
-        )
-    builder.adjust(2)
-    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_doctors"))
-    return builder.as_markup()
+def dates_keyboard(availability: Dict[date, int]) -> InlineKeyboardMarkup:
+    """Клавиатура выбора даты (рабочие дни со свободными слотами и их количеством)."""
+    days = tuple((d, free) for d, free in availability.items() if free > 0)
+
+    def build() -> InlineKeyboardMarkup:
+        builder = InlineKeyboardBuilder()
+        for d, free in days:
+            # Локализованный короткий формат: "05 фев · 12"
+            builder.button(
+                text=f"{date_label(d)} · {free}",
+                callback_data=f"{DATE_CALLBACK}:{d.isoformat()}"
+            )
+        builder.adjust(2)
+        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_doctors"))
+        return builder.as_markup()
+
+    return memoized_markup(("dates", days), build)
 
 
 def times_keyboard(times: List[time]) -> InlineKeyboardMarkup:
     """Клавиатура выбора времени (свободные слоты)."""
+    slots = tuple(sorted(times))
+
+    def build() -> InlineKeyboardMarkup:
+        builder = InlineKeyboardBuilder()
+        for t in slots:
+            label = t.strftime("%H:%M")
+            builder.button(
+                text=label,
+                callback_data=f"{TIME_CALLBACK}:{label}"
+            )
+        builder.adjust(3)
+        builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_dates"))
+        return builder.as_markup()
+
+    return memoized_markup(("times", slots), build)
+
+
+def nearest_slots_keyboard(slots: List[Dict]) -> InlineKeyboardMarkup:
+    """Клавиатура ближайших свободных слотов по всем врачам специализации."""
     builder = InlineKeyboardBuilder()
-    for t in sorted(times):
-        label = t.strftime("%H:%M")
-        print(label)
+    for slot in slots:
         builder.button(
-            text=label,
-            callback_data=f"{TIME_CALLBACK}:{label}"
+            text=f"{slot['date'].strftime('%d.%m')} {slot['time'].strftime('%H:%M')} · {slot['doctor_name']}",
+            callback_data=(
+                f"{NEAREST_CALLBACK}:{slot['doctor_id']}:"
+                f"{slot['date'].isoformat()}:{slot['time'].strftime('%H:%M')}"
+            )
         )
-    builder.adjust(3)
-    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_dates"))
-    return builder.as_markup()
\ No newline at end of file
+    builder.adjust(1)
+    builder.row(InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_doctors"))
+    return builder.as_markup()
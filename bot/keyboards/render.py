@@ -0,0 +1,54 @@
+# keyboards/render.py
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, Hashable, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from bot.utils.reference_cache import reference_cache
+
+MONTHS_SHORT = ("янв", "фев", "мар", "апр", "мая", "июн", "июл", "авг", "сен", "окт", "ноя", "дек")
+
+# Подписи дат "05 фев" для всех сочетаний (месяц, день) — считаются один раз при импорте
+DATE_LABELS: Dict[Tuple[int, int], str] = {
+    (month, day): f"{day:02d} {MONTHS_SHORT[month - 1]}"
+    for month in range(1, 13)
+    for day in range(1, 32)
+}
+
+MAX_CACHED_MARKUPS = 512
+
+_markups: "OrderedDict[Hashable, InlineKeyboardMarkup]" = OrderedDict()
+_markups_version = 0
+
+
+def date_label(d: date) -> str:
+    """Короткая локализованная подпись даты: "05 фев"."""
+    return DATE_LABELS[(d.month, d.day)]
+
+
+def memoized_markup(key: Hashable, build: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    """
+    Готовая разметка по ключу; строится один раз.
+
+    Кэш сбрасывается целиком при смене версии справочников, поэтому в ключе
+    достаточно id записей — названия и ФИО для одной версии неизменны.
+    При переполнении вытесняются давно не использованные разметки: частые
+    клавиатуры по свободным слотам не выбивают специализации и врачей.
+    Возвращаемую разметку нельзя изменять.
+    """
+    global _markups_version
+
+    if _markups_version != reference_cache.version:
+        _markups.clear()
+        _markups_version = reference_cache.version
+
+    markup = _markups.get(key)
+    if markup is not None:
+        _markups.move_to_end(key)
+        return markup
+
+    markup = _markups[key] = build()
+    if len(_markups) > MAX_CACHED_MARKUPS:
+        _markups.popitem(last=False)
+    return markup
@@ -2,14 +2,28 @@ import logging
 import os
 from aiohttp import web
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
-from bot.database.session import init_db
-from asyncpg import create_pool
+from bot.database.session import engine, warm_up_pool, AsyncSessionLocal
+from bot.database.replica import replica_router
+from bot.database.migrations import ensure_schema
+from bot.database.utils.duplicate_bookings import notify_cancelled_duplicates
 
 # Импорты проекта
-from .create_bot import bot, dp, ADMIN_ID
+from .create_bot import bot, dp, ADMIN_ID, redis_client, channel_logger, error_middleware, event_sink, in_flight
+from .utils.reference_cache import reference_cache
+from .utils.metrics import metrics_view, instrument_pool, instrument_redis
 from .handlers import router
+from .webhook import Drain, QueuedRequestHandler
+from .webhook.supervisor import run_supervisor
 
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+# При раскатке без простоя вебхук уже принадлежит новому экземпляру — тогда 0
+DELETE_WEBHOOK_ON_SHUTDOWN = os.getenv("DELETE_WEBHOOK_ON_SHUTDOWN", "1") == "1"
+# simple — обработка силами aiogram; queued — очередь с пулом воркеров и порядком по чатам
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "simple")
+# single — один процесс; supervisor — фронт и WEB_WORKERS процессов-воркеров; worker — запущен фронтом
+BOT_ROLE = os.getenv("BOT_ROLE", "single")
 BASE_URL = os.getenv("WEBHOOK_BASE_URL")
 HOST = os.getenv("WEBHOOK_HOST")
 PORT = int(os.getenv("WEBHOOK_PORT", 8000))
@@ -17,29 +31,96 @@ PORT = int(os.getenv("WEBHOOK_PORT", 8000))
 if not BASE_URL:
     raise ValueError("WEBHOOK_BASE_URL is required")
 
-async def on_startup() -> None:
-    # Инициализация БД
-    await init_db()
-    logging.info("✅ Database tables initialized")
+async def startup_once() -> None:
+    """Действия, которые выполняются один раз на весь бот, а не в каждом воркере."""
+    # Схема БД: на актуальной базе — один запрос, иначе недостающие миграции
+    await ensure_schema(engine)
+    logging.info("✅ Database schema is up to date")
+    # Пациенты, чьи дубли записей отменила миграция
+    await notify_cancelled_duplicates(bot, AsyncSessionLocal)
 
     await bot.set_webhook(f"{BASE_URL}{WEBHOOK_PATH}")
     await bot.send_message(chat_id=ADMIN_ID, text="✅ Бот запущен!")
 
 
-async def on_shutdown() -> None:
+async def shutdown_once() -> None:
     await bot.send_message(chat_id=ADMIN_ID, text="🛑 Бот остановлен!")
-    await bot.delete_webhook(drop_pending_updates=True)
+    if DELETE_WEBHOOK_ON_SHUTDOWN:
+        # Необработанные апдейты остаются в Telegram и достанутся следующему запуску
+        await bot.delete_webhook(drop_pending_updates=False)
+
+
+async def on_startup() -> None:
+    if BOT_ROLE == "single":
+        await startup_once()
+
+    # Соединения с БД — до первого апдейта, а не на нём
+    await warm_up_pool(engine)
+    if replica_router.enabled:
+        await warm_up_pool(replica_router.engine)
+    # Первая проверка отставания реплики — до приёма апдейтов
+    await replica_router.start()
+
+    # Сбросы кэша справочников от других воркеров
+    await reference_cache.start_listener(redis_client)
+
+
+async def on_shutdown() -> None:
+    await reference_cache.stop_listener()
+    await replica_router.stop()
+    if BOT_ROLE == "single":
+        await shutdown_once()
+    # Досылаем накопленные логи, пока сессия бота открыта
+    await channel_logger.close()
+    await error_middleware.close()
+    if event_sink is not None:
+        await event_sink.close()
+    # Апдейтов в обработке больше нет — освобождаем соединения
+    await engine.dispose()
+    if replica_router.enabled:
+        await replica_router.engine.dispose()
+    await redis_client.aclose()
+    await bot.session.close()
+
+
+async def supervisor_shutdown() -> None:
+    await shutdown_once()
+    await bot.session.close()
 
 
 def main() -> None:
+    if BOT_ROLE == "supervisor":
+        # Апдейты обрабатывают воркеры; здесь только приём и маршрутизация по чатам
+        run_supervisor(WEBHOOK_PATH, METRICS_PATH, HEALTH_PATH, HOST, PORT, startup_once, supervisor_shutdown)
+        return
+
     dp.include_router(router)
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    app = web.Application()
-    webhook_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+    drain = Drain(in_flight, WEBHOOK_PATH)
+    app = web.Application(middlewares=[drain.reject_webhook])
+    if WEBHOOK_MODE == "queued":
+        webhook_handler = QueuedRequestHandler(dispatcher=dp, bot=bot)
+        drain.queued = webhook_handler.depth
+        wait_queue = webhook_handler.drain
+    else:
+        webhook_handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+        wait_queue = None
+
+    async def drain_updates(app: web.Application) -> None:
+        await drain.drain(wait_queue=wait_queue)
+
+    # Раньше закрытия обработчика вебхука и dp.shutdown: сначала доделываем апдейты
+    app.on_shutdown.append(drain_updates)
     webhook_handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get(HEALTH_PATH, drain.health_view)
+
+    # Метрики в формате Prometheus
+    instrument_pool(engine)
+    instrument_redis(redis_client)
+    app.router.add_get(METRICS_PATH, metrics_view)
     setup_application(app, dp, bot=bot)
 
     web.run_app(app, host=HOST, port=PORT)
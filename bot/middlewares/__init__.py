@@ -1,6 +1,14 @@
+from .context import UpdateContextMiddleware, HandlerNameMiddleware
+from .inflight import InFlightMiddleware
 from .db import DbSessionMiddleware
+from .user import UserMiddleware, user_cache
 
 
 __all__ = [
-    "DbSessionMiddleware"
+    "UpdateContextMiddleware",
+    "HandlerNameMiddleware",
+    "InFlightMiddleware",
+    "DbSessionMiddleware",
+    "UserMiddleware",
+    "user_cache"
 ]
\ No newline at end of file
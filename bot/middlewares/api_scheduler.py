@@ -0,0 +1,153 @@
+# middleware/api_scheduler.py
+import asyncio
+import logging
+import os
+import time as timer
+from typing import Dict, Iterable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.utils.metrics import registry, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, ~20/мин в группу
+API_GLOBAL_RATE = float(os.getenv("API_GLOBAL_RATE", 30))
+API_CHAT_RATE = float(os.getenv("API_CHAT_RATE", 1))
+API_CHAT_BURST = int(os.getenv("API_CHAT_BURST", 3))
+API_GROUP_RATE = float(os.getenv("API_GROUP_RATE", 20 / 60))
+API_GROUP_BURST = int(os.getenv("API_GROUP_BURST", 5))
+API_RETRY_ATTEMPTS = 3
+MAX_CHAT_BUCKETS = 10_000
+
+HIGH, LOW = "high", "low"
+
+api_queue_wait = registry.register(Histogram(
+    "bot_telegram_queue_wait_seconds", "Ожидание отправки запроса к Bot API в планировщике", ("lane",)
+))
+api_retry_after_total = registry.register(Counter(
+    "bot_telegram_retry_after_total", "Ответы Telegram 429 (retry_after)", ("lane",)
+))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = timer.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже сейчас)."""
+        self._refill(now)
+        blocked = self.blocked_until - now
+        if self.tokens >= 1:
+            return max(blocked, 0.0)
+        return max(blocked, (1 - self.tokens) / self.rate)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class ApiSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API.
+
+    Запросы с chat_id проходят через token bucket'ы: общий на бота и
+    отдельный на чат (для групп и каналов — более строгий). Запросы в
+    чаты из low_priority_chats (канал логов) ждут, пока есть ожидающие
+    запросы пользователям. На 429 планировщик выжидает retry_after,
+    блокирует соответствующий bucket и повторяет запрос.
+    Запросы без chat_id (answerCallbackQuery, setWebhook, ...) не ограничиваются.
+    """
+
+    def __init__(self, low_priority_chats: Iterable = ()):
+        self.low_priority_chats = {str(chat_id) for chat_id in low_priority_chats if chat_id}
+        self._global = TokenBucket(API_GLOBAL_RATE, API_GLOBAL_RATE)
+        self._chats: Dict[str, TokenBucket] = {}
+        self._high_waiting = 0
+        self._wait_series = {lane: api_queue_wait.labels(lane) for lane in (HIGH, LOW)}
+        self._retry_series = {lane: api_retry_after_total.labels(lane) for lane in (HIGH, LOW)}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        chat_key = str(chat_id)
+        lane = LOW if chat_key in self.low_priority_chats else HIGH
+        bucket = self._chat_bucket(chat_key)
+
+        for attempt in range(API_RETRY_ATTEMPTS):
+            await self._acquire(bucket, lane)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._retry_series[lane].inc()
+                now = timer.monotonic()
+                bucket.block(now, e.retry_after)
+                if attempt == API_RETRY_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"429 от Telegram для чата {chat_key}: ждём {e.retry_after} с")
+
+    def _chat_bucket(self, chat_key: str) -> TokenBucket:
+        bucket = self._chats.get(chat_key)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune()
+            # Отрицательный id или @username — группа или канал
+            if chat_key.startswith(("-", "@")):
+                bucket = TokenBucket(API_GROUP_RATE, API_GROUP_BURST)
+            else:
+                bucket = TokenBucket(API_CHAT_RATE, API_CHAT_BURST)
+            self._chats[chat_key] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        now = timer.monotonic()
+        for chat_key in [key for key, bucket in self._chats.items() if bucket.is_idle(now)]:
+            del self._chats[chat_key]
+
+    async def _acquire(self, bucket: TokenBucket, lane: str) -> None:
+        started = timer.monotonic()
+        if lane == HIGH:
+            self._high_waiting += 1
+        try:
+            while True:
+                now = timer.monotonic()
+                wait = max(self._global.wait_time(now), bucket.wait_time(now))
+                if lane == LOW and self._high_waiting:
+                    # Уступаем запросам пользователям
+                    wait = max(wait, 1 / self._global.rate)
+                if wait <= 0:
+                    self._global.take()
+                    bucket.take()
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            if lane == HIGH:
+                self._high_waiting -= 1
+        self._wait_series[lane].observe(timer.monotonic() - started)
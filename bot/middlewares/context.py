@@ -0,0 +1,82 @@
+# middleware/context.py
+import time as timer
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, Awaitable, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.database.query_stats import QueryStats, track_queries
+
+
+@dataclass
+class UpdateContext:
+    """Сведения об апдейте, которые собирают миддлвари по ходу обработки."""
+    update_id: int
+    event_type: str
+    user_id: Optional[int]
+    started: float = field(default_factory=timer.perf_counter)
+    handler: Optional[str] = None
+    # Запросы к БД за апдейт (заполняют хуки движка)
+    db: QueryStats = field(default_factory=QueryStats)
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (timer.perf_counter() - self.started) * 1000
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """
+    Создаёт data['update_context'] для каждого апдейта.
+
+    Регистрируется первой на dp.update. Все запросы к БД за время
+    обработки апдейта учитываются в update_context.db.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        context = data['update_context'] = UpdateContext(
+            update_id=event.update_id,
+            event_type=event.event_type,
+            user_id=user.id if user else None
+        )
+        with track_queries(context.db):
+            return await handler(event, data)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """
+    Внутренняя миддлварь: записывает в контекст, какой хендлер выбран.
+
+    Вызывается уже после фильтров, поэтому знает роутер и хендлер.
+    Имя — "<роутер>.<функция>", например "new_record.select_date".
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        context: Optional[UpdateContext] = data.get('update_context')
+        handler_object = data.get('handler')
+        if context is not None and handler_object is not None:
+            context.handler = handler_name(data.get('event_router'), handler_object.callback)
+        return await handler(event, data)
+
+
+_handler_names: Dict[Any, str] = {}
+
+
+def handler_name(router, callback) -> str:
+    """Имя хендлера; строка на пару (роутер, функция) создаётся один раз."""
+    key = (id(router), callback)
+    name = _handler_names.get(key)
+    if name is None:
+        router_name = router.name if router is not None else "?"
+        name = _handler_names[key] = f"{router_name}.{getattr(callback, '__name__', repr(callback))}"
+    return name
@@ -1,13 +1,206 @@
 # middleware/db.py
-from typing import Callable, Dict, Any, Awaitable
+import asyncio
+import logging
+import os
+import time as timer
+from typing import Callable, Dict, Any, Awaitable, Optional, Sequence
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import Select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.database.replica import ReplicaRouter
+
+logger = logging.getLogger(__name__)
+
+# Ожидание соединения из пула дольше этого — признак нехватки пула
+DB_CHECKOUT_WARN_MS = float(os.getenv("DB_CHECKOUT_WARN_MS", 100))
+
+
+class LazySession:
+    """
+    Сессия, которая берёт соединение из пула только при первом запросе.
+
+    Повторяет используемую в проекте часть интерфейса AsyncSession.
+    Соединение возвращается в пул после commit/rollback и release(),
+    а не в конце апдейта. Время ожидания пула и удержания соединения
+    накапливается в checkout_ms и hold_ms.
+
+    Чтение вне начатой записи (SELECT без FOR UPDATE и get при пустой
+    сессии) отдаёт соединение сразу после запроса: результаты AsyncSession
+    уже буферизованы, а хендлер после последнего запроса обычно ещё ждёт
+    Telegram — соединение не должно простаивать в открытой транзакции.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, auto_release: bool = True):
+        self._session_pool = session_pool
+        self._session: Optional[AsyncSession] = None
+        self._checked_out_at: Optional[float] = None
+        self.auto_release = auto_release
+        # В текущей транзакции была запись (или сырое соединение) — держим до commit/rollback
+        self._writing = False
+        self.checkouts = 0
+        self.checkout_ms = 0.0
+        self.hold_ms = 0.0
+        # Закоммиченные транзакции (в том числе INSERT/UPDATE через execute)
+        self.commits = 0
+
+    @property
+    def is_used(self) -> bool:
+        return self._session is not None
+
+    def _get_session(self) -> AsyncSession:
+        # Создание AsyncSession соединения не берёт
+        if self._session is None:
+            self._session = self._session_pool()
+        return self._session
+
+    async def _checkout(self) -> AsyncSession:
+        session = self._get_session()
+        if self._checked_out_at is None:
+            started = timer.perf_counter()
+            await session.connection()
+            self._checked_out_at = timer.perf_counter()
+            self.checkouts += 1
+            self.checkout_ms += (self._checked_out_at - started) * 1000
+        return session
+
+    def _released(self) -> None:
+        if self._checked_out_at is not None:
+            self.hold_ms += (timer.perf_counter() - self._checked_out_at) * 1000
+            self._checked_out_at = None
+
+    def _track(self, statement) -> None:
+        # Чтением считается только обычный select(); union/text/DML — запись,
+        # в том числе union с INSERT в CTE (ensure_user)
+        if not isinstance(statement, Select) or statement._for_update_arg is not None:
+            self._writing = True
+
+    async def _after_read(self) -> None:
+        session = self._session
+        if (
+            self.auto_release
+            and not self._writing
+            and not (session.new or session.dirty or session.deleted)
+        ):
+            await self.release()
+
+    async def execute(self, statement, *args, **kwargs):
+        session = await self._checkout()
+        self._track(statement)
+        result = await session.execute(statement, *args, **kwargs)
+        await self._after_read()
+        return result
+
+    async def scalar(self, statement, *args, **kwargs):
+        session = await self._checkout()
+        self._track(statement)
+        result = await session.scalar(statement, *args, **kwargs)
+        await self._after_read()
+        return result
+
+    async def scalars(self, statement, *args, **kwargs):
+        session = await self._checkout()
+        self._track(statement)
+        result = await session.scalars(statement, *args, **kwargs)
+        await self._after_read()
+        return result
+
+    async def get(self, *args, **kwargs):
+        result = await (await self._checkout()).get(*args, **kwargs)
+        await self._after_read()
+        return result
+
+    async def connection(self, *args, **kwargs):
+        session = await self._checkout()
+        self._writing = True
+        return await session.connection(*args, **kwargs)
+
+    def add(self, instance) -> None:
+        self._get_session().add(instance)
+
+    async def flush(self) -> None:
+        session = await self._checkout()
+        self._writing = True
+        await session.flush()
+
+    async def commit(self) -> None:
+        if self._session is None:
+            return
+        session = self._session
+        if session.new or session.dirty or session.deleted:
+            await self._checkout()
+        if self._checked_out_at is not None:
+            self.commits += 1
+        await session.commit()
+        # После commit сессия сама отдаёт соединение в пул
+        self._writing = False
+        self._released()
+
+    async def rollback(self) -> None:
+        if self._session is None:
+            return
+        await self._session.rollback()
+        self._writing = False
+        self._released()
+
+    async def release(self) -> None:
+        """
+        Отдаёт соединение в пул, не дожидаясь конца апдейта.
+
+        Незакоммиченные изменения откатываются; загруженные объекты
+        остаются доступны для чтения. Следующий запрос возьмёт новое соединение.
+        """
+        if self._session is None:
+            return
+        await self._session.close()
+        self._writing = False
+        self._released()
+
+
+class ReadSession(LazySession):
+    """
+    Ленивая сессия на реплике для чтения.
+
+    Если соединение с репликой получить не удалось, реплика помечается
+    недоступной, а сессия переключается на основную БД — запросов к
+    реплике ещё не было, так что повторять нечего.
+    """
+
+    def __init__(self, router: ReplicaRouter, primary_pool: async_sessionmaker):
+        super().__init__(router.session_pool)
+        self._router = router
+        self._primary_pool = primary_pool
+
+    async def _checkout(self) -> AsyncSession:
+        try:
+            return await super()._checkout()
+        except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+            if self._session_pool is self._primary_pool:
+                raise
+            self._router.mark_down(e)
+            await self.release()
+            self._session = None
+            self._session_pool = self._primary_pool
+            return await super()._checkout()
+
 
 class DbSessionMiddleware(BaseMiddleware):
-    def __init__(self, session_pool: async_sessionmaker):
+    """
+    Ленивые сессии на апдейт: data['session'] — основная БД (запись и
+    перепроверки), data['read_session'] — чтение: реплика, если router
+    разрешает её этому пользователю, иначе та же основная сессия.
+    Пользователь, закоммитивший изменения, на время окна read-your-writes
+    читает с основной БД.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, replica: Optional[ReplicaRouter] = None):
         super().__init__()
         self.session_pool = session_pool
+        self.replica = replica
+        self.updates_with_db = 0
+        self.slow_checkouts = 0
 
     async def __call__(
         self,
@@ -15,6 +208,40 @@ class DbSessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data['session'] = session
-            return await handler(event, data)
\ No newline at end of file
+        session = LazySession(self.session_pool)
+        data['session'] = session
+
+        user = data.get("event_from_user")
+        read_session = session
+        if self.replica is not None and self.replica.use_replica(user.id if user else None):
+            read_session = ReadSession(self.replica, self.session_pool)
+        data['read_session'] = read_session
+
+        sessions = (session,) if read_session is session else (session, read_session)
+        try:
+            return await handler(event, data)
+        finally:
+            for used in sessions:
+                await used.release()
+            if session.commits and user is not None and self.replica is not None:
+                self.replica.mark_write(user.id)
+            if any(used.is_used for used in sessions):
+                self._report(event, sessions)
+
+    def _report(self, event: TelegramObject, sessions: Sequence[LazySession]) -> None:
+        self.updates_with_db += 1
+        checkouts = sum(session.checkouts for session in sessions)
+        checkout_ms = sum(session.checkout_ms for session in sessions)
+        hold_ms = sum(session.hold_ms for session in sessions)
+        if checkout_ms >= DB_CHECKOUT_WARN_MS:
+            self.slow_checkouts += 1
+            logger.warning(
+                f"Долгое ожидание соединения из пула: {checkout_ms:.0f} мс "
+                f"(захватов: {checkouts}, удержание: {hold_ms:.0f} мс, "
+                f"апдейт {getattr(event, 'update_id', '?')})"
+            )
+        else:
+            logger.debug(
+                f"БД: ожидание {checkout_ms:.1f} мс, удержание {hold_ms:.1f} мс, "
+                f"захватов {checkouts}"
+            )
@@ -0,0 +1,126 @@
+# middleware/edit_coalescing.py
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText, SendMessage, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message
+
+from bot.utils.metrics import registry, Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_MESSAGES = 10_000
+MAX_CACHED_MARKUPS = 1024
+
+saved_calls_total = registry.register(Counter(
+    "bot_telegram_saved_calls_total", "Запросы к Bot API, которые не пришлось отправлять", ("reason",)
+))
+
+Key = Tuple[str, int]
+
+
+class EditCoalescingMiddleware(BaseRequestMiddleware):
+    """
+    Пропускает правки сообщений, которые ничего не меняют, и склеивает частые правки.
+
+    Для каждого (чат, сообщение) помним отпечаток последнего отправленного
+    текста и клавиатуры. Правка с тем же содержимым не отправляется.
+    Пока правка сообщения в полёте, следующие ждут; из ожидающих уходит только
+    последняя (побеждает последняя — например, при двойном нажатии).
+    Ответ «message is not modified» считается успехом.
+    """
+
+    def __init__(self):
+        self._rendered: "OrderedDict[Key, Tuple[Optional[int], int]]" = OrderedDict()
+        self._locks: Dict[Key, asyncio.Lock] = {}
+        self._generations: Dict[Key, int] = {}
+        self._markups: Dict[int, Tuple[object, int]] = {}
+        self._saved = {reason: saved_calls_total.labels(reason) for reason in ("unchanged", "superseded", "not_modified")}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        if isinstance(method, SendMessage):
+            result = await make_request(bot, method)
+            if isinstance(result, Message):
+                self._remember((str(method.chat_id), result.message_id), self._text_digest(method), self._markup_digest(method.reply_markup))
+            return result
+
+        if not isinstance(method, (EditMessageText, EditMessageReplyMarkup)) or method.chat_id is None or method.message_id is None:
+            return await make_request(bot, method)
+
+        key = (str(method.chat_id), method.message_id)
+        generation = self._generations[key] = self._generations.get(key, 0) + 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                if self._generations[key] != generation:
+                    # Пока ждали, пришла более свежая правка этого сообщения
+                    self._saved["superseded"].inc()
+                    return True
+                return await self._edit(make_request, bot, method, key)
+        finally:
+            if self._generations.get(key) == generation and not lock.locked():
+                del self._generations[key]
+                self._locks.pop(key, None)
+
+    async def _edit(self, make_request, bot: Bot, method, key: Key):
+        markup_digest = self._markup_digest(method.reply_markup)
+        previous = self._rendered.get(key)
+
+        if isinstance(method, EditMessageText):
+            text_digest = self._text_digest(method)
+            unchanged = previous == (text_digest, markup_digest)
+        else:
+            # Текст не меняется — сравниваем только клавиатуру
+            text_digest = previous[0] if previous else None
+            unchanged = previous is not None and previous[1] == markup_digest
+
+        if unchanged:
+            self._saved["unchanged"].inc()
+            return True
+
+        try:
+            result = await make_request(bot, method)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                self._rendered.pop(key, None)
+                raise
+            self._saved["not_modified"].inc()
+            result = True
+
+        self._remember(key, text_digest, markup_digest)
+        return result
+
+    def _remember(self, key: Key, text_digest: Optional[int], markup_digest: int) -> None:
+        self._rendered[key] = (text_digest, markup_digest)
+        self._rendered.move_to_end(key)
+        if len(self._rendered) > MAX_TRACKED_MESSAGES:
+            self._rendered.popitem(last=False)
+
+    @staticmethod
+    def _text_digest(method) -> int:
+        return hash(method.text)
+
+    def _markup_digest(self, markup) -> int:
+        """Отпечаток клавиатуры; для одной и той же разметки (кэшированные клавиатуры) считается один раз."""
+        if markup is None:
+            return 0
+        cached = self._markups.get(id(markup))
+        if cached is not None and cached[0] is markup:
+            return cached[1]
+        digest = hash(markup.model_dump_json(exclude_none=True))
+        if len(self._markups) >= MAX_CACHED_MARKUPS:
+            self._markups.clear()
+        # Храним саму разметку, чтобы её id не достался другому объекту
+        self._markups[id(markup)] = (markup, digest)
+        return digest
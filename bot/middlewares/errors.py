@@ -1,16 +1,95 @@
+import asyncio
+import hashlib
+import html
 import logging
-from typing import Callable, Dict, Any, Awaitable
+import os
+import time as timer
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Any, Awaitable, Optional, Tuple
 from aiogram import BaseMiddleware, Bot
-from aiogram.types import TelegramObject, Message, CallbackQuery
-from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Message, CallbackQuery, ErrorEvent
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramNetworkError
+from aiohttp import ClientError
+from asyncpg.exceptions import InterfaceError as AsyncpgInterfaceError, PostgresError
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
 import traceback
-import emoji
+
+from bot.database import query_stats
+from bot.utils.event_log import JsonLinesSink
 
 logger = logging.getLogger(__name__)
 
+# Окно, в течение которого одинаковые ошибки не порождают новых уведомлений
+ERROR_ALERT_WINDOW = int(os.getenv("ERROR_ALERT_WINDOW", 300))
+# Как часто отправлять сводку "ещё ×N" по подавленным повторам
+ERROR_SUMMARY_INTERVAL = int(os.getenv("ERROR_SUMMARY_INTERVAL", 60))
+
+MAX_MESSAGE_LENGTH = 4096
+
+# Каталог пакета bot — по нему выбираем «свой» кадр стека для отпечатка
+_BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Категории ошибок по классам исключений; проверяются по порядку
+ERROR_CLASSES: Tuple[Tuple[str, Tuple[type, ...]], ...] = (
+    ("database", (SQLAlchemyError, PostgresError, AsyncpgInterfaceError)),
+    ("redis", (RedisError,)),
+    ("permission", (TelegramForbiddenError, PermissionError)),
+    ("network", (TelegramNetworkError, ClientError, TimeoutError, ConnectionError)),
+    ("validation", (ValueError,)),
+)
+
+
+@dataclass
+class ErrorGroup:
+    """Повторы одной и той же ошибки (одинаковый отпечаток)."""
+    fingerprint: str
+    title: str
+    occurrences: Deque[float] = field(default_factory=deque)
+    last_alert: Optional[float] = None
+    suppressed: int = 0
+
+
+def fingerprint_error(error: Exception) -> Tuple[str, str]:
+    """
+    Отпечаток ошибки: класс исключения и место в коде бота, где она возникла.
+
+    Берётся самый глубокий кадр стека внутри пакета bot (если такого нет —
+    самый глубокий вообще), поэтому одна и та же поломка даёт один отпечаток
+    независимо от текста сообщения. Возвращает (короткий id, описание).
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    frame = next((f for f in reversed(frames) if f.filename.startswith(_BOT_DIR)), None)
+    if frame is None and frames:
+        frame = frames[-1]
+
+    error_class = f"{type(error).__module__}.{type(error).__qualname__}"
+    if frame is not None:
+        filename = os.path.relpath(frame.filename, os.path.dirname(_BOT_DIR)) if frame.filename.startswith(_BOT_DIR) else frame.filename
+        location = f"{filename}:{frame.lineno} в {frame.name}"
+    else:
+        location = "?"
+
+    key = f"{error_class}@{location}"
+    return hashlib.sha1(key.encode()).hexdigest()[:8], f"{type(error).__name__} — {location}"
+
+
+def swallows_error(event: ErrorEvent) -> bool:
+    """Фильтр dp.errors: любую ошибку, кроме превышения бюджета в строгом режиме, обработка завершает."""
+    return not (query_stats.QUERY_BUDGET_STRICT and isinstance(event.exception, query_stats.QueryBudgetExceeded))
+
 
 class ErrorHandlingMiddleware(BaseMiddleware):
-    """Миддлварь для обработки ошибок с красивым выводом"""
+    """
+    Миддлварь для обработки ошибок с красивым выводом.
+
+    Сообщает пользователю и разработчикам и пробрасывает исключение дальше:
+    внешние миддлвари учитывают апдейт как ошибочный (журнал, метрики).
+    Завершает обработку ошибки on_error в dp.errors (фильтр swallows_error):
+    не перехватывается только QueryBudgetExceeded при QUERY_BUDGET_STRICT=1 —
+    в тестах и CI превышение бюджета должно выходить из feed_update.
+    """
     
     ERROR_MESSAGES = {
         "database": {
@@ -45,6 +124,34 @@ class ErrorHandlingMiddleware(BaseMiddleware):
         }
     }
 
+    def __init__(
+        self,
+        sink: Optional[JsonLinesSink] = None,
+        alert_window: int = ERROR_ALERT_WINDOW,
+        summary_interval: int = ERROR_SUMMARY_INTERVAL
+    ):
+        super().__init__()
+        self.sink = sink
+        self.alert_window = alert_window
+        self.summary_interval = summary_interval
+        self._groups: Dict[str, ErrorGroup] = {}
+        self._categories: Dict[type, str] = {}
+        self._bot: Optional[Bot] = None
+        self._dev_chat_id = None
+        self._summary_task: Optional[asyncio.Task] = None
+
+    async def close(self) -> None:
+        """Останавливает отправку сводок и отправляет последнюю."""
+        if self._summary_task is None:
+            return
+        self._summary_task.cancel()
+        try:
+            await self._summary_task
+        except asyncio.CancelledError:
+            pass
+        self._summary_task = None
+        await self._send_summary()
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -55,7 +162,19 @@ class ErrorHandlingMiddleware(BaseMiddleware):
             return await handler(event, data)
             
         except Exception as e:
-            return await self.handle_error(event, data, e)
+            await self.handle_error(event, data, e)
+            raise
+
+    async def on_error(self, event: ErrorEvent, **data: Any) -> bool:
+        """
+        Обработчик dp.errors: исключение уже прошло все миддлвари апдейта.
+
+        Ошибки вне хендлеров (в миддлварях) здесь же сообщаются пользователю
+        и разработчикам.
+        """
+        if not getattr(event.exception, "_bot_reported", False):
+            await self.handle_error(event.update.event, data, event.exception)
+        return True
 
     async def handle_error(
         self, 
@@ -68,44 +187,95 @@ class ErrorHandlingMiddleware(BaseMiddleware):
         # Определяем тип ошибки
         error_type = self._classify_error(error)
         error_info = self.ERROR_MESSAGES.get(error_type, self.ERROR_MESSAGES["default"])
+
+        # Повтор уже известной ошибки не порождает нового уведомления
+        group, is_new = self._record(error)
+        # Пробрасываемое дальше исключение не сообщается повторно в on_error
+        error._bot_reported = True
         
         # Логируем ошибку
-        self._log_error(error, error_type)
+        self._log_error(error, error_type, group, is_new)
+        if self.sink is not None:
+            self._write_event(data, error, error_type, group)
         
         # Отправляем красивое сообщение пользователю
         await self._send_error_message(event, error_info, error)
         
         # Отправляем детали разработчикам
-        await self._notify_developers(event, data, error, error_type)
-        
-        return None
+        if is_new:
+            await self._notify_developers(event, data, error, error_type, group)
 
     def _classify_error(self, error: Exception) -> str:
-        """Классификация ошибки"""
-        error_str = str(error).lower()
-        
-        if any(word in error_str for word in ['database', 'postgresql', 'psycopg', 'sql']):
-            return "database"
-        elif any(word in error_str for word in ['redis', 'cache', 'connection']):
-            return "redis"
-        elif any(word in error_str for word in ['network', 'timeout', 'connection']):
-            return "network"
-        elif any(word in error_str for word in ['validation', 'invalid', 'format']):
-            return "validation"
-        elif any(word in error_str for word in ['permission', 'access', 'denied']):
-            return "permission"
-        else:
-            return "default"
-
-    def _log_error(self, error: Exception, error_type: str):
-        """Логирование ошибки"""
+        """Классификация ошибки по классу исключения (результат кэшируется на класс)"""
+        error_class = type(error)
+        category = self._categories.get(error_class)
+        if category is None:
+            category = next(
+                (name for name, classes in ERROR_CLASSES if issubclass(error_class, classes)),
+                "default"
+            )
+            self._categories[error_class] = category
+        return category
+
+    def _record(self, error: Exception) -> Tuple[ErrorGroup, bool]:
+        """
+        Учитывает ошибку в скользящем окне.
+
+        True — по этому отпечатку в окне ещё не было уведомления и его нужно отправить.
+        """
+        fingerprint, title = fingerprint_error(error)
+        now = timer.monotonic()
+
+        group = self._groups.get(fingerprint)
+        if group is None:
+            group = self._groups[fingerprint] = ErrorGroup(fingerprint, title)
+
+        group.occurrences.append(now)
+        while group.occurrences[0] <= now - self.alert_window:
+            group.occurrences.popleft()
+
+        if group.last_alert is None or now - group.last_alert >= self.alert_window:
+            group.last_alert = now
+            return group, True
+
+        group.suppressed += 1
+        return group, False
+
+    def _log_error(self, error: Exception, error_type: str, group: ErrorGroup, is_new: bool):
+        """Логирование ошибки: полная трассировка — только для первой в окне"""
+        if not is_new:
+            logger.warning(
+                f"Повтор ошибки #{group.fingerprint} ({group.title}), "
+                f"за окно: {len(group.occurrences)}"
+            )
+            return
         logger.error(
             f"Тип ошибки: {error_type}\n"
-            f"Сообщение: {str(error)}\n"
-            f"Трассировка:\n{traceback.format_exc()}",
-            exc_info=True
+            f"Отпечаток: #{group.fingerprint} ({group.title})\n"
+            f"Сообщение: {str(error)}",
+            exc_info=error
         )
 
+    def _write_event(self, data: Dict[str, Any], error: Exception, error_type: str, group: ErrorGroup):
+        """Запись ошибки в локальный журнал событий"""
+        context = data.get("update_context")
+        user = data.get("event_from_user")
+        frames = traceback.extract_tb(error.__traceback__)
+        location = f"{frames[-1].filename}:{frames[-1].lineno}" if frames else None
+        self.sink.emit({
+            "kind": "error",
+            "update_id": context.update_id if context else None,
+            "user_id": user.id if user else None,
+            "handler": context.handler if context else None,
+            "latency_ms": round(context.elapsed_ms, 1) if context else None,
+            "outcome": "error",
+            "error": type(error).__name__,
+            "category": error_type,
+            "fingerprint": group.fingerprint,
+            "message": str(error)[:500],
+            "location": location
+        })
+
     async def _send_error_message(
         self, 
         event: TelegramObject, 
@@ -130,7 +300,11 @@ class ErrorHandlingMiddleware(BaseMiddleware):
             if isinstance(event, Message):
                 await event.answer(user_message, parse_mode="HTML")
             elif isinstance(event, CallbackQuery):
-                await event.answer(user_message, show_alert=True, parse_mode="HTML")
+                # Всплывающее окно — только простой текст до 200 символов
+                await event.answer(
+                    f"{error_info['title']}\n\n{error_info['message']}",
+                    show_alert=True
+                )
         except TelegramAPIError as e:
             logger.error(f"Ошибка отправки сообщения пользователю: {e}")
 
@@ -139,9 +313,10 @@ class ErrorHandlingMiddleware(BaseMiddleware):
         event: TelegramObject, 
         data: Dict[str, Any], 
         error: Exception,
-        error_type: str
+        error_type: str,
+        group: ErrorGroup
     ):
-        """Уведомление разработчиков о критической ошибке"""
+        """Уведомление разработчиков о критической ошибке (одно на отпечаток в окне)"""
         
         if not isinstance(event, (Message, CallbackQuery)):
             return
@@ -150,15 +325,24 @@ class ErrorHandlingMiddleware(BaseMiddleware):
         if not user:
             return
 
+        # Отсюда же потом уходят сводки по повторам
+        bot: Bot = data.get("bot")
+        dev_chat_id = data.get("developer_chat_id")  # ID чата разработчиков
+        if not (bot and dev_chat_id):
+            return
+        self._bot, self._dev_chat_id = bot, dev_chat_id
+        if self._summary_task is None:
+            self._summary_task = asyncio.create_task(self._run_summaries())
+
         # Получаем информацию о событии
         event_info = self._get_event_info(event)
         
         # Формируем сообщение для разработчиков
-        dev_message = (
-            f"{emoji.emojize(':red_exclamation_mark:')} <b>КРИТИЧЕСКАЯ ОШИБКА</b>\n\n"
+        header = (
+            f"❗ <b>КРИТИЧЕСКАЯ ОШИБКА</b> #{group.fingerprint}\n\n"
             f"{'=' * 40}\n\n"
             f"<b>Информация о пользователе:</b>\n"
-            f"👤 Имя: {user.full_name}\n"
+            f"👤 Имя: {html.escape(user.full_name)}\n"
             f"🆔 ID: <code>{user.id}</code>\n"
             f"{'@' + user.username if user.username else 'Нет username'}\n\n"
             f"<b>Информация о событии:</b>\n"
@@ -166,35 +350,67 @@ class ErrorHandlingMiddleware(BaseMiddleware):
             f"<b>Информация об ошибке:</b>\n"
             f"🚨 Тип: <code>{error_type}</code>\n"
             f"❌ Класс: <code>{type(error).__name__}</code>\n"
-            f"📄 Сообщение: <code>{str(error)}</code>\n"
+            f"📍 Место: <code>{html.escape(group.title)}</code>\n"
+            f"📄 Сообщение: <code>{html.escape(str(error)[:500])}</code>\n"
             f"🕐 Время: {self._get_current_time()}\n\n"
             f"<b>Трассировка:</b>\n"
-            f"<pre>{traceback.format_exc()}</pre>"
         )
+        # Хвост трассировки — столько, сколько влезает в одно сообщение
+        room = MAX_MESSAGE_LENGTH - len(header) - len("<pre></pre>") - 100
+        trace = "".join(traceback.format_exception(error))[-max(room, 0):]
+        dev_message = f"{header}<pre>{html.escape(trace)}</pre>"
+        if len(dev_message) > MAX_MESSAGE_LENGTH:
+            dev_message = header
 
-        # Отправляем в канал разработчиков
-        bot: Bot = data.get("bot")
-        dev_chat_id = data.get("developer_chat_id")  # ID чата разработчиков
-        
-        if bot and dev_chat_id:
-            try:
-                await bot.send_message(
-                    chat_id=dev_chat_id,
-                    text=dev_message,
-                    parse_mode="HTML"
+        await self._send_to_developers(dev_message)
+
+    async def _send_to_developers(self, text: str):
+        try:
+            await self._bot.send_message(
+                chat_id=self._dev_chat_id,
+                text=text,
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отправки разработчикам: {e}")
+
+    async def _run_summaries(self):
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            await self._send_summary()
+
+    async def _send_summary(self):
+        """Сводка «ещё ×N» по подавленным повторам; заодно забываем затихшие ошибки."""
+        now = timer.monotonic()
+        lines = []
+        for fingerprint, group in list(self._groups.items()):
+            if group.suppressed:
+                lines.append(
+                    f"🔁 <code>#{fingerprint}</code> {html.escape(group.title)}: "
+                    f"ещё ×{group.suppressed} (за {self.alert_window // 60} мин: {len(group.occurrences)})"
                 )
-            except Exception as e:
-                logger.error(f"Ошибка отправки разработчикам: {e}")
+                group.suppressed = 0
+            elif not group.occurrences or group.occurrences[-1] <= now - self.alert_window:
+                del self._groups[fingerprint]
+
+        if not lines or self._bot is None:
+            return
+
+        text = "<b>Повторяющиеся ошибки</b>\n\n"
+        for line in lines:
+            if len(text) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+                break
+            text += line + "\n"
+        await self._send_to_developers(text)
 
     def _get_event_info(self, event: TelegramObject) -> str:
         """Получение информации о событии"""
-        if isinstance(event, Message):
-            if event.text:
-                return f"💬 Текст: <code>{event.text}</code>"
-            elif event.text.startswith('/'):
-                return f"🤖 Команда: <code>{event.text}</code>"
+        if isinstance(event, Message) and event.text:
+            if event.text.startswith('/'):
+                return f"🤖 Команда: <code>{html.escape(event.text)}</code>"
+            return f"💬 Текст: <code>{html.escape(event.text[:500])}</code>"
         elif isinstance(event, CallbackQuery):
-            return f"🔄 Callback: <code>{event.data}</code>"
+            return f"🔄 Callback: <code>{html.escape(event.data or '')}</code>"
         return "Неизвестное событие"
 
     def _get_current_time(self) -> str:
@@ -0,0 +1,47 @@
+# middleware/inflight.py
+import asyncio
+from typing import Callable, Dict, Any, Awaitable, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.utils.metrics import registry, Gauge
+
+updates_in_flight = registry.register(Gauge(
+    "bot_updates_in_flight", "Апдейты, которые сейчас обрабатываются"
+))
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Считает апдейты в обработке; при остановке бота позволяет дождаться,
+    пока они завершатся (например, запись на приём не оборвётся посередине).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        updates_in_flight.set_function(lambda: self.count)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: Optional[float]) -> bool:
+        """Ждёт, пока не останется апдейтов в обработке. False — не дождались."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
@@ -1,35 +1,156 @@
 from aiogram import BaseMiddleware, Bot
 from aiogram.types import Update, Message, CallbackQuery
-from aiogram.exceptions import TelegramAPIError
+from aiogram.dispatcher.event.bases import UNHANDLED
+import asyncio
+import html
 import logging
+import os
+import time as timer
 import traceback
 from datetime import datetime
+from typing import List, Optional
+
+from bot.middlewares.context import UpdateContext
+from bot.utils.event_log import JsonLinesSink
 
 logger = logging.getLogger(__name__)
 
+# Лимит длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 5))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 30))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 1000))
+# Лимит текста действия до экранирования: запись с заголовком укладывается в сообщение
+MAX_ACTION_LENGTH = 3500
+
+
 class ChannelLoggerMiddleware(BaseMiddleware):
-    """Миддлварь для логирования действий в телеграм канал и ошибок"""
+    """
+    Миддлварь для логирования действий в телеграм канал и ошибок.
+
+    Записи не отправляются из хендлера: они кладутся в ограниченную очередь,
+    а фоновая задача собирает их в сводки (раз в flush_interval секунд или
+    по batch_size записей) и отправляет в канал. При переполнении очереди
+    записи отбрасываются и учитываются в dropped.
+
+    Если передан sink, каждый апдейт дополнительно пишется в локальный
+    журнал событий (хендлер, задержка, исход). Без channel_id в канал
+    ничего не отправляется — остаётся только журнал.
+
+    На 429 запрос повторяет ApiSchedulerMiddleware сессии бота; здесь
+    ошибки отправки только учитываются в failed.
+    """
     
-    def __init__(self, channel_id: str):
+    def __init__(
+        self,
+        channel_id: Optional[str],
+        sink: Optional[JsonLinesSink] = None,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        batch_size: int = LOG_BATCH_SIZE,
+        queue_size: int = LOG_QUEUE_SIZE
+    ):
         self.channel_id = channel_id
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batch: List[str] = []
+        # Сводки текущей пачки, ещё не отправленные (отправленные удаляются)
+        self._pending: List[str] = []
+        self._worker: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._dropped_reported = 0
         super().__init__()
     
     async def __call__(self, handler, event: Update, data: dict):
-        bot: Bot = data['bot']
-        
-        try:
+        if self.channel_id:
+            if self._worker is None:
+                self._bot = data['bot']
+                self._worker = asyncio.create_task(self._run())
+
             # Логируем действие пользователя
-            await self._log_action(event, bot)
-            
+            self._log_action(event)
+
+        started = timer.perf_counter()
+        outcome = "ok"
+        error_type = None
+        try:
             # Выполняем хендлер
-            return await handler(event, data)
+            result = await handler(event, data)
+            if result is UNHANDLED:
+                outcome = "unhandled"
+            return result
             
         except Exception as e:
+            outcome = "error"
+            error_type = type(e).__name__
             # Логируем ошибку
-            await self._log_error(event, bot, e)
+            if self.channel_id:
+                self._log_error(event, e)
             raise
-    
-    async def _log_action(self, event: Update, bot: Bot):
+
+        finally:
+            if self.sink is not None:
+                self._write_event(data.get('update_context'), event, started, outcome, error_type)
+
+    def _write_event(
+        self,
+        context: Optional[UpdateContext],
+        event: Update,
+        started: float,
+        outcome: str,
+        error_type: Optional[str]
+    ) -> None:
+        record = {
+            "kind": "update",
+            "update_id": event.update_id,
+            "type": context.event_type if context else event.event_type,
+            "user_id": context.user_id if context else None,
+            "handler": context.handler if context else None,
+            "latency_ms": round((timer.perf_counter() - started) * 1000, 1),
+            "outcome": outcome
+        }
+        if context is not None and context.db.queries:
+            record["queries"] = context.db.queries
+            record["rows"] = context.db.rows
+            record["db_ms"] = round(context.db.db_ms, 1)
+        if error_type:
+            record["error"] = error_type
+        self.sink.emit(record)
+
+    async def close(self) -> None:
+        """Останавливает фоновую отправку и досылает накопленные записи."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Досылаем только недоставленное: сводки прерванной пачки, которые
+        # уже ушли, из _pending удалены
+        entries, self._batch = self._batch, []
+        while not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+        if entries:
+            self._pending.extend(self._digests(entries))
+        await self._send_pending()
+
+    def _enqueue(self, text: str) -> None:
+        try:
+            self._queue.put_nowait(text)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _log_action(self, event: Update):
         try:
             # Проверяем, есть ли пользователь в апдейте
             user = None
@@ -45,52 +166,111 @@ class ChannelLoggerMiddleware(BaseMiddleware):
 
             action_text = ""
             if event.message:
-                action_text = f"💬 {event.message.text or '[без текста]'}"
+                action_text = f"💬 {html.escape(_clip(event.message.text or '[без текста]', MAX_ACTION_LENGTH))}"
             elif event.callback_query:
-                action_text = f"🔘 {event.callback_query.data}"
+                action_text = f"🔘 {html.escape(event.callback_query.data or '')}"
 
             log_message = (
-                f"👤 <b>Пользователь:</b> {user.full_name} (@{user.username or '—'})\n"
+                f"👤 <b>Пользователь:</b> {html.escape(user.full_name)} (@{user.username or '—'})\n"
                 f"🆔 <b>ID:</b> {user.id}\n"
                 f"📅 <b>Время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
                 f"📝 <b>Действие:</b> {action_text}"
             )
 
-            await bot.send_message(
-                chat_id=self.channel_id,
-                text=log_message,
-                parse_mode='HTML'
-            )
+            self._enqueue(log_message)
         except Exception as e:
             logger.error(f"Ошибка логирования действия: {e}")
     
-    async def _log_error(self, event: Update, bot: Bot, error: Exception):
+    def _log_error(self, event: Update, error: Exception):
         """Логирование ошибок с понятным сообщением"""
         try:
-            user = event.from_user
+            user = event.event.from_user
             error_type = type(error).__name__
-            error_message = str(error)
+            error_message = html.escape(str(error)[:1000])
             
             # Формируем понятное сообщение об ошибке
             log_message = (
                 f"❌ <b>Ошибка в боте</b>\n\n"
-                f"👤 <b>Пользователь:</b> {user.full_name} (@{user.username})\n"
+                f"👤 <b>Пользователь:</b> {html.escape(user.full_name)} (@{user.username})\n"
                 f"🆔 <b>ID:</b> {user.id}\n"
                 f"📅 <b>Время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n\n"
                 f"⚠️ <b>Тип ошибки:</b> {error_type}\n"
                 f"📝 <b>Сообщение:</b> {error_message}\n\n"
                 f"📍 <b>Место:</b>\n"
-                f"<code>{traceback.format_exc()[-500:]}</code>"
+                f"<code>{html.escape(traceback.format_exc()[-500:])}</code>"
             )
             
-            await bot.send_message(
-                chat_id=self.channel_id,
-                text=log_message,
-                parse_mode='HTML'
-            )
+            self._enqueue(log_message)
         except Exception as e:
             logger.error(f"Ошибка логирования ошибки: {e}")
 
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._pending.extend(self._digests(self._batch))
+            self._batch = []
+            await self._send_pending()
+
+    def _digests(self, entries: List[str]) -> List[str]:
+        """Склеивает записи в сообщения не длиннее лимита Telegram."""
+        dropped = self.dropped - self._dropped_reported
+        if dropped:
+            self._dropped_reported = self.dropped
+            entries = [f"⚠️ <b>Пропущено записей:</b> {dropped} (очередь переполнена)"] + entries
+
+        digests = []
+        current = ""
+        for entry in entries:
+            if len(entry) > MAX_MESSAGE_LENGTH:
+                # Обрезать готовый HTML нельзя — можно разрезать тег или сущность.
+                # Тексты обрезаются до экранирования, сюда запись попасть не должна
+                logger.warning(f"Запись лога длиннее {MAX_MESSAGE_LENGTH} символов пропущена")
+                self.dropped += 1
+                continue
+            if current and len(current) + 2 + len(entry) > MAX_MESSAGE_LENGTH:
+                digests.append(current)
+                current = entry
+            else:
+                current = f"{current}\n\n{entry}" if current else entry
+        if current:
+            digests.append(current)
+        return digests
+
+    async def _send_pending(self) -> None:
+        """
+        Отправляет сводки по одной. Сводка удаляется из очереди после
+        отправки (или ошибки), так что при отмене посреди пачки повторно
+        уйдёт только та, что была в полёте.
+        """
+        while self._pending:
+            try:
+                await self._bot.send_message(
+                    chat_id=self.channel_id,
+                    text=self._pending[0],
+                    parse_mode='HTML'
+                )
+                self.sent += 1
+            except Exception as e:
+                logger.error(f"Ошибка отправки лога в канал: {e}")
+                self.failed += 1
+            del self._pending[0]
+
+
+def _clip(text: str, limit: int) -> str:
+    """Обрезает сырой текст (до html.escape) с многоточием."""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
 
 # Декоратор для красивого вывода ошибок пользователю
 def error_handler(func):
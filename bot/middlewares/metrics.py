@@ -0,0 +1,112 @@
+# middleware/metrics.py
+import time as timer
+from typing import Callable, Dict, Any, Awaitable, Tuple
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from bot.utils.metrics import (
+    handler_errors_total,
+    handler_latency,
+    telegram_errors_total,
+    telegram_requests_total,
+    update_errors_total,
+    updates_total,
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Счётчики апдейтов и апдейтов с исключением по типу (message, callback_query, ...)."""
+
+    def __init__(self):
+        super().__init__()
+        self._series: Dict[str, Tuple[Any, Any]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type
+        series = self._series.get(event_type)
+        if series is None:
+            series = self._series[event_type] = (
+                updates_total.labels(event_type), update_errors_total.labels(event_type)
+            )
+        total, errors = series
+        total.inc()
+        try:
+            return await handler(event, data)
+        except Exception:
+            errors.inc()
+            raise
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренняя миддлварь: гистограмма времени работы хендлера и счётчик исключений.
+
+    Серии метрик находятся по id объекта хендлера — на каждый апдейт только
+    поиск в словаре, замер времени и сложение.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._series: Dict[int, Tuple[Any, Any]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        if handler_object is None:
+            return await handler(event, data)
+
+        series = self._series.get(id(handler_object))
+        if series is None:
+            series = self._series[id(handler_object)] = self._make_series(data.get('event_router'), handler_object)
+        latency, errors = series
+
+        started = timer.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(timer.perf_counter() - started)
+
+    @staticmethod
+    def _make_series(router, handler_object) -> Tuple[Any, Any]:
+        router_name = router.name if router is not None else "?"
+        handler_name = getattr(handler_object.callback, '__name__', repr(handler_object.callback))
+        return handler_latency.labels(router_name, handler_name), handler_errors_total.labels(router_name, handler_name)
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    """Миддлварь сессии бота: число запросов к Bot API и ошибок по методам."""
+
+    def __init__(self):
+        self._series: Dict[type, Any] = {}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        method_class = type(method)
+        series = self._series.get(method_class)
+        if series is None:
+            series = self._series[method_class] = telegram_requests_total.labels(method_class.__name__)
+        series.inc()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_errors_total.labels(method_class.__name__, type(e).__name__).inc()
+            raise
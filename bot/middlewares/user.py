@@ -0,0 +1,87 @@
+# middleware/user.py
+import os
+import time as timer
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import select
+
+from bot.database.models import User
+from bot.database.utils.user_checker import check_user_profile_completion
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_LIMIT = 50_000
+
+
+class UserCache:
+    """Недавно загруженные пациенты вместе с результатом проверки профиля."""
+
+    def __init__(self, ttl: int = USER_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[User, Dict, float]] = {}
+
+    def get(self, telegram_id: int) -> Optional[Tuple[User, Dict]]:
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+        user, profile, expires_at = entry
+        if expires_at <= timer.monotonic():
+            del self._entries[telegram_id]
+            return None
+        return user, profile
+
+    def put(self, telegram_id: int, user: User, profile: Dict) -> None:
+        if len(self._entries) >= USER_CACHE_LIMIT:
+            self._entries.clear()
+        self._entries[telegram_id] = (user, profile, timer.monotonic() + self.ttl)
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._entries.pop(telegram_id, None)
+
+
+user_cache = UserCache()
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Один раз за апдейт находит пациента и проверяет заполненность профиля.
+
+    В хендлеры попадают data['user'] (User или None) и data['profile']
+    (результат check_user_profile_completion). Повторные нажатия того же
+    пользователя в пределах TTL обходятся без запроса к БД.
+    Должна стоять после DbSessionMiddleware: использует её ленивую сессию.
+    """
+
+    def __init__(self, cache: UserCache = user_cache):
+        super().__init__()
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        user = None
+        if from_user is not None:
+            cached = self.cache.get(from_user.id)
+            if cached is not None:
+                user, profile = cached
+            else:
+                session = data['session']
+                result = await session.execute(
+                    select(User).where(User.telegram_id == from_user.id)
+                )
+                user = result.scalar_one_or_none()
+                # Хендлеру БД может не понадобиться — не держим соединение
+                await session.release()
+                profile = check_user_profile_completion(user)
+                if user is not None:
+                    self.cache.put(from_user.id, user, profile)
+        else:
+            profile = check_user_profile_completion(None)
+
+        data['user'] = user
+        data['profile'] = profile
+        return await handler(event, data)
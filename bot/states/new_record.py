@@ -5,4 +5,6 @@ class NewRecord(StatesGroup):
     specializations = State()
     doctors = State()
     dates = State()
-    slots = State()
\ No newline at end of file
+    slots = State()
+    nearest = State()
+    confirm = State()
\ No newline at end of file
@@ -0,0 +1,239 @@
+# bot/utils/availability_cache.py
+import logging
+import os
+import struct
+from datetime import date, time
+from typing import List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.utils.new_record import _is_workday, _slots_per_day, get_free_slots_for_doctor_on_date
+from bot.utils.metrics import registry, Counter
+from bot.utils.reference_cache import DoctorRecord, reference_cache
+
+logger = logging.getLogger(__name__)
+
+# Заголовок битовой карты: версия формата, эпоха, начало приёма (мин), шаг (мин), число слотов.
+# Следом идут биты слотов: 1 — занято, 0 — свободно (порядок битов как у SETBIT).
+HEADER = struct.Struct(">BIHHH")
+HEADER_BITS = HEADER.size * 8
+FORMAT_VERSION = 1
+
+EPOCH_KEY = "avail:epoch"
+CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", 6 * 3600))
+
+availability_cache_requests_total = registry.register(Counter(
+    "bot_availability_cache_requests_total", "Чтения кэша слотов по результату", ("result",)
+))
+
+# Точечное обновление бита слота без чтения карты в Python.
+# Версия дня увеличивается всегда — даже если карты нет, — чтобы
+# перестройка, начатая до этой записи или отмены, не сохранила устаревшую карту.
+# Если карты нет или время не попадает в сетку — бит не трогаем (-1).
+_MARK_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[5]))
+local header = redis.call('GETRANGE', KEYS[1], 0, tonumber(ARGV[4]) - 1)
+if string.len(header) < tonumber(ARGV[4]) then
+    return -1
+end
+local fmt, epoch, start, step, count = struct.unpack('>BI4HHH', header)
+if fmt ~= tonumber(ARGV[3]) or step == 0 then
+    return -1
+end
+local offset = tonumber(ARGV[1]) - start
+if offset < 0 or offset % step ~= 0 then
+    return -1
+end
+local index = math.floor(offset / step)
+if index >= count then
+    return -1
+end
+redis.call('SETBIT', KEYS[1], tonumber(ARGV[4]) * 8 + index, tonumber(ARGV[2]))
+return 1
+"""
+
+# Сохранение перестроенной карты, только если версия дня не изменилась с момента чтения
+_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+
+def _to_minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+def _grid(doctor: DoctorRecord, day: date) -> Tuple[int, int, int]:
+    """Сетка дня врача, как она записывается в заголовок карты: начало, шаг, число слотов."""
+    count = _slots_per_day(doctor) if _is_workday(doctor, day) else 0
+    return _to_minutes(doctor.work_start_time), max(doctor.appointment_duration_minutes, 0), count
+
+
+class AvailabilityCache:
+    """
+    Битовая карта занятости слотов врача на день в Redis.
+
+    Карта строится лениво при первом чтении, затем точечно обновляется
+    при записи и отмене. Устаревшая карта (другая версия формата или эпоха)
+    распознаётся при чтении и перестраивается из Postgres. Каждая запись,
+    отмена и сброс увеличивают версию дня; перестроенная карта сохраняется,
+    только если версия не изменилась, пока читали БД.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = CACHE_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._mark_script = redis.register_script(_MARK_SCRIPT)
+        self._store_script = redis.register_script(_STORE_SCRIPT)
+        self._requests = {
+            result: availability_cache_requests_total.labels(result) for result in ("hit", "miss", "stale")
+        }
+
+    @staticmethod
+    def _key(doctor_id: int, day: date) -> str:
+        return f"avail:{doctor_id}:{day.isoformat()}"
+
+    @staticmethod
+    def _version_key(doctor_id: int, day: date) -> str:
+        return f"avail:v:{doctor_id}:{day.isoformat()}"
+
+    async def get_free_slots(
+        self,
+        session: AsyncSession,
+        doctor_id: int,
+        day: date,
+        read_session: Optional[AsyncSession] = None
+    ) -> List[time]:
+        """
+        Свободные слоты врача на дату: из карты в Redis, при промахе — из БД.
+
+        Карта общая для всех пользователей, поэтому строится только по
+        основной БД (session); read_session (реплика) — для чтения в обход
+        кэша, когда Redis недоступен.
+        """
+        try:
+            raw_epoch, value, version = await self.redis.mget(
+                EPOCH_KEY, self._key(doctor_id, day), self._version_key(doctor_id, day)
+            )
+        except RedisError as e:
+            logger.warning(f"Кэш слотов недоступен: {e}")
+            return await get_free_slots_for_doctor_on_date(read_session or session, doctor_id, day)
+
+        # Расписание врача — из кэша справочников: по нему проверяется сетка карты
+        doctor = await reference_cache.doctor(session, doctor_id)
+        if doctor is None or not doctor.is_active:
+            return []
+
+        epoch = int(raw_epoch or 0)
+        if value is not None:
+            free_slots = self._decode(value, epoch, _grid(doctor, day))
+            if free_slots is not None:
+                self.hits += 1
+                self._requests["hit"].inc()
+                return free_slots
+            self.stale += 1
+            self._requests["stale"].inc()
+
+        self.misses += 1
+        self._requests["miss"].inc()
+        return await self._rebuild(session, doctor, day, epoch, version)
+
+    async def mark_busy(self, doctor_id: int, day: date, slot_time: time) -> None:
+        await self._mark(doctor_id, day, slot_time, 1)
+
+    async def mark_free(self, doctor_id: int, day: date, slot_time: time) -> None:
+        await self._mark(doctor_id, day, slot_time, 0)
+
+    async def invalidate(self, doctor_id: int, day: date) -> None:
+        """
+        Сбрасывает карту одного дня врача (и отменяет сохранение идущих перестроек).
+
+        Ошибка Redis не пробрасывается: кэш перестроится по TTL или при следующем конфликте.
+        """
+        version_key = self._version_key(doctor_id, day)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self._key(doctor_id, day))
+                pipe.incr(version_key)
+                pipe.expire(version_key, self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Не удалось сбросить кэш слотов: {e}")
+
+    async def invalidate_all(self) -> None:
+        """
+        Делает устаревшими все карты (например, после смены расписания врача).
+
+        Вызывается из reference_cache.invalidate_everywhere().
+        """
+        await self.redis.incr(EPOCH_KEY)
+
+    async def _mark(self, doctor_id: int, day: date, slot_time: time, bit: int) -> None:
+        try:
+            await self._mark_script(
+                keys=[self._key(doctor_id, day), self._version_key(doctor_id, day)],
+                args=[_to_minutes(slot_time), bit, FORMAT_VERSION, HEADER.size, self.ttl]
+            )
+        except RedisError as e:
+            # Карту нельзя оставлять врущей — пусть перестроится при следующем чтении
+            logger.warning(f"Не удалось обновить кэш слотов: {e}")
+            await self.invalidate(doctor_id, day)
+
+    def _decode(self, value: bytes, epoch: int, grid: Tuple[int, int, int]) -> Optional[List[time]]:
+        """Свободные слоты из карты; None — карта устарела (формат, эпоха или сетка врача)."""
+        if len(value) < HEADER.size:
+            return None
+        fmt, map_epoch, start, step, count = HEADER.unpack_from(value)
+        if fmt != FORMAT_VERSION or map_epoch != epoch:
+            return None
+        # Расписание врача изменилось после постройки карты
+        if (start, step, count) != grid:
+            return None
+
+        bits = value[HEADER.size:]
+        free_slots = []
+        for index in range(count):
+            byte = index >> 3
+            if byte < len(bits) and bits[byte] & (0x80 >> (index & 7)):
+                continue
+            minutes = start + index * step
+            free_slots.append(time(minutes // 60, minutes % 60))
+        return free_slots
+
+    async def _rebuild(
+        self,
+        session: AsyncSession,
+        doctor: DoctorRecord,
+        day: date,
+        epoch: int,
+        version: Optional[bytes]
+    ) -> List[time]:
+        doctor_id = doctor.id
+        free_slots = await get_free_slots_for_doctor_on_date(session, doctor_id, day)
+
+        start, step, count = _grid(doctor, day)
+        free_minutes = {_to_minutes(t) for t in free_slots}
+
+        bits = bytearray((count + 7) // 8)
+        for index in range(count):
+            if start + index * step not in free_minutes:
+                bits[index >> 3] |= 0x80 >> (index & 7)
+
+        value = HEADER.pack(FORMAT_VERSION, epoch, start, step, count) + bytes(bits)
+        try:
+            await self._store_script(
+                keys=[self._key(doctor_id, day), self._version_key(doctor_id, day)],
+                args=[value, (version or b"0").decode(), self.ttl]
+            )
+        except RedisError as e:
+            logger.warning(f"Не удалось сохранить кэш слотов: {e}")
+        return free_slots
@@ -0,0 +1,250 @@
+# bot/utils/event_log.py
+"""
+Локальный журнал событий в формате JSON Lines.
+
+Одна строка — одно событие (апдейт или ошибка). Файлы ротируются по размеру,
+старые части по желанию сжимаются gzip. В многопроцессном режиме у каждого
+воркера свой файл (events.jsonl.w0, events.jsonl.w1, ...); CLI читает их все
+вместе с основным, сливая события по времени. Фильтрация без загрузки файлов в память:
+    python -m bot.utils.event_log logs/events.jsonl --user 123456 --since 2026-10-01T00:00
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH")
+EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", 50 * 1024 * 1024))
+EVENT_LOG_BACKUPS = int(os.getenv("EVENT_LOG_BACKUPS", 10))
+EVENT_LOG_COMPRESS = os.getenv("EVENT_LOG_COMPRESS", "1") == "1"
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", 1))
+EVENT_LOG_BUFFER_SIZE = 500
+
+
+class JsonLinesSink:
+    """
+    Буферизованная запись событий в JSON Lines с ротацией по размеру.
+
+    emit() только кладёт строку в буфер. Запись на диск и ротация идут
+    в отдельном потоке (asyncio.to_thread) раз в flush_interval секунд
+    или при заполнении буфера — цикл событий на диске не блокируется.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = EVENT_LOG_MAX_BYTES,
+        backups: int = EVENT_LOG_BACKUPS,
+        compress: bool = EVENT_LOG_COMPRESS,
+        flush_interval: float = EVENT_LOG_FLUSH_INTERVAL,
+        buffer_size: int = EVENT_LOG_BUFFER_SIZE
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.written = 0
+        self.failed = 0
+        self._buffer: List[str] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_needed = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """Добавляет событие в буфер. Не ждёт диска."""
+        event.setdefault("ts", datetime.now(timezone.utc).isoformat(timespec="milliseconds"))
+        self._buffer.append(json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str))
+
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        if len(self._buffer) >= self.buffer_size:
+            self._flush_needed.set()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+                self.written += len(lines)
+            except OSError as e:
+                self.failed += len(lines)
+                logger.error(f"Не удалось записать журнал событий: {e}")
+
+    async def close(self) -> None:
+        """Останавливает фоновую запись и сбрасывает буфер на диск."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            await self.flush()
+
+    # --- Работа с файлами (в отдельном потоке) ---
+
+    def _write(self, lines: List[str]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _backup_name(self, index: int) -> str:
+        return f"{self.path}.{index}" + (".gz" if self.compress else "")
+
+    def _rotate(self) -> None:
+        """events.jsonl -> events.jsonl.1[.gz], .1 -> .2 и т.д.; лишние удаляются."""
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+
+        oldest = self._backup_name(self.backups)
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.backups - 1, 0, -1):
+            source = self._backup_name(index)
+            if os.path.exists(source):
+                os.replace(source, self._backup_name(index + 1))
+
+        if self.compress:
+            with open(self.path, "rb") as src, gzip.open(self._backup_name(1), "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self._backup_name(1))
+
+
+def worker_log_path(path: str, index: int) -> str:
+    """Журнал воркера index многопроцессного режима."""
+    return f"{path}.w{index}"
+
+
+def create_sink_from_env() -> Optional[JsonLinesSink]:
+    """Журнал включается заданием EVENT_LOG_PATH."""
+    if not EVENT_LOG_PATH:
+        return None
+    return JsonLinesSink(EVENT_LOG_PATH)
+
+
+# --- CLI ---
+
+def _log_files(path: str) -> List[str]:
+    """Текущий файл и его ротированные части — от старых к новым."""
+    files = []
+    index = 1
+    while True:
+        for name in (f"{path}.{index}.gz", f"{path}.{index}"):
+            if os.path.exists(name):
+                files.append(name)
+                break
+        else:
+            break
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _worker_paths(path: str) -> List[str]:
+    """Журналы воркеров рядом с основным (без ротированных частей)."""
+    pattern = re.compile(re.escape(path) + r"\.w\d+$")
+    return sorted(name for name in glob.glob(glob.escape(path) + ".w*") if pattern.match(name))
+
+
+def _read_lines(name: str) -> Iterator[str]:
+    opener = gzip.open if name.endswith(".gz") else open
+    with opener(name, "rt", encoding="utf-8") as f:
+        yield from f
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed
+
+
+def iter_events(
+    path: str,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково перебирает события журнала и журналов воркеров, подходящие под фильтр.
+
+    Каждый файл упорядочен по времени, поэтому журналы сливаются по ts без сортировки в памяти.
+    """
+    sources = [_iter_log(name) for name in [path] + _worker_paths(path)]
+    for event in heapq.merge(*sources, key=lambda event: event.get("ts", "")):
+        if user_id is not None and event.get("user_id") != user_id:
+            continue
+        if since or until:
+            ts = datetime.fromisoformat(event["ts"])
+            if since and ts < since:
+                continue
+            if until and ts >= until:
+                continue
+        yield event
+
+
+def _iter_log(path: str) -> Iterator[Dict[str, Any]]:
+    """События одного журнала с его ротированными частями, от старых к новым."""
+    for name in _log_files(path):
+        for line in _read_lines(name):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фильтр журнала событий бота")
+    parser.add_argument("path", nargs="?", default=EVENT_LOG_PATH, help="путь к журналу (по умолчанию EVENT_LOG_PATH)")
+    parser.add_argument("--user", type=int, help="telegram id пользователя")
+    parser.add_argument("--since", type=_parse_time, help="начало периода, ISO 8601")
+    parser.add_argument("--until", type=_parse_time, help="конец периода (не включая), ISO 8601")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error("не задан путь к журналу")
+
+    try:
+        for event in iter_events(args.path, args.user, args.since, args.until):
+            sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# bot/utils/fsm_storage.py
+from typing import Any, Dict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from bot.utils.metrics import fsm_transitions_total
+
+
+class InstrumentedRedisStorage(RedisStorage):
+    """RedisStorage, считающая переходы FSM по целевому состоянию."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._transitions: Dict[Any, Any] = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+
+        name = state.state if isinstance(state, State) else state
+        series = self._transitions.get(name)
+        if series is None:
+            series = self._transitions[name] = fsm_transitions_total.labels(name or "none")
+        series.inc()
@@ -0,0 +1,241 @@
+# bot/utils/metrics.py
+"""
+Минимальный реестр метрик в текстовом формате Prometheus.
+
+Серии (набор значений меток) создаются один раз через labels() и дальше
+переиспользуются: на горячем пути — только поиск в словаре и сложение,
+без создания словарей меток и строк.
+"""
+import time as timer
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """Серия для набора значений меток (создаётся при первом обращении)."""
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = self._new_series()
+        return series
+
+    @abstractmethod
+    def _new_series(self):
+        """Новая серия метрики: хранит значение для одного набора меток."""
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, series in list(self._series.items()):
+            yield from self._render_series(_format_labels(self.labelnames, values), values, series)
+
+    def _render_series(self, labels: str, values: Tuple[str, ...], series) -> Iterable[str]:
+        yield f"{self.name}{labels} {series.value}"
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+
+class Gauge(_Metric):
+    """Значение выставляется явно или считывается функцией в момент сбора."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def set_function(self, function: Callable[[], float], *values: str) -> None:
+        self._functions[values] = function
+        self.labels(*values)
+
+    def _render_series(self, labels: str, values: Tuple[str, ...], series) -> Iterable[str]:
+        function = self._functions.get(values)
+        value = series.value
+        if function is not None:
+            try:
+                value = function()
+            except Exception:
+                return
+        yield f"{self.name}{labels} {value}"
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Последняя ячейка — +Inf
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bucket_labels = tuple(f'le="{bound}"' for bound in self.buckets) + ('le="+Inf"',)
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(self.buckets)
+
+    def _render_series(self, labels: str, values: Tuple[str, ...], series: _HistogramSeries) -> Iterable[str]:
+        cumulative = 0
+        for bucket_label, count in zip(self._bucket_labels, series.counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, values, bucket_label)} {cumulative}"
+        yield f"{self.name}_sum{labels} {series.sum}"
+        yield f"{self.name}_count{labels} {series.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]) -> None:
+        """Асинхронная функция, обновляющая метрики перед сбором (например, пинг Redis)."""
+        self._collectors.append(collector)
+
+    async def collect(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception:
+                pass
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append("")
+        return "\n".join(lines)
+
+
+registry = Registry()
+
+# --- Метрики бота ---
+
+updates_total = registry.register(Counter(
+    "bot_updates_total", "Полученные апдейты по типу", ("type",)
+))
+update_errors_total = registry.register(Counter(
+    "bot_update_errors_total", "Апдейты, обработка которых завершилась исключением", ("type",)
+))
+handler_latency = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Время работы хендлера", ("router", "handler")
+))
+handler_errors_total = registry.register(Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("router", "handler")
+))
+fsm_transitions_total = registry.register(Counter(
+    "bot_fsm_transitions_total", "Переходы FSM по целевому состоянию", ("state",)
+))
+telegram_requests_total = registry.register(Counter(
+    "bot_telegram_requests_total", "Запросы к Telegram Bot API", ("method",)
+))
+telegram_errors_total = registry.register(Counter(
+    "bot_telegram_errors_total", "Ошибки запросов к Telegram Bot API", ("method", "error")
+))
+db_pool = registry.register(Gauge(
+    "bot_db_pool_connections", "Соединения пула БД", ("state",)
+))
+redis_ping_seconds = registry.register(Gauge(
+    "bot_redis_ping_seconds", "Время PING до Redis при последнем сборе"
+))
+redis_up = registry.register(Gauge(
+    "bot_redis_up", "Redis ответил на PING при последнем сборе"
+))
+
+
+def instrument_pool(engine) -> None:
+    """Гауги пула соединений SQLAlchemy: считываются при сборе, без накладных расходов."""
+    pool = engine.pool
+    db_pool.set_function(pool.size, "size")
+    db_pool.set_function(pool.checkedout, "checked_out")
+    db_pool.set_function(pool.checkedin, "checked_in")
+    db_pool.set_function(lambda: max(pool.overflow(), 0), "overflow")
+
+
+def instrument_redis(redis) -> None:
+    """Задержка Redis — PING в момент сбора метрик."""
+    ping_series = redis_ping_seconds.labels()
+    up_series = redis_up.labels()
+
+    async def ping() -> None:
+        started = timer.perf_counter()
+        try:
+            await redis.ping()
+        except Exception:
+            up_series.set(0)
+            raise
+        ping_series.set(timer.perf_counter() - started)
+        up_series.set(1)
+
+    registry.add_collector(ping)
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(
+        body=(await registry.collect()).encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
@@ -0,0 +1,283 @@
+# bot/utils/reference_cache.py
+"""
+Кэш справочников в памяти процесса.
+
+После правки врачей, расписаний или специализаций в БД сбросьте кэш во всех
+воркерах (иначе изменения появятся только через REFERENCE_CACHE_TTL секунд):
+    python -m bot.utils.reference_cache --invalidate
+Нужен REDIS_URL того же Redis, что у бота.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time as timer
+from dataclasses import dataclass
+from datetime import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import Doctor, Specialization
+from bot.database.query_stats import budget_exempt
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", 300))
+INVALIDATE_CHANNEL = "refdata:invalidate"
+
+
+@dataclass(frozen=True)
+class SpecializationRecord:
+    id: int
+    name: str
+    is_active: bool
+    sort_order: int
+
+
+@dataclass(frozen=True)
+class DoctorRecord:
+    id: int
+    last_name: str
+    first_name: str
+    middle_name: Optional[str]
+    cabinet: str
+    specialization_id: int
+    work_start_time: time
+    work_end_time: time
+    appointment_duration_minutes: int
+    mon: bool
+    tue: bool
+    wed: bool
+    thu: bool
+    fri: bool
+    sat: bool
+    is_active: bool
+
+
+class ReferenceCache:
+    """
+    Кэш справочников (специализации и врачи с расписанием) в памяти процесса.
+
+    Данные перечитываются целиком раз в ttl секунд или после invalidate().
+    Сброс рассылается остальным воркерам через Redis pub/sub.
+    Каждая перезагрузка увеличивает version — по нему можно кэшировать
+    всё, что строится из справочников (например, клавиатуры).
+    """
+
+    def __init__(self, ttl: int = REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._specializations: Dict[int, SpecializationRecord] = {}
+        self._active_specializations: Tuple[SpecializationRecord, ...] = ()
+        self._doctors: Dict[int, DoctorRecord] = {}
+        self._doctors_by_specialization: Dict[int, Tuple[DoctorRecord, ...]] = {}
+        self._redis: Optional[Redis] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._invalidate_hooks: List[Callable[[], Awaitable[None]]] = []
+
+    # --- Чтение ---
+
+    async def specializations(self, session: AsyncSession) -> Tuple[SpecializationRecord, ...]:
+        """Активные специализации в порядке sort_order."""
+        await self._ensure_loaded(session)
+        return self._active_specializations
+
+    async def specialization(self, session: AsyncSession, specialization_id: int) -> Optional[SpecializationRecord]:
+        await self._ensure_loaded(session)
+        return self._specializations.get(specialization_id)
+
+    async def doctors_by_specialization(self, session: AsyncSession, specialization_id: int) -> Tuple[DoctorRecord, ...]:
+        """Активные врачи специализации, по фамилии и имени."""
+        await self._ensure_loaded(session)
+        return self._doctors_by_specialization.get(specialization_id, ())
+
+    async def doctor(self, session: AsyncSession, doctor_id: int) -> Optional[DoctorRecord]:
+        """Врач по id (в том числе неактивный — проверяйте is_active)."""
+        await self._ensure_loaded(session)
+        return self._doctors.get(doctor_id)
+
+    # --- Сброс ---
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш только в этом процессе."""
+        self._loaded_at = None
+
+    def on_invalidate(self, hook: Callable[[], Awaitable[None]]) -> None:
+        """
+        Регистрирует сброс зависимого кэша при изменении справочников
+        (например, карт занятости, построенных по расписанию врачей).
+        """
+        self._invalidate_hooks.append(hook)
+
+    async def invalidate_everywhere(self, redis: Optional[Redis] = None) -> bool:
+        """
+        Сбрасывает кэш здесь, зависимые кэши и рассылает сброс остальным воркерам.
+
+        redis — для вызова вне бота (CLI), где подписка не запущена.
+        Возвращает False, если разослать сброс не удалось.
+        """
+        redis = redis if redis is not None else self._redis
+        self.invalidate()
+        for hook in self._invalidate_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.warning(f"Не удалось сбросить зависимый кэш: {e}")
+        if redis is None:
+            return False
+        try:
+            await redis.publish(INVALIDATE_CHANNEL, "1")
+        except RedisError as e:
+            logger.warning(f"Не удалось разослать сброс справочников: {e}")
+            return False
+        return True
+
+    async def start_listener(self, redis: Redis) -> None:
+        """Подписывается на сбросы от других воркеров."""
+        self._redis = redis
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    # --- Внутреннее ---
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and timer.monotonic() - self._loaded_at < self.ttl
+
+    async def _ensure_loaded(self, session: AsyncSession) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if not self._is_fresh():
+                # Перезагрузка справочников не входит в бюджет запросов хендлера
+                with budget_exempt():
+                    await self._load(session)
+
+    async def _load(self, session: AsyncSession) -> None:
+        specializations = (await session.execute(
+            select(Specialization).order_by(Specialization.sort_order)
+        )).scalars().all()
+        doctors = (await session.execute(
+            select(Doctor).order_by(Doctor.last_name, Doctor.first_name)
+        )).scalars().all()
+
+        self._specializations = {
+            spec.id: SpecializationRecord(
+                id=spec.id,
+                name=spec.name,
+                is_active=spec.is_active,
+                sort_order=spec.sort_order
+            )
+            for spec in specializations
+        }
+        self._active_specializations = tuple(
+            spec for spec in self._specializations.values() if spec.is_active
+        )
+
+        self._doctors = {
+            doc.id: DoctorRecord(
+                id=doc.id,
+                last_name=doc.last_name,
+                first_name=doc.first_name,
+                middle_name=doc.middle_name,
+                cabinet=doc.cabinet,
+                specialization_id=doc.specialization_id,
+                work_start_time=doc.work_start_time,
+                work_end_time=doc.work_end_time,
+                appointment_duration_minutes=doc.appointment_duration_minutes,
+                mon=doc.mon,
+                tue=doc.tue,
+                wed=doc.wed,
+                thu=doc.thu,
+                fri=doc.fri,
+                sat=doc.sat,
+                is_active=doc.is_active
+            )
+            for doc in doctors
+        }
+        by_specialization: Dict[int, list] = {}
+        for doc in self._doctors.values():
+            if doc.is_active:
+                by_specialization.setdefault(doc.specialization_id, []).append(doc)
+        self._doctors_by_specialization = {
+            spec_id: tuple(docs) for spec_id, docs in by_specialization.items()
+        }
+
+        self.version += 1
+        self._loaded_at = timer.monotonic()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.warning(f"Подписка на сброс справочников прервана: {e}")
+                # Пока подписки нет, сбросы могли потеряться
+                self.invalidate()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+# Один кэш на процесс
+reference_cache = ReferenceCache()
+
+
+# --- CLI ---
+
+async def _invalidate(redis_url: str) -> int:
+    # Импорт здесь: модуль кэша слотов сам импортирует этот
+    from bot.utils.availability_cache import AvailabilityCache
+
+    redis = Redis.from_url(redis_url)
+    try:
+        cache = ReferenceCache()
+        # Карты занятости хранятся в Redis — сбрасываем их отсюда же
+        cache.on_invalidate(AvailabilityCache(redis).invalidate_all)
+        if not await cache.invalidate_everywhere(redis):
+            return 1
+    finally:
+        await redis.aclose()
+    print("Сброс справочников разослан воркерам")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invalidate", action="store_true", help="сбросить кэш справочников во всех воркерах")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"), help="по умолчанию REDIS_URL")
+    args = parser.parse_args()
+
+    if not args.invalidate:
+        parser.print_help()
+        return
+    if not args.redis_url:
+        parser.error("не задан REDIS_URL")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    sys.exit(asyncio.run(_invalidate(args.redis_url)))
+
+
+if __name__ == "__main__":
+    main()
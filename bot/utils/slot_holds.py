@@ -0,0 +1,111 @@
+# bot/utils/slot_holds.py
+import logging
+import os
+from datetime import date, time
+from typing import Dict, List
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+SLOT_HOLD_TTL = int(os.getenv("SLOT_HOLD_TTL", 300))
+
+# Занять слот или продлить своё удержание; чужое удержание не трогаем
+_ACQUIRE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Снять удержание, только если оно наше
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SlotHolds:
+    """
+    Временные удержания слотов на время подтверждения записи.
+
+    Удержание — ключ в Redis с TTL: значение — telegram_id пациента.
+    Другим пациентам удержанный слот не показывается; по истечении TTL
+    слот освобождается сам. Удержание — подсказка для интерфейса,
+    единственность записи по-прежнему гарантирует БД.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = SLOT_HOLD_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self._acquire_script = redis.register_script(_ACQUIRE_SCRIPT)
+        self._release_script = redis.register_script(_RELEASE_SCRIPT)
+
+    @staticmethod
+    def _key(doctor_id: int, day: date, slot_time: time) -> str:
+        return f"hold:{doctor_id}:{day.isoformat()}:{slot_time.strftime('%H:%M')}"
+
+    async def acquire(self, doctor_id: int, day: date, slot_time: time, owner: int) -> bool:
+        """Удерживает слот за пациентом. False — слот уже удерживает другой."""
+        try:
+            return bool(await self._acquire_script(
+                keys=[self._key(doctor_id, day, slot_time)],
+                args=[owner, self.ttl]
+            ))
+        except RedisError as e:
+            logger.warning(f"Удержания слотов недоступны: {e}")
+            return True
+
+    async def confirm(self, doctor_id: int, day: date, slot_time: time, owner: int) -> bool:
+        """
+        Атомарная проверка перед записью: слот всё ещё за пациентом.
+
+        Своё удержание продлевается; истёкшее, если слот никто не успел
+        занять, берётся заново. False — слот удерживает другой пациент.
+        """
+        return await self.acquire(doctor_id, day, slot_time, owner)
+
+    async def release(self, doctor_id: int, day: date, slot_time: time, owner: int) -> None:
+        """Снимает удержание пациента; чужое удержание скрипт не трогает."""
+        try:
+            await self._release_script(
+                keys=[self._key(doctor_id, day, slot_time)],
+                args=[owner]
+            )
+        except RedisError as e:
+            logger.warning(f"Не удалось снять удержание слота: {e}")
+
+    async def visible_slots(self, doctor_id: int, day: date, slots: List[time], owner: int) -> List[time]:
+        """Убирает из слотов дня удержанные другими пациентами — один MGET на день."""
+        if not slots:
+            return slots
+        try:
+            holders = await self.redis.mget([self._key(doctor_id, day, t) for t in slots])
+        except RedisError as e:
+            logger.warning(f"Удержания слотов недоступны: {e}")
+            return slots
+
+        mine = str(owner).encode()
+        return [t for t, holder in zip(slots, holders) if holder is None or holder == mine]
+
+    async def visible_nearest(self, slots: List[Dict], owner: int) -> List[Dict]:
+        """То же для ближайших слотов разных врачей и дней ({"doctor_id", "date", "time"}) — один MGET."""
+        if not slots:
+            return slots
+        try:
+            holders = await self.redis.mget([
+                self._key(slot["doctor_id"], slot["date"], slot["time"]) for slot in slots
+            ])
+        except RedisError as e:
+            logger.warning(f"Удержания слотов недоступны: {e}")
+            return slots
+
+        mine = str(owner).encode()
+        return [slot for slot, holder in zip(slots, holders) if holder is None or holder == mine]
@@ -2,59 +2,12 @@
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from datetime import datetime, date, time, timedelta
 from typing import List, Optional, Dict
-from bot.database.models import Doctor, Appointment, AppointmentStatus, Specialization
-
-
-async def get_free_slots(db: AsyncSession, doctor_id: int, target_date: date) -> List[time]:
-    # 1. Получаем врача
-    result = await db.execute(
-        select(Doctor)
-        .where(Doctor.id == doctor_id, Doctor.is_active == True)
-    )
-    doctor = result.scalar_one_or_none()
-    
-    if not doctor:
-        return []
-    
-    # 2. Проверка рабочего дня
-    day_of_week = target_date.isoweekday()
-    working_days = {
-        1: doctor.monday,
-        2: doctor.tuesday,
-        3: doctor.wednesday,
-        4: doctor.thursday,
-        5: doctor.friday,
-        6: doctor.saturday,
-        7: doctor.sunday
-    }
-    
-    if not working_days.get(day_of_week, False):
-        return []
-    
-    # 3. Генерация слотов
-    all_slots = []
-    current_time = datetime.combine(target_date, doctor.work_start_time)
-    end_datetime = datetime.combine(target_date, doctor.work_end_time)
-    
-    while current_time + timedelta(minutes=doctor.appointment_duration_minutes) <= end_datetime:
-        all_slots.append(current_time.time())
-        current_time += timedelta(minutes=doctor.appointment_duration_minutes)
-    
-    # 4. Получаем занятые слоты
-    result = await db.execute(
-        select(Appointment.appointment_time)
-        .where(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == target_date,
-            Appointment.status.in_([AppointmentStatus.SCHEDULED, AppointmentStatus.COMPLETED])
-        )
-    )
-    busy_slots = [row[0] for row in result.fetchall()]
-    
-    # 5. Свободные слоты
-    return [slot for slot in all_slots if slot not in busy_slots]
+from bot.database.models import Doctor, Specialization
+from bot.database.utils.new_record import get_free_slots_for_doctor_on_date
+from bot.database.utils.slot_engine import get_free_slots
 
 
 async def get_free_slots_formatted(
@@ -77,8 +30,8 @@ async def get_free_slots_formatted(
             {'time': '09:12', 'display': '09:12 - 09:24'},
         ]
     """
-    # Получаем свободные слоты (уже async)
-    free_slots = await get_free_slots(db, doctor_id, target_date)
+    # Получаем свободные слоты (генерируются в Postgres)
+    free_slots = await get_free_slots_for_doctor_on_date(db, doctor_id, target_date)
     
     if not free_slots:
         return []
@@ -108,12 +61,15 @@ async def get_free_slots_formatted(
     return result_list
 
 
-def is_slot_available(db: AsyncSession, doctor_id: int, target_date: date, target_time: time) -> bool:
+async def is_slot_available(db: AsyncSession, doctor_id: int, target_date: date, target_time: time) -> bool:
     """
     Проверяет, доступен ли конкретный слот для записи.
     
+    Слот свободен, если он лежит на сетке приёма рабочего дня врача
+    и не занят — ровно то, что отдаёт slot_engine. Один запрос к БД.
+    
     Args:
-        db: Сессия базы данных
+        db: Асинхронная сессия базы данных
         doctor_id: ID врача
         target_date: Дата приема
         target_time: Время приема
@@ -121,34 +77,11 @@ def is_slot_available(db: AsyncSession, doctor_id: int, target_date: date, targe
     Returns:
         bool: True если слот свободен, False если занят
     """
-    existing = db.query(Appointment).filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.appointment_date == target_date,
-        Appointment.appointment_time == target_time,
-        Appointment.status.in_([AppointmentStatus.SCHEDULED, AppointmentStatus.COMPLETED])
-    ).first()
-    
-    if existing:
-        return False
-    
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-    if not doctor:
-        return False
-    
-    if target_time < doctor.work_start_time or target_time >= doctor.work_end_time:
-        return False
-    
-    start_dt = datetime.combine(target_date, doctor.work_start_time)
-    target_dt = datetime.combine(target_date, target_time)
-    
-    minutes_diff = (target_dt - start_dt).total_seconds() / 60
-    if minutes_diff % doctor.appointment_duration_minutes != 0:
-        return False
-    
-    return True
+    free_slots = await get_free_slots_for_doctor_on_date(db, doctor_id, target_date)
+    return target_time in free_slots
 
 
-def get_available_doctors_for_date(
+async def get_available_doctors_for_date(
     db: AsyncSession, 
     target_date: date, 
     specialization_id: Optional[int] = None
@@ -157,27 +90,40 @@ def get_available_doctors_for_date(
     Находит всех активных врачей с заданной специализацией (если указана),
     у которых есть свободные слоты на указанную дату.
     
+    Число запросов не зависит от количества врачей: врачи со специализациями
+    (selectinload) и свободные слоты всех врачей сразу (slot_engine).
+    
     Args:
-        db: Сессия базы данных
+        db: Асинхронная сессия базы данных
         target_date: Дата для поиска
         specialization_id: Опциональный ID специализации
     
     Returns:
         List[Dict]: Список врачей со свободными слотами
     """
-    query = db.query(Doctor).join(Specialization, Doctor.specialization_id == Specialization.id).filter(
-        Doctor.is_active == True,
-        Specialization.is_active == True
+    stmt = (
+        select(Doctor)
+        .join(Specialization, Doctor.specialization_id == Specialization.id)
+        .options(selectinload(Doctor.specialization_rel))
+        .where(
+            Doctor.is_active.is_(True),
+            Specialization.is_active.is_(True)
+        )
+        .order_by(Doctor.last_name, Doctor.first_name)
     )
     
     if specialization_id is not None:
-        query = query.filter(Doctor.specialization_id == specialization_id)
+        stmt = stmt.where(Doctor.specialization_id == specialization_id)
+    
+    doctors = (await db.execute(stmt)).scalars().all()
+    if not doctors:
+        return []
     
-    doctors = query.all()
+    free_by_doctor = await get_free_slots(db, [doctor.id for doctor in doctors], target_date, target_date)
     
     result = []
     for doctor in doctors:
-        free_slots = get_free_slots(db, doctor.id, target_date)
+        free_slots = free_by_doctor.get(doctor.id, {}).get(target_date, [])
         
         if free_slots:
             result.append({
@@ -189,4 +135,4 @@ def get_available_doctors_for_date(
                 'free_slots': [slot.strftime('%H:%M') for slot in free_slots[:10]]
             })
     
-    return result
\ No newline at end of file
+    return result
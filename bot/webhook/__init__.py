@@ -0,0 +1,8 @@
+from .drain import Drain
+from .queued import QueuedRequestHandler
+
+
+__all__ = [
+    "Drain",
+    "QueuedRequestHandler"
+]
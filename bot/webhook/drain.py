@@ -0,0 +1,76 @@
+# bot/webhook/drain.py
+"""
+Плавная остановка: перестаём принимать вебхук (503 — Telegram повторит
+доставку уже новому экземпляру), дожидаемся апдейтов в обработке и только
+потом закрываем ресурсы. Состояние видно на HEALTH_PATH — по нему
+раскатка может ждать, пока экземпляр опустеет.
+"""
+import asyncio
+import logging
+import os
+import time as timer
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from bot.middlewares.inflight import InFlightMiddleware
+from bot.utils.metrics import registry, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Укладываемся в типичные 30 с между SIGTERM и SIGKILL
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 25))
+
+draining_gauge = registry.register(Gauge(
+    "bot_draining", "1 — экземпляр останавливается и не принимает апдейты"
+))
+
+
+class Drain:
+    def __init__(self, in_flight: InFlightMiddleware, webhook_path: str):
+        self.in_flight = in_flight
+        self.webhook_path = webhook_path
+        self.draining = False
+        # Глубина очереди принятых, но ещё не начатых апдейтов (режим queued)
+        self.queued: Callable[[], int] = lambda: 0
+        draining_gauge.set_function(lambda: int(self.draining))
+
+    @web.middleware
+    async def reject_webhook(self, request: web.Request, handler) -> web.StreamResponse:
+        if self.draining and request.path == self.webhook_path:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return await handler(request)
+
+    async def health_view(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "draining" if self.draining else "ok",
+                "in_flight": self.in_flight.count,
+                "queued": self.queued(),
+            },
+            status=503 if self.draining else 200
+        )
+
+    async def drain(self, timeout: Optional[float] = DRAIN_TIMEOUT, wait_queue=None) -> bool:
+        """
+        Переводит экземпляр в режим остановки и ждёт апдейты в обработке.
+
+        wait_queue(timeout) — дождаться очереди принятых апдейтов (режим queued).
+        Возвращает False, если к сроку обработались не все.
+        """
+        self.draining = True
+        deadline = timer.monotonic() + timeout if timeout is not None else None
+        logger.info(f"Остановка: в обработке {self.in_flight.count}, в очереди {self.queued()}")
+
+        # Даём стартовать фоновым задачам aiogram для только что принятых апдейтов
+        await asyncio.sleep(0)
+        if wait_queue is not None:
+            await wait_queue(_remaining(deadline))
+        done = await self.in_flight.wait_idle(_remaining(deadline))
+        if not done:
+            logger.warning(f"Остановка: не дождались {self.in_flight.count} апдейтов")
+        return done and not self.queued()
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return max(deadline - timer.monotonic(), 0) if deadline is not None else None
@@ -0,0 +1,138 @@
+# bot/webhook/queued.py
+import asyncio
+import logging
+import os
+import time as timer
+from typing import Any, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from bot.utils.metrics import registry, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 16))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+# Сколько ждать обработки оставшихся апдейтов при остановке
+UPDATE_DRAIN_TIMEOUT = float(os.getenv("UPDATE_DRAIN_TIMEOUT", 20))
+
+update_queue_depth = registry.register(Gauge(
+    "bot_update_queue_depth", "Апдейты в очереди на обработку"
+))
+update_queue_rejected_total = registry.register(Counter(
+    "bot_update_queue_rejected_total", "Апдейты, отклонённые из-за переполнения очереди"
+))
+update_queue_wait = registry.register(Histogram(
+    "bot_update_queue_wait_seconds", "Время апдейта в очереди до начала обработки"
+))
+
+
+def chat_key(update: Update) -> int:
+    """Ключ упорядочивания: чат события, иначе пользователь, иначе сам апдейт."""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    Приём вебхука с немедленным ответом 200 и обработкой в пуле воркеров.
+
+    Апдейт проверяется и кладётся в очередь воркера, выбранного по чату,
+    поэтому апдейты одного чата обрабатываются строго по порядку, а разные
+    чаты — параллельно. Очереди ограничены: при переполнении отвечаем 503,
+    и Telegram повторит доставку позже.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = UPDATE_WORKERS,
+        queue_size: int = UPDATE_QUEUE_SIZE,
+        **data: Any
+    ):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, **data)
+        self.workers = max(workers, 1)
+        per_worker = max(queue_size // self.workers, 1)
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._tasks: List[asyncio.Task] = []
+        update_queue_depth.set_function(self.depth)
+        self._wait = update_queue_wait.labels()
+        self._rejected = update_queue_rejected_total.labels()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        super().register(app, path=path, **kwargs)
+        app.on_startup.append(self._start_workers)
+
+    async def _start_workers(self, app: web.Application) -> None:
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        try:
+            update = Update.model_validate(
+                await request.json(loads=bot.session.json_loads),
+                context={"bot": bot}
+            )
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+
+        queue = self._queues[hash(chat_key(update)) % self.workers]
+        try:
+            queue.put_nowait((bot, update, timer.perf_counter()))
+        except asyncio.QueueFull:
+            self._rejected.inc()
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.json_response({})
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            bot, update, enqueued_at = await queue.get()
+            self._wait.observe(timer.perf_counter() - enqueued_at)
+            try:
+                await self.dispatcher.feed_update(bot, update, **self.data)
+            except Exception:
+                logger.exception(f"Ошибка обработки апдейта {update.update_id}")
+            finally:
+                queue.task_done()
+
+    async def close(self) -> None:
+        """Дожидается обработки принятых апдейтов, затем закрывает сессию бота."""
+        await self.drain()
+        await super().close()
+
+    async def drain(self, timeout: Optional[float] = UPDATE_DRAIN_TIMEOUT) -> Tuple[int, int]:
+        """Ждёт опустошения очередей и останавливает воркеры. Возвращает (обработано, брошено)."""
+        pending = self.depth()
+        if self._tasks:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self._queues)),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Не дождались обработки {self.depth()} апдейтов при остановке")
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+        left = self.depth()
+        return pending - left, left
@@ -0,0 +1,332 @@
+# bot/webhook/supervisor.py
+"""
+Многопроцессный режим: фронт-диспетчер и N процессов-воркеров.
+
+Фронт принимает вебхук на общем порту и пересылает апдейт воркеру,
+выбранному по консистентному хешу chat id, — апдейты одного чата всегда
+попадают в один процесс, и его кэши остаются «тёплыми». Воркеры — обычные
+экземпляры бота (python -m bot.main) с BOT_ROLE=worker на локальных портах;
+упавший воркер перезапускается. Разовые действия (миграции схемы, set_webhook,
+сообщения админу) выполняет только фронт. /metrics и /health фронта собирают
+данные со всех воркеров; журнал событий у каждого воркера свой (EVENT_LOG_PATH.w<N>).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time as timer
+from bisect import bisect
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import ClientConnectorError, ClientError, ClientSession, ClientTimeout, web
+
+from bot.utils.event_log import worker_log_path
+
+logger = logging.getLogger(__name__)
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", 8100))
+WORKER_FORWARD_TIMEOUT = float(os.getenv("WORKER_FORWARD_TIMEOUT", 10))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", 30))
+# Опрос /metrics и /health воркеров
+WORKER_PROBE_TIMEOUT = float(os.getenv("WORKER_PROBE_TIMEOUT", 2))
+MAX_RESTART_DELAY = 30
+HASH_RING_REPLICAS = 100
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентный хеш: при смене числа узлов переезжает лишь малая часть ключей."""
+
+    def __init__(self, nodes: List[str], replicas: int = HASH_RING_REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+        self._count = len(set(nodes))
+
+    def iter_nodes(self, key: Any) -> Iterator[str]:
+        """Узлы по кругу, начиная с владельца ключа; каждый — один раз."""
+        if not self._nodes:
+            return
+        start = bisect(self._hashes, _hash(str(key))) % len(self._nodes)
+        seen = set()
+        for offset in range(len(self._nodes)):
+            node = self._nodes[(start + offset) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == self._count:
+                    return
+
+
+def raw_chat_key(payload: Dict[str, Any]) -> Any:
+    """chat id из сырого апдейта без разбора в модели aiogram."""
+    for name, event in payload.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        user = event.get("from") or event.get("user")
+        if user:
+            return user.get("id")
+    return payload.get("update_id")
+
+
+class WorkerProcess:
+    def __init__(self, name: str, port: int, index: int):
+        self.name = name
+        self.port = port
+        self.index = index
+        self.url = f"http://127.0.0.1:{port}"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        env = dict(os.environ, BOT_ROLE="worker", WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(self.port))
+        # Свой файл журнала: ротация в нескольких процессах одного файла теряет строки
+        if os.getenv("EVENT_LOG_PATH"):
+            env["EVENT_LOG_PATH"] = worker_log_path(os.environ["EVENT_LOG_PATH"], self.index)
+        self.process = await asyncio.create_subprocess_exec(sys.executable, "-m", "bot.main", env=env)
+        logger.info(f"Воркер {self.name} запущен (pid {self.process.pid}, порт {self.port})")
+
+    async def stop(self, timeout: float) -> None:
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Воркер {self.name} не остановился за {timeout} с, завершаем принудительно")
+            self.process.kill()
+            await self.process.wait()
+
+
+class Supervisor:
+    def __init__(
+        self,
+        webhook_path: str,
+        metrics_path: str,
+        health_path: str,
+        workers: int = WEB_WORKERS,
+        base_port: int = WORKER_BASE_PORT
+    ):
+        self.webhook_path = webhook_path
+        self.metrics_path = metrics_path
+        self.health_path = health_path
+        self.workers: Dict[str, WorkerProcess] = {
+            f"worker-{i}": WorkerProcess(f"worker-{i}", base_port + i, i) for i in range(max(workers, 1))
+        }
+        self.ring = HashRing(list(self.workers))
+        self._session: Optional[ClientSession] = None
+        self._monitors: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._session = ClientSession(timeout=ClientTimeout(total=WORKER_FORWARD_TIMEOUT))
+        for worker in self.workers.values():
+            await worker.start()
+            self._monitors.append(asyncio.create_task(self._monitor(worker)))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._monitors:
+            task.cancel()
+        await asyncio.gather(*self._monitors, return_exceptions=True)
+        await asyncio.gather(*(worker.stop(WORKER_STOP_TIMEOUT) for worker in self.workers.values()))
+        if self._session is not None:
+            await self._session.close()
+
+    async def _monitor(self, worker: WorkerProcess) -> None:
+        """Перезапускает упавший воркер с нарастающей паузой."""
+        delay = 1
+        while True:
+            started = timer.monotonic()
+            code = await worker.process.wait()
+            if self._stopping:
+                return
+            if timer.monotonic() - started > 60:
+                delay = 1
+            logger.error(f"Воркер {worker.name} завершился с кодом {code}, перезапуск через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+            worker.restarts += 1
+            await worker.start()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            key = raw_chat_key(json.loads(body))
+        except (ValueError, AttributeError):
+            return web.Response(body="Bad Request", status=400)
+
+        headers = {"Content-Type": "application/json"}
+        if SECRET_HEADER in request.headers:
+            headers[SECRET_HEADER] = request.headers[SECRET_HEADER]
+
+        # Владелец чата, а если он перезапускается — следующий живой узел кольца.
+        # Следующему узлу апдейт передаётся, только если соединение не установилось:
+        # после отправки воркер мог его уже обработать, и повтор в другом процессе
+        # нарушил бы порядок и дал бы двойную обработку — тогда 503, Telegram повторит сам
+        for name in self.ring.iter_nodes(key):
+            worker = self.workers[name]
+            if not worker.alive:
+                continue
+            try:
+                async with self._session.post(f"{worker.url}{self.webhook_path}", data=body, headers=headers) as response:
+                    return web.Response(
+                        status=response.status,
+                        body=await response.read(),
+                        content_type=response.content_type
+                    )
+            except ClientConnectorError as e:
+                logger.warning(f"Воркер {name} недоступен: {e}")
+            except (ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Воркер {name} не ответил на апдейт: {e!r}")
+                break
+        return web.Response(status=503, headers={"Retry-After": "1"})
+
+    async def _probe(self, worker: WorkerProcess, path: str) -> Tuple[Optional[int], Optional[str]]:
+        """GET к воркеру: (статус, тело) или (None, None), если он не ответил."""
+        if not worker.alive:
+            return None, None
+        try:
+            async with self._session.get(
+                f"{worker.url}{path}", timeout=ClientTimeout(total=WORKER_PROBE_TIMEOUT)
+            ) as response:
+                return response.status, await response.text()
+        except (ClientError, asyncio.TimeoutError):
+            return None, None
+
+    async def health_view(self, request: web.Request) -> web.Response:
+        """Состояние воркеров; 503, если ни один не готов принимать апдейты."""
+        results = await asyncio.gather(*(self._probe(w, self.health_path) for w in self.workers.values()))
+        workers = {}
+        for worker, (status, body) in zip(self.workers.values(), results):
+            try:
+                details = json.loads(body) if body else None
+            except ValueError:
+                details = None
+            workers[worker.name] = {
+                "alive": worker.alive,
+                "healthy": status == 200,
+                "restarts": worker.restarts,
+                "details": details,
+            }
+        healthy = sum(worker["healthy"] for worker in workers.values())
+        status = "ok" if healthy == len(workers) else "degraded" if healthy else "unavailable"
+        return web.json_response(
+            {"status": status, "workers": workers},
+            status=200 if healthy else 503
+        )
+
+    async def metrics_view(self, request: web.Request) -> web.Response:
+        """Метрики всех воркеров с меткой worker плюс состояние самих процессов."""
+        results = await asyncio.gather(*(self._probe(w, self.metrics_path) for w in self.workers.values()))
+        texts = {
+            worker.name: body
+            for worker, (status, body) in zip(self.workers.values(), results)
+            if status == 200 and body
+        }
+        lines = [
+            "# HELP bot_worker_up 1 — воркер ответил на запрос метрик",
+            "# TYPE bot_worker_up gauge",
+        ]
+        lines.extend(f'bot_worker_up{{worker="{name}"}} {int(name in texts)}' for name in self.workers)
+        lines.extend([
+            "# HELP bot_worker_restarts_total Перезапуски воркера фронтом",
+            "# TYPE bot_worker_restarts_total counter",
+        ])
+        lines.extend(f'bot_worker_restarts_total{{worker="{w.name}"}} {w.restarts}' for w in self.workers.values())
+        lines.append(merge_metrics(texts))
+        return web.Response(
+            body="\n".join(lines).encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+
+def _with_worker_label(sample: str, worker: str) -> str:
+    label = f'worker="{worker}"'
+    brace = sample.find("{")
+    space = sample.find(" ")
+    if brace != -1 and (space == -1 or brace < space):
+        closing = "" if sample[brace + 1] == "}" else ","
+        return f"{sample[:brace + 1]}{label}{closing}{sample[brace + 1:]}"
+    return f"{sample[:space]}{{{label}}}{sample[space:]}"
+
+
+def merge_metrics(texts: Dict[str, str]) -> str:
+    """
+    Склеивает выводы /metrics воркеров в один: к каждой серии добавляется
+    метка worker, а серии одного семейства идут подряд под общими HELP/TYPE.
+    """
+    families: Dict[str, List[str]] = {}
+    headers: Dict[str, List[str]] = {}
+    for worker, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    if family not in families:
+                        families[family] = []
+                        headers[family] = []
+                    if len(headers[family]) < 2 and line not in headers[family]:
+                        headers[family].append(line)
+                continue
+            if family is None:
+                family = line.split("{", 1)[0].split(" ", 1)[0]
+                families.setdefault(family, [])
+                headers.setdefault(family, [])
+            families[family].append(_with_worker_label(line, worker))
+
+    lines: List[str] = []
+    for family, samples in families.items():
+        lines.extend(headers[family])
+        lines.extend(samples)
+    lines.append("")
+    return "\n".join(lines)
+
+
+def run_supervisor(
+    webhook_path: str,
+    metrics_path: str,
+    health_path: str,
+    host: Optional[str],
+    port: int,
+    on_startup: Callable[[], Awaitable[None]],
+    on_shutdown: Callable[[], Awaitable[None]]
+) -> None:
+    """Запускает фронт; on_startup/on_shutdown выполняются ровно один раз — здесь."""
+    supervisor = Supervisor(webhook_path, metrics_path, health_path)
+
+    async def startup(app: web.Application) -> None:
+        await supervisor.start()
+        await on_startup()
+
+    async def shutdown(app: web.Application) -> None:
+        await on_shutdown()
+        await supervisor.stop()
+
+    app = web.Application()
+    app.router.add_post(webhook_path, supervisor.handle)
+    app.router.add_get(metrics_path, supervisor.metrics_view)
+    app.router.add_get(health_path, supervisor.health_view)
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+
+    web.run_app(app, host=host, port=port)
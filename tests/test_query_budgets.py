@@ -0,0 +1,321 @@
+"""
+Бюджеты запросов хендлеров записи: апдейты прогоняются через Dispatcher
+со всеми миддлварями против настоящих Postgres и Redis. Здесь же —
+регрессия гарантии одного победителя при одновременной записи на слот.
+
+При QUERY_BUDGET_STRICT=1 превышение query_budget поднимает
+QueryBudgetExceeded, и оно выходит из feed_update. Запросы к Bot API
+перехватывает фиктивная сессия. Без DATABASE_URL и REDIS_URL тесты пропускаются.
+
+    DATABASE_URL=postgresql+asyncpg://... REDIS_URL=redis://... python -m pytest tests
+"""
+import asyncio
+import itertools
+import os
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+if not (os.getenv("DATABASE_URL") and os.getenv("REDIS_URL")):
+    pytest.skip("нужны DATABASE_URL и REDIS_URL тестовых баз", allow_module_level=True)
+
+os.environ["QUERY_BUDGET_STRICT"] = "1"
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("ADMIN_ID", "1")
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, TelegramMethod
+from aiogram.types import Chat, Message, Update
+from sqlalchemy import delete, select, text
+from sqlalchemy.exc import ProgrammingError
+
+from bot.create_bot import dp
+from bot.database import query_stats
+from bot.database.migrations import ensure_schema
+from bot.database.models import Appointment, AppointmentStatus, Doctor, Specialization, User
+from bot.database.session import AsyncSessionLocal, engine
+from bot.database.utils.booking import book_slot
+from bot.handlers import router
+from bot.utils.reference_cache import reference_cache
+
+_update_ids = itertools.count(1)
+
+CONCURRENT_BOOKINGS = 300
+
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: запоминает запросы и отвечает успехом."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests: List[TelegramMethod] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.requests.append(method)
+        if method.__returning__ is Message:
+            return Message(
+                message_id=1,
+                date=datetime.now(),
+                chat=Chat(id=getattr(method, "chat_id", 0), type="private")
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def last_buttons(self) -> List[str]:
+        """callback_data кнопок последней отредактированной клавиатуры."""
+        for method in reversed(self.requests):
+            if isinstance(method, EditMessageText) and method.reply_markup is not None:
+                return [
+                    button.callback_data
+                    for row in method.reply_markup.inline_keyboard
+                    for button in row
+                    if button.callback_data
+                ]
+        return []
+
+
+class HandlerRecorder:
+    """Внутренняя миддлварь: какие хендлеры вызывались."""
+
+    def __init__(self):
+        self.handlers: List[str] = []
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        self.handlers.append(data["handler"].callback.__name__)
+        return await handler(event, data)
+
+
+@pytest.fixture(scope="module")
+def loop():
+    # Движок, Redis и хранилище FSM — синглтоны, привязанные к одному циклу
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def recorder():
+    recorder = HandlerRecorder()
+    if router.parent_router is None:
+        dp.include_router(router)
+    dp.callback_query.middleware(recorder)
+    return recorder
+
+
+@pytest.fixture(scope="module")
+def clinic(loop):
+    """Специализация, врач без выходных и пациент с заполненным профилем."""
+    telegram_id = random.randint(10 ** 9, 2 * 10 ** 9)
+
+    async def create():
+        await ensure_schema(engine)
+        async with AsyncSessionLocal() as session:
+            specialization = Specialization(name=f"Терапевт {telegram_id}")
+            session.add(specialization)
+            await session.flush()
+            doctor = Doctor(
+                last_name="Иванов", first_name="Иван", cabinet="101",
+                specialization_id=specialization.id,
+                mon=True, tue=True, wed=True, thu=True, fri=True, sat=True
+            )
+            patient = User(
+                telegram_id=telegram_id, first_name="Пётр", last_name="Петров",
+                birth_date=date(1990, 1, 1), phone="+79990000000"
+            )
+            session.add_all([doctor, patient])
+            await session.commit()
+            reference_cache.invalidate()
+            return {
+                "specialization_id": specialization.id,
+                "doctor_id": doctor.id,
+                "patient_id": patient.id,
+                "telegram_id": telegram_id,
+            }
+
+    async def drop(ids):
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(Appointment).where(Appointment.doctor_id == ids["doctor_id"]))
+            await session.execute(delete(Doctor).where(Doctor.id == ids["doctor_id"]))
+            await session.execute(delete(Specialization).where(Specialization.id == ids["specialization_id"]))
+            await session.execute(delete(User).where(User.id == ids["patient_id"]))
+            await session.commit()
+        reference_cache.invalidate()
+
+    ids = loop.run_until_complete(create())
+    yield ids
+    loop.run_until_complete(drop(ids))
+
+
+@pytest.fixture
+def bot():
+    return Bot("42:TEST", session=FakeSession())
+
+
+async def click(bot: Bot, telegram_id: int, data: str) -> None:
+    update = Update.model_validate({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(random.getrandbits(32)),
+            "from": {"id": telegram_id, "is_bot": False, "first_name": "Пётр"},
+            "chat_instance": "1",
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "text": "…",
+            },
+        },
+    }, context={"bot": bot})
+    await dp.feed_update(bot, update)
+
+
+def first_button(bot: Bot, prefix: str) -> str:
+    buttons = [data for data in bot.session.last_buttons() if data.startswith(f"{prefix}:")]
+    assert buttons, f"нет кнопок {prefix}: в последней клавиатуре"
+    return buttons[0]
+
+
+def test_budgets_are_strict():
+    assert query_stats.QUERY_BUDGET_STRICT
+
+
+def test_failed_statement_keeps_error_and_timing(loop):
+    async def scenario():
+        async with engine.connect() as conn:
+            with query_stats.track_queries() as stats:
+                # Ошибка драйвера выходит как есть, а не маскируется хуками учёта
+                with pytest.raises(ProgrammingError):
+                    await conn.execute(text("SELECT * FROM no_such_table"))
+                await conn.rollback()
+                assert not conn.info.get("query_started")
+
+                # Следующий запрос меряется от своего старта, а не от упавшего
+                await asyncio.sleep(1)
+                await conn.execute(text("SELECT 1"))
+            assert stats.queries == 1
+            assert stats.db_ms < 500
+
+    loop.run_until_complete(scenario())
+
+
+def test_booking_flow_within_budgets(loop, recorder, clinic, bot):
+    async def scenario():
+        recorder.handlers.clear()
+        user = clinic["telegram_id"]
+        await click(bot, user, "new_record")
+        await click(bot, user, f"spec:{clinic['specialization_id']}")
+        await click(bot, user, f"doc:{clinic['doctor_id']}")
+        await click(bot, user, first_button(bot, "date"))
+        await click(bot, user, first_button(bot, "time"))
+        await click(bot, user, "back_to_times")
+        await click(bot, user, "back_to_dates")
+        await click(bot, user, first_button(bot, "date"))
+        await click(bot, user, first_button(bot, "time"))
+        await click(bot, user, "confirm_booking")
+
+        assert recorder.handlers == [
+            "cmd_new_record", "select_specialization", "select_doctor", "select_date",
+            "select_time", "back_to_times", "back_to_dates", "select_date",
+            "select_time", "confirm_booking",
+        ]
+        async with AsyncSessionLocal() as session:
+            booked = (await session.execute(
+                select(Appointment.id).where(
+                    Appointment.patient_id == clinic["patient_id"],
+                    Appointment.status == AppointmentStatus.SCHEDULED
+                )
+            )).scalars().all()
+        assert len(booked) == 1
+
+    loop.run_until_complete(scenario())
+
+
+def test_nearest_slots_within_budgets(loop, recorder, clinic, bot):
+    async def scenario():
+        recorder.handlers.clear()
+        user = clinic["telegram_id"]
+        await click(bot, user, "new_record")
+        await click(bot, user, f"spec:{clinic['specialization_id']}")
+        await click(bot, user, "nearest")
+        await click(bot, user, "back_to_doctors")
+        await click(bot, user, "back_to_specializations")
+        await click(bot, user, f"spec:{clinic['specialization_id']}")
+        await click(bot, user, "nearest")
+        await click(bot, user, first_button(bot, "near"))
+        await click(bot, user, "confirm_booking")
+
+        assert recorder.handlers == [
+            "cmd_new_record", "select_specialization", "show_nearest_slots", "back_to_doctors",
+            "back_to_specializations", "select_specialization", "show_nearest_slots",
+            "select_nearest_slot", "confirm_booking",
+        ]
+
+    loop.run_until_complete(scenario())
+
+
+def test_my_records_within_budgets(loop, recorder, clinic, bot):
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            appointment = Appointment(
+                patient_id=clinic["patient_id"],
+                doctor_id=clinic["doctor_id"],
+                appointment_date=date.today() + timedelta(days=30),
+                appointment_time=time(9, 0)
+            )
+            session.add(appointment)
+            await session.commit()
+
+        recorder.handlers.clear()
+        user = clinic["telegram_id"]
+        await click(bot, user, "my_slots")
+        await click(bot, user, f"slot:{appointment.id}")
+        await click(bot, user, f"cancel_slot:{appointment.id}")
+
+        assert recorder.handlers == ["cmd_my_slots", "slot_details", "cancel_slot_details"]
+        async with AsyncSessionLocal() as session:
+            status = (await session.execute(
+                select(Appointment.status).where(Appointment.id == appointment.id)
+            )).scalar_one()
+        assert status is AppointmentStatus.CANCELLED
+
+    loop.run_until_complete(scenario())
+
+
+def test_concurrent_bookings_have_single_winner(loop, clinic):
+    slot_date = date.today() + timedelta(days=45)
+    slot_time = time(10, 0)
+
+    async def attempt():
+        async with AsyncSessionLocal() as session:
+            return await book_slot(session, clinic["patient_id"], clinic["doctor_id"], slot_date, slot_time)
+
+    async def scenario():
+        results = await asyncio.gather(*(attempt() for _ in range(CONCURRENT_BOOKINGS)), return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        assert not errors, f"{len(errors)} ошибок, первая: {errors[0]!r}"
+        winners = [result for result in results if result is not None]
+        assert len(winners) == 1
+
+        async with AsyncSessionLocal() as session:
+            booked = (await session.execute(
+                select(Appointment.id).where(
+                    Appointment.doctor_id == clinic["doctor_id"],
+                    Appointment.appointment_datetime == datetime.combine(slot_date, slot_time),
+                    Appointment.status != AppointmentStatus.CANCELLED
+                )
+            )).scalars().all()
+        assert booked == winners
+
+    loop.run_until_complete(scenario())
+